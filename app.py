@@ -1,130 +1,126 @@
-import streamlit as st
-from openai import OpenAI
 import json
-from io import BytesIO
+import os
+import time
+import streamlit as st
 
 # Import project modules
-from modules import utils, context_extraction, ai_summarization, transparency_report, excel_processing
-from prompts import email_prompts, linkedin_prompts, facebook_prompts, google_search_prompts, google_display_prompts
+from modules import utils, site_crawler, html_extraction, token_budget, ad_generation, openai_client, completion_cache, rate_limiter, pipeline, channels, telemetry, jobs, artifact_store, context_extraction, uploads
 
 # --- Page Configuration ---
 st.set_page_config(page_title="M Funnel Generator", layout="wide")
 
-# --- Helper function for OpenAI API calls ---
-def call_openai_for_ads(api_key: str, model_name: str, list_of_message_sets: list, channel_name: str, current_content_count: int) -> list:
-    # openai.api_key = api_key # Old way
-    client = OpenAI(api_key=api_key) # New: Initialize client
-    collected_ads = []
-    
-    # Progress bar for API calls within this specific channel generation
-    # total_calls is len(list_of_message_sets), which is 1 for Email, 3 for LI/FB, 1 for GSearch/GDisplay
-    total_calls = len(list_of_message_sets)
-    # Create a unique key for the progress bar if it's inside a loop or might be re-created
-    progress_bar_key = f"progress_bar_{channel_name}_{st.session_state.get('run_id', 0)}"
-    progress_bar_container = st.empty() # Placeholder for progress bar
-
-    for i, messages in enumerate(list_of_message_sets):
-        # Update progress message for the specific call being made
-        progress_text = f"Generating ad content for {channel_name} (API Call {i+1}/{total_calls})..."
-        if total_calls > 0:
-             progress_bar_container.progress((i) / total_calls, text=progress_text) # Show progress before the call
-        else:
-             progress_bar_container.progress(0, text=progress_text)
-
-
-        try:
-            # response = openai.ChatCompletion.create( # Old way
-            response = client.chat.completions.create( # New way
-                model=model_name,
-                messages=messages,
-                response_format={"type": "json_object"} # Requires newer models
-            )
-            content = response.choices[0].message.content.strip()
-            
-            try:
-                json_data = json.loads(content)
-                
-                if "ads" in json_data and isinstance(json_data["ads"], list):
-                    collected_ads.extend(json_data["ads"])
-                else:
-                    st.error(f"Unexpected JSON structure for {channel_name} (API Call {i+1}). Expected 'ads' list. Got: {content[:300]}...")
-                    # Add placeholder(s) if structure is wrong
-                    num_placeholders_to_add = 1 # Default to one error entry for the failed call
-                    if channel_name in ["Email", "LinkedIn", "Facebook"]:
-                        # For these, one API call was supposed to generate 'current_content_count' ads
-                        # If the structure is wrong, we add 'current_content_count' error entries
-                        # or a single one representing the batch failure.
-                        # Let's add one error entry representing the failed batch for simplicity.
-                        pass # One placeholder is fine.
-
-                    error_ad_name = f"StructError_{channel_name}_Call_{i+1}"
-                    if channel_name == "Email":
-                        collected_ads.append({"Ad Name": error_ad_name, "Funnel Stage": "Demand Capture", "Headline": "Generation Error", "Subject Line": "", "Body": "", "CTA": ""})
-                    elif channel_name == "LinkedIn":
-                        collected_ads.append({"Ad Name": error_ad_name, "Funnel Stage": "Error", "Introductory Text": "Generation Error", "Image Copy": "", "Headline": "", "Destination": "", "CTA Button": ""})
-                    elif channel_name == "Facebook":
-                        collected_ads.append({"Ad Name": error_ad_name, "Funnel Stage": "Error", "Primary Text": "Generation Error", "Image Copy": "", "Headline": "", "Link Description": "", "Destination": "", "CTA Button": ""})
-                    elif channel_name == "Google Search":
-                         collected_ads.extend([{"Headline": "StructError", "Description": "JSON Structure Error"}] * 15)
-                    elif channel_name == "Google Display":
-                         collected_ads.extend([{"Headline": "StructError", "Description": "JSON Structure Error"}] * 5)
-
-            except json.JSONDecodeError as e:
-                st.error(f"Failed to parse JSON for {channel_name} (API Call {i+1}): {e}. Response: {content[:300]}...")
-                error_ad_name = f"JSONError_{channel_name}_Call_{i+1}"
-                if channel_name == "Email": collected_ads.append({"Ad Name": error_ad_name, "Funnel Stage": "Demand Capture", "Headline": "JSON Parse Error", "Subject Line": "", "Body": "", "CTA": ""})
-                elif channel_name == "LinkedIn": collected_ads.append({"Ad Name": error_ad_name, "Funnel Stage": "Error", "Introductory Text": "JSON Parse Error", "Image Copy": "", "Headline": "", "Destination": "", "CTA Button": ""})
-                elif channel_name == "Facebook": collected_ads.append({"Ad Name": error_ad_name, "Funnel Stage": "Error", "Primary Text": "JSON Parse Error", "Image Copy": "", "Headline": "", "Link Description": "", "Destination": "", "CTA Button": ""})
-                elif channel_name == "Google Search": collected_ads.extend([{"Headline": "JSONError", "Description": "JSON Parse Error"}] * 15)
-                elif channel_name == "Google Display": collected_ads.extend([{"Headline": "JSONError", "Description": "JSON Parse Error"}] * 5)
-
-        except openai.AuthenticationError: # openai.error.AuthenticationError old
-            st.error("OpenAI API Key is invalid or not authorized. Halting ad generation for this channel.")
-            # Add a clear error marker for this channel's batch
-            collected_ads.append({"Ad Name": f"AuthError_{channel_name}", "Headline": "OpenAI Auth Failed"})
-            break # Stop further calls for this channel
-        except openai.RateLimitError: # openai.error.RateLimitError old
-            st.error(f"OpenAI API rate limit exceeded during {channel_name} generation (API Call {i+1}). Try again later.")
-            collected_ads.append({"Ad Name": f"RateLimitError_{channel_name}", "Headline": "Rate Limit Exceeded"})
-            # Optionally break or continue with placeholders for remaining calls in this channel
-        except openai.APIConnectionError as e: # New error type to consider
-            st.error(f"OpenAI API connection error for {channel_name} (API Call {i+1}): {e}")
-            collected_ads.append({"Ad Name": f"ConnectionError_{channel_name}", "Headline": "API Connection Error"})
-        except openai.APIStatusError as e: # New error type for non-200 responses
-            st.error(f"OpenAI API error for {channel_name} (API Call {i+1}): Status {e.status_code}, Response: {e.response}")
-            collected_ads.append({"Ad Name": f"APIStatusError_{channel_name}", "Headline": f"API Error {e.status_code}"})
-        except openai.BadRequestError as e: # openai.error.InvalidRequestError old, now BadRequestError
-             st.error(f"OpenAI Invalid Request for {channel_name} (API Call {i+1}): {e}. This might be due to prompt issues or model limitations.")
-             collected_ads.append({"Ad Name": f"InvalidRequest_{channel_name}", "Headline": "Invalid Request to OpenAI"})
-        except Exception as e:
-            st.error(f"An unexpected error occurred calling OpenAI for {channel_name} (API Call {i+1}): {e}")
-            collected_ads.append({"Ad Name": f"UnexpectedError_{channel_name}", "Headline": "Unexpected OpenAI Error"})
-        
-        if total_calls > 0:
-            progress_bar_container.progress((i + 1) / total_calls, text=f"{channel_name} (API Call {i+1}/{total_calls}) Complete")
-    
-    progress_bar_container.empty() # Clear progress bar after completion for this channel
-    return collected_ads
-
-# --- Caching for Summaries ---
-@st.cache_data(show_spinner="Summarizing text...")
-def get_ai_summary(_text_to_summarize, _api_key, _model_name, _cache_key_prefix="summary"):
-    return ai_summarization.summarize_text(_text_to_summarize, _api_key, _model_name)
+# --- Engine configuration (secrets.toml), applied once per process ---
+# Streamlit re-executes this script on every interaction; the engine's client pool, rate limiter,
+# caches and budgets are process-wide, so they are only reconfigured when these secrets change.
+# Heavy libraries (openai, httpx, pdfplumber, python-pptx, python-docx, openpyxl, bs4) are imported
+# by the modules on first use, so rendering the form does not load them.
+ENGINE_SECRET_KEYS = [
+    "OPENAI_MAX_CONNECTIONS", "OPENAI_MAX_KEEPALIVE_CONNECTIONS", "OPENAI_KEEPALIVE_EXPIRY", "OPENAI_HTTP2",
+    "OPENAI_RATE_LIMITS", "OPENAI_MAX_RETRIES",
+    "COMPLETION_CACHE_PATH", "COMPLETION_CACHE_TTL_SECONDS", "COMPLETION_CACHE_MAX_BYTES", "COMPLETION_CACHE_ENABLED",
+    "EXTRACTION_CACHE_PATH", "EXTRACTION_CACHE_TTL_SECONDS", "EXTRACTION_CACHE_MAX_BYTES", "EXTRACTION_CACHE_ENABLED",
+    "UPLOAD_SPOOL_DIR",
+    "CRAWL_CACHE_DIR", "CRAWL_MAX_DEPTH", "CRAWL_MAX_PAGES", "CRAWL_MAX_CONCURRENCY", "CRAWL_HOST_DELAY",
+    "HTML_EXTRACTOR", "HTML_REMOVE_BOILERPLATE",
+    "OPENAI_PRICING", "TOKEN_BUDGETS",
+    "JOBS_PATH", "JOBS_MAX_WORKERS", "JOBS_RETENTION_SECONDS",
+    "ARTIFACT_DIR", "ARTIFACT_MAX_BYTES", "ARTIFACT_TTL_SECONDS",
+    "TELEMETRY_METRICS_PATH", "TELEMETRY_OTLP_ENDPOINT",
+]
+
+def _plain(value):
+    """Secrets sections as plain dicts (for a stable JSON cache key)."""
+    return {key: _plain(item) for key, item in value.items()} if hasattr(value, "items") else value
+
+@st.cache_resource(show_spinner=False)
+def configure_engine(settings_json: str) -> None:
+    settings = json.loads(settings_json)
+
+    # --- Shared OpenAI connection pool ---
+    openai_client.configure_client_pool(
+        max_connections=settings["OPENAI_MAX_CONNECTIONS"],
+        max_keepalive_connections=settings["OPENAI_MAX_KEEPALIVE_CONNECTIONS"],
+        keepalive_expiry=settings["OPENAI_KEEPALIVE_EXPIRY"],
+        http2=settings["OPENAI_HTTP2"],
+    )
+
+    # --- Shared rate limiting: per-model budgets, e.g. [OPENAI_RATE_LIMITS."gpt-4.1-mini"] rpm = 450, tpm = 180000 ---
+    rate_limiter.configure_rate_limits(
+        model_limits=settings["OPENAI_RATE_LIMITS"],
+        max_retries=settings["OPENAI_MAX_RETRIES"],
+    )
+
+    # --- Persistent completion cache (shared across sessions, restarts and worker processes) ---
+    completion_cache.configure_completion_cache(
+        path=settings["COMPLETION_CACHE_PATH"],
+        ttl_seconds=settings["COMPLETION_CACHE_TTL_SECONDS"],
+        max_bytes=settings["COMPLETION_CACHE_MAX_BYTES"],
+        enabled=settings["COMPLETION_CACHE_ENABLED"],
+    )
+
+    # --- Uploads spooled to disk by content digest; text extracted from them cached under that digest ---
+    uploads.configure_spool(spool_dir=settings["UPLOAD_SPOOL_DIR"])
+    context_extraction.configure_extraction_cache(
+        path=settings["EXTRACTION_CACHE_PATH"],
+        ttl_seconds=settings["EXTRACTION_CACHE_TTL_SECONDS"],
+        max_bytes=settings["EXTRACTION_CACHE_MAX_BYTES"],
+        enabled=settings["EXTRACTION_CACHE_ENABLED"],
+    )
+
+    # --- Website crawl budget for URL context (pages are revalidated against an on-disk HTTP cache) ---
+    site_crawler.configure_crawler(
+        cache_dir=settings["CRAWL_CACHE_DIR"],
+        max_depth=settings["CRAWL_MAX_DEPTH"],
+        max_pages=settings["CRAWL_MAX_PAGES"],
+        max_concurrency=settings["CRAWL_MAX_CONCURRENCY"],
+        host_delay=settings["CRAWL_HOST_DELAY"],
+    )
+    html_extraction.configure_html_extraction(
+        backend=settings["HTML_EXTRACTOR"],  # "selectolax", "lxml" or "bs4"; default: fastest installed
+        remove_boilerplate=settings["HTML_REMOVE_BOILERPLATE"],
+    )
+
+    # --- Token budgets and pricing: [TOKEN_BUDGETS] LinkedIn = 2600, [OPENAI_PRICING."gpt-4.1-mini"] input = 0.40 (USD / 1M tokens) ---
+    token_budget.configure_token_budgets(
+        pricing=settings["OPENAI_PRICING"],
+        channel_budgets=settings["TOKEN_BUDGETS"],
+    )
+
+    # --- Generated DOCX/XLSX files: on disk, least recently used evicted above the size limit ---
+    artifact_store.configure_artifact_store(
+        root=settings["ARTIFACT_DIR"],
+        max_bytes=settings["ARTIFACT_MAX_BYTES"],
+        ttl_seconds=settings["ARTIFACT_TTL_SECONDS"],
+    )
+
+    # --- Background job table and worker pool (path and worker count apply at startup) ---
+    jobs.configure_job_manager(
+        path=settings["JOBS_PATH"],
+        max_workers=settings["JOBS_MAX_WORKERS"],
+        retention_seconds=settings["JOBS_RETENTION_SECONDS"],
+        metrics_path=settings["TELEMETRY_METRICS_PATH"] or telemetry.DEFAULT_METRICS_PATH,
+        otlp_endpoint=settings["TELEMETRY_OTLP_ENDPOINT"] or "",
+    )
+
+configure_engine(json.dumps({key: _plain(st.secrets.get(key)) for key in ENGINE_SECRET_KEYS}, sort_keys=True))
+openai_base_url = st.secrets.get("OPENAI_BASE_URL") or None
+
+# --- Run telemetry: JSONL metrics store, optional OTLP/HTTP collector (e.g. http://localhost:4318/v1/traces) ---
+telemetry_metrics_path = st.secrets.get("TELEMETRY_METRICS_PATH") or telemetry.DEFAULT_METRICS_PATH
+
+# --- Background jobs: generation runs on the job manager's worker pool, not in this script ---
+JOB_POLL_SECONDS = 1.0
+job_manager = jobs.get_job_manager()
 
 # --- Streamlit Frontend ---
 st.title("M Funnel Generator")
 
 # --- Session State Initialization ---
-if 'output_generated' not in st.session_state:
-    st.session_state.output_generated = False
-    st.session_state.docx_bytes = None
-    st.session_state.xlsx_bytes = None
-    st.session_state.sanitized_company_name = "report"
-if 'run_id' not in st.session_state: # For unique progress bar keys if needed
-    st.session_state.run_id = 0
-
-if 'current_step' not in st.session_state:
-    st.session_state.current_step = 0
+# The current job id is mirrored in the URL (?job=...), so a refresh or a new tab picks the job back up
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = st.query_params.get("job")
+if 'submitted_job_ids' not in st.session_state:
+    st.session_state.submitted_job_ids = [] # Jobs of this browser session, the only ones it lists
 
 # --- Inputs ---
 st.header("1. Extract Company Context")
@@ -142,184 +138,249 @@ magnet_link = st.text_input("Link to Lead Magnet Download/Page", key="magnet_lin
 book_link = st.text_input("Link to Demo Booking or Sales Meeting Page*", key="book_link")
 
 content_count_input = st.slider("Content Count per Stage (Email, LinkedIn, Facebook)", min_value=1, max_value=20, value=3, key="content_count")
+use_completion_cache = st.checkbox(
+    "Reuse cached AI responses for identical requests", value=True, key="use_completion_cache",
+    help="Untick to force fresh OpenAI calls for every summary and ad set in this run."
+)
+stream_ads = st.checkbox(
+    "Show ads live as they are generated", value=True, key="stream_ads",
+    help="Streams each OpenAI response and previews every ad as soon as it is complete."
+)
 
 # --- Generate Button ---
 st.markdown("---")
 generate_button = st.button("🚀 Generate Ad Content & Report")
 st.markdown("---")
 
+def get_api_key():
+    """The OpenAI key from secrets.toml; stops the script with an error when it is missing."""
+    try:
+        api_key = st.secrets["OPENAI_API_KEY"]
+        if not api_key or api_key == "your_openai_api_key_here":
+            st.error("OpenAI API key not configured in .streamlit/secrets.toml. Please set it up.")
+            st.stop()
+    except KeyError:
+        st.error("OPENAI_API_KEY not found in .streamlit/secrets.toml. Please create this file and add your key.")
+        st.stop()
+    return api_key
+
+def pipeline_settings(api_key):
+    return pipeline.PipelineSettings(
+        api_key=api_key, model=pipeline.DEFAULT_MODEL, base_url=openai_base_url, use_cache=use_completion_cache,
+        max_concurrency=int(st.secrets.get("OPENAI_MAX_CONCURRENCY", ad_generation.DEFAULT_MAX_CONCURRENCY)),
+        stream=stream_ads, shard_size=int(st.secrets.get("AD_SHARD_SIZE", pipeline.DEFAULT_SHARD_SIZE)),
+        source_max_pages=int(st.secrets.get("SOURCE_MAX_PAGES", pipeline.DEFAULT_SOURCE_MAX_PAGES)),
+        source_max_chars=int(st.secrets.get("SOURCE_MAX_CHARS", pipeline.DEFAULT_SOURCE_MAX_CHARS))
+    )
+
 if generate_button:
-    st.session_state.run_id += 1
-    st.session_state.current_step = 0 # Increment run_id for unique keys
     # --- Validation ---
     if not company_name:
         st.error("Company Name is required.")
     elif not book_link: 
         st.error("Link to Demo Booking or Sales Meeting Page is required.")
     else:
-        st.session_state.output_generated = False 
-        st.session_state.docx_bytes = None
-        st.session_state.xlsx_bytes = None
-
-        try:
-            api_key = st.secrets["OPENAI_API_KEY"]
-            if not api_key or api_key == "your_openai_api_key_here":
-                st.error("OpenAI API key not configured in .streamlit/secrets.toml. Please set it up.")
-                st.stop()
-        except KeyError:
-            st.error("OPENAI_API_KEY not found in .streamlit/secrets.toml. Please create this file and add your key.")
-            st.stop()
-        
-        openai_model = "gpt-4.1-mini" 
-        st.session_state.sanitized_company_name = utils.sanitize_filename(company_name)
-
-        # Main progress status for the whole generation process
-        main_progress_text = "Starting generation process..."
-        main_progress_bar = st.progress(0, text=main_progress_text)
-        total_steps = 6 # Total steps in the progress bar
-
-        def update_main_progress(step_increment, text):
-            st.session_state.current_step += step_increment
-            main_progress_bar.progress(
-                st.session_state.current_step / total_steps,
-                text=text
+        api_key = get_api_key()
+
+        # Uploaded files are spooled to disk now: the job outlives this script run
+        def source_file(uploaded_file):
+            return pipeline.SourceFile.from_upload(uploaded_file) if uploaded_file else None
+
+        funnel_inputs = pipeline.FunnelInputs(
+            company_name=company_name, book_link=book_link, client_url=client_url,
+            additional_context_file=source_file(additional_context_file), lead_magnet_file=source_file(lead_magnet_file),
+            lead_objective=lead_objective, learn_more_link=learn_more_link, magnet_link=magnet_link,
+            content_count=content_count_input
+        )
+        st.session_state.job_id = job_manager.submit(funnel_inputs, pipeline_settings(api_key))
+        st.session_state.submitted_job_ids.append(st.session_state.job_id)
+        st.query_params["job"] = st.session_state.job_id
+
+# --- Job views ---
+def show_job_progress(job):
+    if job.status == "queued":
+        ahead = job_manager.queue_position(job.job_id)
+        st.info(f"Job {job.job_id} for {job.company_name} is queued" + (f" behind {ahead} other run(s)." if ahead else "."))
+    else:
+        st.info(f"Job {job.job_id} for {job.company_name}: {job.stage}...")
+    # One progress bar per channel, from the job's completed API calls
+    for channel_name, (completed_calls, total_calls) in job.progress.items():
+        st.progress(completed_calls / total_calls, text=f"{channel_name} ({completed_calls}/{total_calls} API calls) Complete")
+    # Live preview of the ads streamed so far
+    for channel_name, channel_ads in job.ads.items():
+        if channel_ads:
+            st.caption(f"{channel_name}: {len(channel_ads)} received")
+            st.dataframe(channel_ads, width="stretch", hide_index=True)
+    st.caption("You can keep editing, refresh or close this page: the job keeps running and this link brings you back to it.")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_job(job_id):
+    """Redraws only this section every second while the job runs; a full rerun shows the results."""
+    job = job_manager.get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    show_job_progress(job)
+
+def show_job_metrics(job):
+    metrics = job.metrics
+    if not metrics.get("usage"):
+        return
+    time_to_first_ad = metrics.get("time_to_first_ad", {}).get("overall")
+    generation_usage = metrics["usage"]
+    prefix_cache = metrics.get("prefix_cache") or ad_generation.prefix_cache_summary(generation_usage)
+    metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+    metric_col1.metric("Time to first ad", f"{time_to_first_ad:.1f} s" if time_to_first_ad is not None else "n/a")
+    metric_col2.metric("Ad generation time", f"{metrics.get('generate_seconds', 0):.1f} s")
+    metric_col3.metric(
+        "Ad generation cost", f"${metrics.get('cost_usd', 0):.4f}",
+        help=f"{generation_usage['prompt_tokens']:,} input + {generation_usage['completion_tokens']:,} output tokens billed; "
+             f"{generation_usage['cached_calls']} calls answered from the completion cache."
+    )
+    metric_col4.metric(
+        "Prompt prefix cache",
+        f"{prefix_cache['hit_rate']:.0%}" if prefix_cache["hit_rate"] is not None else "n/a",
+        help=f"{generation_usage['cached_tokens']:,} prompt tokens served from OpenAI's prompt cache"
+             + (f", about {prefix_cache['seconds_saved']:.1f} s of latency saved." if prefix_cache["seconds_saved"] is not None else ".")
+    )
+    for channel_name, channel_ads in job.ads.items():
+        spec = channels.get_channel(channel_name)
+        st.info(f"Generated {len(channel_ads)} {channel_name} {spec.unit if spec else 'items'}.")
+    if metrics.get("stages"):
+        with st.expander(f"Stage timing ({metrics['total_seconds']:.1f} s, critical path: {' → '.join(metrics['critical_path'])})"):
+            st.caption("Stages start as soon as their inputs are ready; ★ marks the chain that determined the total time.")
+            st.dataframe(
+                [{"stage": name, "start (s)": timing["start"], "duration (s)": timing["seconds"],
+                  "critical path": "★" if timing["critical"] else ""} for name, timing in metrics["stages"].items()],
+                width="stretch", hide_index=True
             )
 
-        with st.spinner("Overall process running... please wait."): # General spinner
-            # --- 1. Context Extraction ---
-            update_main_progress(0, "Step 1: Extracting Context...") # Initial text for step 1
-            st.subheader("Step 1: Extracting Context") # Keep subheaders for clarity
-            url_context_raw = ""
-            if client_url:
-                with st.spinner(f"Extracting text from URL: {client_url}..."): # Specific spinner
-                    url_context_raw = context_extraction.extract_text_from_url(client_url)
-                st.info(f"URL extraction: {len(url_context_raw)} characters extracted.")
-            
-            additional_context_raw = ""
-            if additional_context_file:
-                with st.spinner(f"Extracting text from additional context file: {additional_context_file.name}..."):
-                    additional_context_raw = context_extraction.extract_text_from_uploaded_file(additional_context_file)
-                st.info(f"Additional context extraction: {len(additional_context_raw)} characters extracted.")
-
-            lead_magnet_raw = ""
-            if lead_magnet_file:
-                with st.spinner(f"Extracting text from lead magnet file: {lead_magnet_file.name}..."):
-                    lead_magnet_raw = context_extraction.extract_text_from_uploaded_file(lead_magnet_file)
-                st.info(f"Lead magnet extraction: {len(lead_magnet_raw)} characters extracted.")
-            update_main_progress(1, "Step 1: Context Extraction Complete.")
-
-            # --- 2. AI Summarization ---
-            update_main_progress(0, "Step 2: AI Summarization...")
-            st.subheader("Step 2: AI Summarization")
-            url_context_sum = get_ai_summary(url_context_raw, api_key, openai_model, f"url_sum_{st.session_state.run_id}") if url_context_raw else ""
-            if url_context_raw: st.info(f"URL summary: {len(url_context_sum)} characters generated.")
-            
-            additional_context_sum = get_ai_summary(additional_context_raw, api_key, openai_model, f"add_sum_{st.session_state.run_id}") if additional_context_raw else ""
-            if additional_context_raw: st.info(f"Additional context summary: {len(additional_context_sum)} characters generated.")
-            
-            lead_magnet_sum = get_ai_summary(lead_magnet_raw, api_key, openai_model, f"lm_sum_{st.session_state.run_id}") if lead_magnet_raw else ""
-            if lead_magnet_raw: st.info(f"Lead magnet summary: {len(lead_magnet_sum)} characters generated.")
-            update_main_progress(1, "Step 2: AI Summarization Complete.")
-
-            # --- 3. Transparency Report (DOCX) ---
-            update_main_progress(0, "Step 3: Generating Transparency Report...")
-            st.subheader("Step 3: Generating Transparency Report")
-            with st.spinner("Creating DOCX report..."):
-                st.session_state.docx_bytes = transparency_report.create_report_docx(
-                    company_name,
-                    url_context_raw, url_context_sum,
-                    additional_context_raw, additional_context_sum,
-                    lead_magnet_raw, lead_magnet_sum
-                )
-            st.info("DOCX report generated.")
-            update_main_progress(1, "Step 3: Transparency Report Complete.")
-
-            # --- 4. Prepare Prompts & 5. AI Ad Generation ---
-            update_main_progress(0, "Step 4 & 5: Generating Ad Content with AI...")
-            st.subheader("Step 4 & 5: Generating Ad Content with AI")
-            all_ad_data = {}
-
-            # Email Ads
-            st.write("Processing Email ads...") # Main status update
-            email_msg_list = email_prompts.get_email_prompts_messages(
-                url_context_sum, additional_context_sum, lead_objective, book_link, content_count_input
-            )
-            all_ad_data['Email'] = call_openai_for_ads(api_key, openai_model, email_msg_list, "Email", content_count_input)
-            st.info(f"Generated {len(all_ad_data.get('Email', []))} Email ad variations.")
-
-            # LinkedIn Ads
-            st.write("Processing LinkedIn ads...")
-            linkedin_msg_list = linkedin_prompts.get_linkedin_prompts_messages(
-                url_context_sum, additional_context_sum, lead_magnet_sum,
-                learn_more_link, magnet_link, book_link, lead_objective, content_count_input
-            )
-            all_ad_data['LinkedIn'] = call_openai_for_ads(api_key, openai_model, linkedin_msg_list, "LinkedIn", content_count_input)
-            st.info(f"Generated {len(all_ad_data.get('LinkedIn', []))} LinkedIn ad variations.")
-
-            # Facebook Ads
-            st.write("Processing Facebook ads...")
-            facebook_msg_list = facebook_prompts.get_facebook_prompts_messages(
-                url_context_sum, additional_context_sum, lead_magnet_sum,
-                learn_more_link, magnet_link, book_link, lead_objective, content_count_input
-            )
-            all_ad_data['Facebook'] = call_openai_for_ads(api_key, openai_model, facebook_msg_list, "Facebook", content_count_input)
-            st.info(f"Generated {len(all_ad_data.get('Facebook', []))} Facebook ad variations.")
-            update_main_progress(1, "Step 4 & 5: Email, LinkedIn, Facebook Ads Complete.")
-
-            # Google Search Ads
-            update_main_progress(0, "Step 4 & 5: Generating Google Search Ads...")
-            st.write("Processing Google Search ads...")
-            gsearch_msg_list = google_search_prompts.get_google_search_prompts_messages(
-                url_context_sum, additional_context_sum
+def show_job_telemetry(job):
+    run_trace = job_manager.trace(job.job_id)
+    if run_trace is None:
+        return
+    with st.expander(f"Run telemetry ({run_trace.root.duration:.1f} s total)"):
+        st.caption("Time per stage in this run (summed over parallel calls), with token usage, retries and cache hits.")
+        st.dataframe(
+            [{"span": name, **{key: round(value, 3) for key, value in stats.items()}}
+             for name, stats in run_trace.summary().items()],
+            width="stretch", hide_index=True
+        )
+        percentiles = telemetry.span_percentiles(telemetry.load_runs(telemetry_metrics_path, limit=200))
+        if percentiles.get("run", {}).get("count", 0) > 1:
+            st.caption(f"Latency across the last {percentiles['run']['count']} recorded runs.")
+            st.dataframe(
+                [{"span": name, "count": stats["count"], "p50 (s)": round(stats["p50"], 3), "p95 (s)": round(stats["p95"], 3)}
+                 for name, stats in percentiles.items()],
+                width="stretch", hide_index=True
             )
-            # For Google Search, content_count is fixed (15 items from 1 API call)
-            all_ad_data['Google Search'] = call_openai_for_ads(api_key, openai_model, gsearch_msg_list, "Google Search", 15) 
-            st.info(f"Generated {len(all_ad_data.get('Google Search', []))} Google Search ad components.")
-            
-            # Google Display Ads
-            update_main_progress(0, "Step 4 & 5: Generating Google Display Ads...") # Separate small progress for these
-            st.write("Processing Google Display ads...")
-            gdisplay_msg_list = google_display_prompts.get_google_display_prompts_messages(
-                url_context_sum, additional_context_sum
-            )
-            # For Google Display, content_count is fixed (5 items from 1 API call)
-            all_ad_data['Google Display'] = call_openai_for_ads(api_key, openai_model, gdisplay_msg_list, "Google Display", 5)
-            st.info(f"Generated {len(all_ad_data.get('Google Display', []))} Google Display ad components.")
-            update_main_progress(1, "Step 4 & 5: All Ad Generation Complete.")
-
-
-            # --- 6. Excel Report (XLSX) ---
-            update_main_progress(0, "Step 6: Generating Excel Report...")
-            st.subheader("Step 6: Generating Excel Report")
-            with st.spinner("Creating XLSX report..."):
-                st.session_state.xlsx_bytes = excel_processing.create_excel_report(all_ad_data)
-            st.info("XLSX report generated.")
-            update_main_progress(1, "Step 6: Excel Report Complete.")
-            
-            main_progress_bar.progress(1.0, text="All content generated successfully!")
-            st.session_state.output_generated = True
-            st.success("All content generated successfully!")
-
-# --- Download Buttons ---
-if st.session_state.output_generated:
+        st.download_button(
+            label="Download trace (OTLP JSON)",
+            data=json.dumps(telemetry.to_otlp_json(run_trace)),
+            file_name=f"{utils.sanitize_filename(job.company_name)}_trace.json",
+            mime="application/json"
+        )
+
+def show_job_results(job):
+    if job.status == "failed":
+        st.error(f"Job {job.job_id} for {job.company_name} failed: {job.error}")
+        return
+    if job.status == "interrupted":
+        st.warning(f"Job {job.job_id} for {job.company_name} was interrupted by a server restart. Please generate it again.")
+        return
+    for error_message in job.errors:
+        st.error(error_message)
+    show_job_metrics(job)
+
+    # --- Download Buttons ---
     st.header("3. Download Outputs")
+    st.caption(f"Job {job.job_id} for {job.company_name}. Open this page with ?job={job.job_id} to download these files later.")
+    # Only the handles are kept here: each file is read from the artifact store when its button is clicked
+    store = artifact_store.get_artifact_store()
+    docx_handle, xlsx_handle = (handle if store.exists(handle) else None
+                                for handle in (job.artifacts.get("docx"), job.artifacts.get("xlsx")))
     col1, col2 = st.columns(2)
     with col1:
-        if st.session_state.docx_bytes:
+        if docx_handle:
             st.download_button(
                 label="Download AI Transparency Report (DOCX)",
-                data=st.session_state.docx_bytes,
-                file_name=f"{st.session_state.sanitized_company_name}_ai_report.docx",
+                data=lambda: store.read(docx_handle) or b"",
+                file_name=os.path.basename(docx_handle),
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
             )
     with col2:
-        if st.session_state.xlsx_bytes:
+        if xlsx_handle:
             st.download_button(
                 label="Download Ad Content (XLSX)",
-                data=st.session_state.xlsx_bytes,
-                file_name=f"{st.session_state.sanitized_company_name}_lead.xlsx",
+                data=lambda: store.read(xlsx_handle) or b"",
+                file_name=os.path.basename(xlsx_handle),
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
+    if not (docx_handle or xlsx_handle):
+        st.warning("The files of this job are no longer available.")
+    show_regenerate(job)
+    show_job_telemetry(job)
+
+def show_regenerate(job):
+    """Redo one channel or funnel stage from the job's saved summaries; only its XLSX sheet is rebuilt."""
+    calls = job.state.get("calls") if job.state else None
+    if not calls:
+        return
+    for regeneration in job.metrics.get("regenerations", [])[-1:]:
+        st.caption(f"Last regenerated: {regeneration['target']} ({regeneration['calls']} API call(s), "
+                   f"{regeneration['seconds']:.1f} s, ${regeneration['cost_usd']:.4f}).")
+    with st.expander("Regenerate a channel or funnel stage"):
+        regen_col1, regen_col2 = st.columns(2)
+        regen_channel = regen_col1.selectbox("Channel", options=list(calls), key="regen_channel")
+        channel_stages = [call["stage"] for call in calls[regen_channel]]
+        regen_stage = regen_col2.selectbox(
+            "Funnel stage", options=["All stages"] + channel_stages if len(channel_stages) > 1 else channel_stages,
+            key="regen_stage"
+        )
+        stage_calls = len(channel_stages) if regen_stage == "All stages" else 1
+        st.caption(f"Uses the saved summaries: {stage_calls} API call(s) instead of a full run. Other channels and stages are kept.")
+        if st.button("🔁 Regenerate", key="regen_button"):
+            try:
+                job_manager.regenerate(job.job_id, pipeline_settings(get_api_key()), regen_channel,
+                                       None if regen_stage == "All stages" or len(channel_stages) == 1 else regen_stage)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.rerun()
+
+# --- Current job: live progress while it runs, results and downloads once it is done ---
+if st.session_state.job_id:
+    current_job = job_manager.get(st.session_state.job_id)
+    if current_job is None:
+        st.warning(f"No job with id {st.session_state.job_id} was found.")
+    elif current_job.finished:
+        show_job_results(current_job)
+    else:
+        poll_job(current_job.job_id)
+
+    cache_stats = completion_cache.get_completion_cache().stats()
+    if cache_stats["enabled"]:
+        st.caption(f"Completion cache: {cache_stats['session_hits']} hits / {cache_stats['session_misses']} misses in this process, "
+                   f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1_048_576:.1f} MB) on disk.")
+    artifact_usage = artifact_store.get_artifact_store().usage()
+    st.caption(f"Generated files: {artifact_usage['files']} on disk ({artifact_usage['disk_bytes'] / 1_048_576:.1f} of "
+               f"{artifact_usage['max_bytes'] / 1_048_576:.0f} MB, {artifact_usage['evicted']} evicted); "
+               f"server memory {artifact_usage['rss_bytes'] / 1_048_576:.0f} MB.")
+
+# --- Earlier jobs ---
+# Only this session's jobs are listed: a job ID gives access to its files, so others' IDs are never shown
+with st.expander("Previous jobs"):
+    recent_jobs = job_manager.list_jobs(st.session_state.submitted_job_ids, limit=20)
+    if recent_jobs:
+        st.dataframe(
+            [{"Job ID": job.job_id, "Company": job.company_name, "Status": job.status,
+              "Submitted": time.strftime("%Y-%m-%d %H:%M", time.localtime(job.created_at))} for job in recent_jobs],
+            width="stretch", hide_index=True
+        )
+    lookup_job_id = st.text_input("Open a job by ID", key="lookup_job_id").strip()
+    if st.button("Open job") and lookup_job_id:
+        st.session_state.job_id = lookup_job_id
+        st.query_params["job"] = lookup_job_id
+        st.rerun()
 
 # --- Footer ---
 st.markdown("---")
@@ -0,0 +1,298 @@
+"""
+Headless batch generation: one funnel (DOCX + XLSX) per company listed in a CSV or JSONL manifest.
+
+Manifest columns / keys (only company_name and book_link are required):
+    id, company_name, client_url, additional_context_file, lead_magnet_file, lead_objective,
+    learn_more_link, magnet_link, book_link, content_count
+File paths are resolved relative to the manifest. Completed companies are recorded in
+<output_dir>/checkpoint.jsonl; re-running the same command skips them (use --force to redo).
+Per-job timing spans are appended to <output_dir>/metrics.jsonl (see modules/telemetry.py).
+
+With --batch, OpenAI requests go through the Batch API instead (half price, no rate-limit pressure,
+results within 24 hours): every company runs until it needs an answer, the collected requests are
+sent as one batch, and the companies run again once it has finished - summaries in the first
+round, ads in the second, repairs of invalid ads after that. Batch state is kept in
+<output_dir>/batch/, so an interrupted run picks up its in-flight batches when restarted.
+
+Usage:
+    python batch_cli.py companies.csv --output-dir out/ --concurrency 4 --max-requests 16
+    python batch_cli.py companies.csv --output-dir out/ --batch
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules import utils, pipeline, rate_limiter, openai_client, completion_cache, context_extraction, telemetry, openai_batch
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+METRICS_FILE = "metrics.jsonl"
+BATCH_DIR = "batch"
+MAX_BATCH_ROUNDS = 8  # Summaries, map-reduce passes, ads and repair rounds fit well within this
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """Reads company rows from a .csv or .jsonl manifest."""
+    if path.lower().endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [dict(row) for row in csv.DictReader(f)]
+
+
+def assign_job_ids(rows: List[Dict[str, Any]]) -> List[str]:
+    """Stable job ids: the manifest 'id' column, else the sanitized company name (suffixed if repeated)."""
+    seen: Dict[str, int] = {}
+    job_ids = []
+    for row in rows:
+        base = str(row.get("id") or "").strip() or utils.sanitize_filename(str(row.get("company_name") or ""))
+        seen[base] = seen.get(base, 0) + 1
+        job_ids.append(base if seen[base] == 1 else f"{base}_{seen[base]}")
+    return job_ids
+
+
+def row_to_inputs(row: Dict[str, Any], manifest_dir: str) -> pipeline.FunnelInputs:
+    def source_file(column: str) -> Optional[pipeline.SourceFile]:
+        path = str(row.get(column) or "").strip()
+        if not path:
+            return None
+        return pipeline.SourceFile.from_path(os.path.join(manifest_dir, path))
+
+    if not row.get("company_name"):
+        raise ValueError("company_name is required")
+    if not row.get("book_link"):
+        raise ValueError("book_link is required")
+    return pipeline.FunnelInputs(
+        company_name=str(row["company_name"]),
+        book_link=str(row["book_link"]),
+        client_url=str(row.get("client_url") or ""),
+        additional_context_file=source_file("additional_context_file"),
+        lead_magnet_file=source_file("lead_magnet_file"),
+        lead_objective=str(row.get("lead_objective") or "Demo Booking"),
+        learn_more_link=str(row.get("learn_more_link") or ""),
+        magnet_link=str(row.get("magnet_link") or ""),
+        content_count=int(row.get("content_count") or 3),
+    )
+
+
+class Checkpoint:
+    """Append-only JSONL record of finished jobs; the last record per job id wins."""
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, CHECKPOINT_FILE)
+        self._lock = threading.Lock()
+        self.records: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # Partially written line from an interrupted run
+                    self.records[record["job_id"]] = record
+
+    def is_done(self, job_id: str) -> bool:
+        return self.records.get(job_id, {}).get("status") == "done"
+
+    def record(self, job_id: str, **fields) -> None:
+        entry = dict(job_id=job_id, finished_at=time.time(), **fields)
+        with self._lock:
+            self.records[job_id] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def run_job(job_id: str, inputs: pipeline.FunnelInputs, settings: pipeline.PipelineSettings, output_dir: str,
+            otlp_endpoint: Optional[str] = None) -> Dict[str, Any]:
+    """Runs one company and writes its DOCX, XLSX and a JSON dump of summaries and ads."""
+    with telemetry.start_run("funnel_run", job_id=job_id, company=inputs.company_name) as trace:
+        result = pipeline.run_pipeline(inputs, settings)
+    telemetry.append_run(trace, os.path.join(output_dir, METRICS_FILE))
+    if otlp_endpoint:
+        try:
+            telemetry.export_otlp(trace, otlp_endpoint)
+        except Exception as e:
+            print(f"[warning] {job_id}: OTLP export failed: {e}", file=sys.stderr)
+    job_dir = os.path.join(output_dir, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    file_stem = utils.sanitize_filename(inputs.company_name)
+    outputs = {
+        "docx": os.path.join(job_dir, f"{file_stem}_ai_report.docx"),
+        "xlsx": os.path.join(job_dir, f"{file_stem}_lead.xlsx"),
+        "json": os.path.join(job_dir, "result.json"),
+    }
+    _write_atomic(outputs["docx"], result.docx_bytes.getvalue())
+    _write_atomic(outputs["xlsx"], result.xlsx_bytes.getvalue())
+    _write_atomic(outputs["json"], json.dumps({
+        "company_name": inputs.company_name,
+        "summaries": result.summaries,
+        "ads": result.all_ad_data,
+        "errors": result.errors,
+        "metrics": result.metrics,
+    }, indent=2, ensure_ascii=False).encode("utf-8"))
+    return {"outputs": outputs, "errors": result.errors, "metrics": result.metrics}
+
+
+def run_round(pending: List[Tuple[str, Dict[str, Any]]], settings: pipeline.PipelineSettings, manifest_dir: str,
+              checkpoint: Checkpoint, args: argparse.Namespace) -> Tuple[int, List[Tuple[str, Dict[str, Any]]]]:
+    """
+    Runs the pending companies and records each one that finishes or fails. Returns the number of
+    failures and the companies that are waiting on the Batch API (only in --batch mode).
+    """
+    failures = 0
+    deferred = []
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix="company") as executor:
+        futures = {}
+        for job_id, row in pending:
+            try:
+                inputs = row_to_inputs(row, manifest_dir)
+            except (ValueError, OSError) as e:
+                failures += 1
+                checkpoint.record(job_id, status="failed", error=str(e))
+                print(f"[failed] {job_id}: {e}", file=sys.stderr)
+                continue
+            futures[executor.submit(run_job, job_id, inputs, settings, args.output_dir, args.otlp_endpoint)] = (job_id, row)
+
+        for done_count, future in enumerate(as_completed(futures), 1):
+            job_id, row = futures[future]
+            try:
+                outcome = future.result()
+            except openai_batch.BatchDeferred:
+                deferred.append((job_id, row))
+                continue
+            except Exception as e:
+                failures += 1
+                checkpoint.record(job_id, status="failed", error=str(e))
+                print(f"[failed] {job_id}: {e}", file=sys.stderr)
+                continue
+            checkpoint.record(job_id, status="done", **outcome)
+            warnings = f" ({len(outcome['errors'])} generation errors)" if outcome["errors"] else ""
+            print(f"[{done_count}/{len(futures)}] {job_id} done in {outcome['metrics'].get('total_seconds', 0):.1f}s{warnings}")
+    return failures, deferred
+
+
+_last_batch_progress: Dict[str, str] = {}
+
+
+def _print_batch_progress(batch_id: str, batch: Any) -> None:
+    """Prints a batch's status whenever it changes."""
+    counts = batch.request_counts
+    line = f"  batch {batch_id}: {batch.status}" + (f" {counts.completed + counts.failed}/{counts.total}" if counts else "")
+    if _last_batch_progress.get(batch_id) != line:
+        _last_batch_progress[batch_id] = line
+        print(line)
+
+
+def _load_api_key(cli_value: Optional[str]) -> str:
+    if cli_value:
+        return cli_value
+    if os.environ.get("OPENAI_API_KEY"):
+        return os.environ["OPENAI_API_KEY"]
+    secrets_path = os.path.join(".streamlit", "secrets.toml")
+    if os.path.exists(secrets_path):
+        import tomllib
+        with open(secrets_path, "rb") as f:
+            return tomllib.load(f).get("OPENAI_API_KEY", "")
+    return ""
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="CSV or JSONL file with one company per row.")
+    parser.add_argument("--output-dir", "-o", default="batch_output")
+    parser.add_argument("--concurrency", type=int, default=4, help="Companies processed at the same time.")
+    parser.add_argument("--max-requests", type=int, default=16,
+                        help="Global cap on simultaneous OpenAI requests across all companies.")
+    parser.add_argument("--model", default=pipeline.DEFAULT_MODEL)
+    parser.add_argument("--api-key", help="Defaults to $OPENAI_API_KEY, then .streamlit/secrets.toml.")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"))
+    parser.add_argument("--shard-size", type=int, default=pipeline.DEFAULT_SHARD_SIZE,
+                        help="Max ad variations per request; larger counts are split into parallel requests (0 = never).")
+    parser.add_argument("--source-max-pages", type=int, default=pipeline.DEFAULT_SOURCE_MAX_PAGES,
+                        help="Pages of each uploaded PDF that are extracted (0 = all).")
+    parser.add_argument("--source-max-chars", type=int, default=pipeline.DEFAULT_SOURCE_MAX_CHARS,
+                        help="Characters of each uploaded PDF that are extracted (0 = all).")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the completion cache.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Send requests through the OpenAI Batch API (half price, results within 24 hours).")
+    parser.add_argument("--batch-poll-seconds", type=float, default=openai_batch.DEFAULT_POLL_SECONDS,
+                        help="Seconds between batch status checks.")
+    parser.add_argument("--force", action="store_true", help="Regenerate companies already in the checkpoint.")
+    parser.add_argument("--otlp-endpoint", default=os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT"),
+                        help="Also send each job's trace to this OTLP/HTTP collector (e.g. http://localhost:4318/v1/traces).")
+    args = parser.parse_args(argv)
+
+    api_key = _load_api_key(args.api_key)
+    if not api_key:
+        print("No OpenAI API key: pass --api-key, set OPENAI_API_KEY or add it to .streamlit/secrets.toml.", file=sys.stderr)
+        return 2
+
+    rows = load_manifest(args.manifest)
+    job_ids = assign_job_ids(rows)
+    manifest_dir = os.path.dirname(os.path.abspath(args.manifest))
+    os.makedirs(args.output_dir, exist_ok=True)
+    checkpoint = Checkpoint(args.output_dir)
+
+    rate_limiter.configure_rate_limits(max_in_flight=args.max_requests)
+    if args.batch:
+        openai_batch.configure_batch_session(os.path.join(args.output_dir, BATCH_DIR), poll_seconds=args.batch_poll_seconds)
+    settings = pipeline.PipelineSettings(
+        api_key=api_key, model=args.model, base_url=args.base_url, use_cache=not args.no_cache,
+        max_concurrency=args.max_requests, shard_size=args.shard_size,
+        source_max_pages=args.source_max_pages, source_max_chars=args.source_max_chars
+    )
+
+    pending = [(job_id, row) for job_id, row in zip(job_ids, rows) if args.force or not checkpoint.is_done(job_id)]
+    print(f"{len(rows)} companies in manifest, {len(rows) - len(pending)} already done, {len(pending)} to run.")
+
+    failures = 0
+    started_at = time.perf_counter()
+    batch = openai_batch.get_batch_session()
+    while pending:
+        round_failures, pending = run_round(pending, settings, manifest_dir, checkpoint, args)
+        failures += round_failures
+        if not pending:
+            break
+        if batch.rounds >= MAX_BATCH_ROUNDS:
+            for job_id, _ in pending:
+                failures += 1
+                checkpoint.record(job_id, status="failed", error=f"Still waiting on the Batch API after {batch.rounds} rounds")
+            break
+        print(f"Batch round {batch.rounds + 1}: {len(pending)} companies waiting on {len(batch.pending)} requests "
+              f"({len(batch.in_flight())} batches already in flight).")
+        batch.run_round(openai_client.get_openai_client(api_key, args.base_url), progress_callback=_print_batch_progress)
+
+    openai_client.close_all_clients()
+    stats = completion_cache.get_completion_cache().stats()
+    extraction_stats = context_extraction.get_extraction_cache().stats()
+    print(f"Finished in {time.perf_counter() - started_at:.1f}s, {failures} failed. "
+          f"Completion cache: {stats['session_hits']} hits / {stats['session_misses']} misses. "
+          f"Extraction cache: {extraction_stats['session_hits']} hits / {extraction_stats['session_misses']} misses.")
+    if args.batch:
+        batch_stats = batch.stats(args.model)
+        print(f"Batch API: {batch_stats['results']} results from {batch_stats['batches']} batches in {batch_stats['rounds']} rounds "
+              f"({batch_stats['direct']} rejected and sent directly), {batch_stats['prompt_tokens']} input + "
+              f"{batch_stats['completion_tokens']} output tokens, ${batch_stats['cost_usd']:.4f} at batch prices.")
+    percentiles = telemetry.span_percentiles(telemetry.load_runs(os.path.join(args.output_dir, METRICS_FILE)))
+    if "run" in percentiles:
+        run = percentiles["run"]
+        print(f"Per-company time over {run['count']} recorded runs: p50 {run['p50']:.1f}s, p95 {run['p95']:.1f}s.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Per-call latency with the shared, pooled OpenAI client versus a fresh client per call.
+Usage:  python -m benchmarks.bench_client_reuse --calls 200
+"""
+import argparse
+import statistics
+import time
+from typing import List
+
+from openai import OpenAI
+
+from benchmarks.mock_openai_server import MockOpenAIServer
+from modules.openai_client import get_openai_client, close_all_clients
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+def _time_call(client: OpenAI) -> float:
+    start = time.perf_counter()
+    client.chat.completions.create(model="mock", messages=MESSAGES)
+    return time.perf_counter() - start
+
+
+def bench_fresh(base_url: str, calls: int) -> List[float]:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client = OpenAI(api_key="bench", base_url=base_url)
+        client.chat.completions.create(model="mock", messages=MESSAGES)
+        timings.append(time.perf_counter() - start)
+        client.close()
+    return timings
+
+
+def bench_shared(base_url: str, calls: int) -> List[float]:
+    client = get_openai_client("bench", base_url)
+    _time_call(client) # Warm the pool, as a long-running app would be
+    return [_time_call(get_openai_client("bench", base_url)) for _ in range(calls)]
+
+
+def _report(label: str, timings: List[float]) -> None:
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<14} mean {statistics.mean(timings) * 1000:7.2f} ms   "
+          f"p50 {statistics.median(timings) * 1000:7.2f} ms   p95 {p95 * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer().start()
+    try:
+        _report("fresh client", bench_fresh(server.base_url, args.calls))
+        _report("shared client", bench_shared(server.base_url, args.calls))
+    finally:
+        close_all_clients()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
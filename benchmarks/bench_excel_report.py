@@ -0,0 +1,92 @@
+"""
+XLSX export speed and memory: streaming create_excel_report versus the previous in-memory writer.
+Usage:  python -m benchmarks.bench_excel_report --ads 5000
+Peak memory is the tracemalloc peak of Python allocations during the export.
+"""
+import argparse
+import time
+import tracemalloc
+from io import BytesIO
+from typing import Any, Dict, List
+
+import openpyxl
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+
+from modules.channels import CHANNELS
+from modules.excel_processing import create_excel_report
+
+SHEET_LAYOUTS = [(spec.name, spec.columns) for spec in CHANNELS.values()]
+
+
+def legacy_create_excel_report(ad_data_dict: Dict[str, List[Dict[str, Any]]]) -> BytesIO:
+    """The previous implementation: regular workbook, per-cell styles, second pass for widths."""
+    wb = openpyxl.Workbook()
+    wb.remove(wb["Sheet"])
+    header_font = Font(color="FFFFFF", bold=True)
+    header_fill = PatternFill(start_color="000000", end_color="000000", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    content_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+    side = Side(style='thin', color="000000")
+    cell_border = Border(left=side, right=side, top=side, bottom=side)
+
+    for sheet_name, headers in SHEET_LAYOUTS:
+        if not ad_data_dict.get(sheet_name):
+            continue
+        ws = wb.create_sheet(sheet_name)
+        for col_num, header_text in enumerate(headers, 1):
+            cell = ws.cell(row=1, column=col_num, value=header_text)
+            cell.font, cell.fill, cell.alignment, cell.border = header_font, header_fill, header_alignment, cell_border
+        for row_idx, ad in enumerate(ad_data_dict[sheet_name], 2):
+            for col_idx, header in enumerate(headers, 1):
+                cell = ws.cell(row=row_idx, column=col_idx, value=ad.get(header, ""))
+                cell.border = cell_border
+                cell.alignment = content_alignment
+
+    for ws in wb.worksheets:
+        for col in ws.columns:
+            max_length = 0
+            for cell in col:
+                if cell.value:
+                    max_length = max(max_length, max(len(s) for s in str(cell.value).split('\n')))
+            ws.column_dimensions[col[0].column_letter].width = min((max_length + 2) * 1.2, 50)
+
+    file_stream = BytesIO()
+    wb.save(file_stream)
+    file_stream.seek(0)
+    return file_stream
+
+
+def make_ad_data(ads_per_channel: int) -> Dict[str, List[Dict[str, Any]]]:
+    body = "Hi [Name],\nWe help teams like yours cut onboarding time in half.\nBook a demo: https://example.com/book"
+    data = {}
+    for sheet_name, headers in SHEET_LAYOUTS:
+        data[sheet_name] = [
+            {header: (body if header in ("Body", "Introductory Text", "Primary Text") else f"{header} {i}")
+             for header in headers}
+            for i in range(ads_per_channel)
+        ]
+    return data
+
+
+def measure(label: str, writer, ad_data: Dict[str, List[Dict[str, Any]]]) -> None:
+    rows = sum(len(ads) for ads in ad_data.values())
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = len(writer(ad_data).getvalue())
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {rows / elapsed:10.0f} rows/s   {elapsed:7.2f} s   peak {peak / 1_048_576:7.1f} MB   ({size / 1024:.0f} KB file)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ads", type=int, default=5000, help="Ads per channel sheet.")
+    args = parser.parse_args()
+    ad_data = make_ad_data(args.ads)
+    measure("legacy", legacy_create_excel_report, ad_data)
+    measure("streaming", create_excel_report, ad_data)
+
+
+if __name__ == "__main__":
+    main()
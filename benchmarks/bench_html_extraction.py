@@ -0,0 +1,116 @@
+"""
+HTML-to-text speed and output parity for each installed extraction backend.
+Runs on a directory of saved pages (--corpus, every *.htm / *.html file) or, by default, on a
+synthetic corpus of heavy marketing pages (megabytes of inline JS, inline SVG icons, nav, footer
+and a cookie banner). --save-corpus DIR writes the synthetic pages out for inspection.
+Parity compares each backend, with boilerplate removal off, to the original extractor
+(html.parser, script/style removed, get_text): character ratio and exact-match pages. The
+new backends also drop SVG, noscript and similar non-text tags, so they are additionally
+checked for identical output against the bs4 backend with the same settings.
+Usage:  python -m benchmarks.bench_html_extraction --pages 20
+"""
+import argparse
+import os
+import random
+import time
+from typing import Callable, List, Tuple
+
+from bs4 import BeautifulSoup
+
+from modules.html_extraction import BACKENDS, available_backends
+
+WORDS = ("pipeline revenue automate onboarding teams customers platform insights workflow integrate "
+         "secure scale analytics growth demo results trusted partners enterprise faster simple").split()
+
+
+def original_extractor(html: bytes) -> str:
+    """extract_text_from_url before the pluggable backends."""
+    soup = BeautifulSoup(html, "html.parser")
+    for script_or_style in soup(["script", "style"]):
+        script_or_style.decompose()
+    return soup.get_text(separator=" ", strip=True)
+
+
+def _sentence(rng: random.Random, words: int = 14) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def build_page(rng: random.Random, script_kb: int = 1500, icons: int = 150, sections: int = 40) -> bytes:
+    """One synthetic marketing page, roughly script_kb of inline JS plus markup."""
+    script = "var cfg = {" + ",".join(f'"k{i}": "{rng.random():.12f}"' for i in range(script_kb * 1024 // 24)) + "};"
+    icon = ('<svg viewBox="0 0 24 24"><path d="' + " ".join(f"M{rng.randint(0, 24)} {rng.randint(0, 24)}"
+            for _ in range(40)) + '"/><text>icon</text></svg>')
+    nav = "<nav>" + "".join(f'<a href="/p{i}">{rng.choice(WORDS).title()}</a>' for i in range(30)) + "</nav>"
+    body = "".join(f"<section><h2>{_sentence(rng, 5)}</h2>{icon * (icons // sections)}"
+                   f"<p>{_sentence(rng)} {_sentence(rng)}</p><ul><li>{_sentence(rng, 6)}</li>"
+                   f"<li>{_sentence(rng, 6)}</li></ul></section>" for _ in range(sections))
+    footer = "<footer>" + "".join(f"<p>{_sentence(rng, 8)}</p>" for _ in range(6)) + "</footer>"
+    cookie = '<div id="cookie-banner" class="consent"><p>We use cookies to improve your experience.</p></div>'
+    html = (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{_sentence(rng, 4)}</title>"
+            f"<style>{'.c{color:red}' * 2000}</style><script>{script}</script></head>"
+            f"<body>{cookie}<header><h1>{_sentence(rng, 6)}</h1></header>{nav}<main>{body}</main>{footer}"
+            f"<noscript>Please enable JavaScript.</noscript><script>{script[:len(script) // 4]}</script></body></html>")
+    return html.encode("utf-8")
+
+
+def load_corpus(path: str) -> List[Tuple[str, bytes]]:
+    pages = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith((".htm", ".html")):
+            with open(os.path.join(path, name), "rb") as f:
+                pages.append((name, f.read()))
+    return pages
+
+
+def timed(extract: Callable[[bytes], str], pages: List[Tuple[str, bytes]]) -> Tuple[float, List[str]]:
+    start = time.perf_counter()
+    texts = [extract(html) for _, html in pages]
+    return (time.perf_counter() - start) * 1000 / len(pages), texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of saved .html pages (default: synthetic corpus).")
+    parser.add_argument("--pages", type=int, default=10, help="Synthetic pages to generate.")
+    parser.add_argument("--save-corpus", help="Write the synthetic pages to this directory.")
+    args = parser.parse_args()
+
+    if args.corpus:
+        pages = load_corpus(args.corpus)
+    else:
+        rng = random.Random(0)
+        pages = [(f"page_{i:03d}.html", build_page(rng)) for i in range(args.pages)]
+        if args.save_corpus:
+            os.makedirs(args.save_corpus, exist_ok=True)
+            for name, html in pages:
+                with open(os.path.join(args.save_corpus, name), "wb") as f:
+                    f.write(html)
+    if not pages:
+        print("No pages found.")
+        return
+    size_mb = sum(len(html) for _, html in pages) / 1_048_576
+    print(f"{len(pages)} pages, {size_mb:.1f} MB. Backends installed: {', '.join(available_backends())}")
+
+    reference_ms, reference = timed(original_extractor, pages)
+    reference_chars = sum(len(text) for text in reference)
+    print(f"{'original':<22} {reference_ms:8.1f} ms/page   {reference_chars / len(pages):9.0f} chars/page")
+
+    bs4_texts = {remove_boilerplate: [BACKENDS["bs4"](html, remove_boilerplate) for _, html in pages]
+                 for remove_boilerplate in (False, True)}
+    for name in available_backends():
+        for remove_boilerplate in (False, True):
+            ms, texts = timed(lambda html: BACKENDS[name](html, remove_boilerplate), pages)
+            chars = sum(len(text) for text in texts)
+            label = f"{name}{' +boilerplate' if remove_boilerplate else ''}"
+            line = f"{label:<22} {ms:8.1f} ms/page   {chars / len(pages):9.0f} chars/page   {reference_ms / ms:5.1f}x"
+            if not remove_boilerplate:
+                exact = sum(text == ref for text, ref in zip(texts, reference))
+                line += f"   parity {chars / max(1, reference_chars):6.1%} chars, {exact}/{len(pages)} identical"
+            if name != "bs4":
+                same = sum(text == ref for text, ref in zip(texts, bs4_texts[remove_boilerplate]))
+                line += f"   {same}/{len(pages)} identical to bs4"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+PDF extraction throughput on a generated multi-page PDF: in-process versus the worker pool.
+Usage:  python -m benchmarks.bench_pdf_extraction --pages 500
+Each mode runs in its own subprocess so peak RSS is measured independently.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+LINE = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt."
+
+
+def build_pdf(pages: int, lines_per_page: int = 40, tag: str = "") -> bytes:
+    """Writes a minimal valid PDF with one Helvetica text stream per page (tag makes the bytes unique)."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None, # Pages tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page_number in range(pages):
+        text_ops = ["BT /F1 10 Tf 12 TL 50 780 Td"]
+        for line_number in range(lines_per_page):
+            text_ops.append(f"(Page {page_number + 1} line {line_number + 1}: {tag}{LINE}) Tj T*")
+        text_ops.append("ET")
+        stream = "\n".join(text_ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+
+def _run_mode(pdf_path: str, workers: int) -> None:
+    """Child process entry point: extracts the PDF and prints a JSON result line."""
+    from modules.pdf_extraction import iter_pdf_pages
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    start = time.perf_counter()
+    pages = chars = 0
+    first_page_at = None
+    for page_text in iter_pdf_pages(pdf_bytes, max_workers=workers):
+        if first_page_at is None:
+            first_page_at = time.perf_counter() - start
+        pages += 1
+        chars += len(page_text)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(json.dumps({"pages": pages, "chars": chars, "seconds": elapsed,
+                      "first_page_seconds": first_page_at, "peak_rss_mb": peak_kb / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--child", nargs=2, metavar=("PDF", "WORKERS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_mode(args.child[0], int(args.child[1]))
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(build_pdf(args.pages))
+        pdf_path = tmp.name
+    try:
+        print(f"Generated {args.pages}-page PDF ({os.path.getsize(pdf_path) / 1024:.0f} KB)")
+        for label, workers in (("in-process", 1), (f"pool x{args.workers}", args.workers)):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_pdf_extraction", "--child", pdf_path, str(workers)],
+                check=True, capture_output=True, text=True,
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            print(f"{label:<12} {result['pages'] / result['seconds']:8.1f} pages/s   "
+                  f"first page {result['first_page_seconds'] * 1000:7.1f} ms   "
+                  f"peak RSS {result['peak_rss_mb']:7.1f} MB   ({result['chars']} chars)")
+    finally:
+        os.unlink(pdf_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+End-to-end pipeline benchmark against the local mock OpenAI server: extraction, summaries,
+DOCX, every channel's ad calls and the XLSX report, exactly as batch_cli.py runs them.
+Runs every combination of --content-counts, --doc-pages (a generated PDF used as the additional
+context file; 0 = none) and --concurrency (funnel runs in flight at once) and reports p50/p95 run
+latency, throughput and peak memory for each. The completion cache is bypassed and every run gets
+a unique document, so no run is answered from a cache.
+Each scenario runs in its own subprocess so peak RSS is measured independently; the mock server
+stays in this process.
+Usage:  python -m benchmarks.bench_pipeline --runs 8 --content-counts 3 10 --doc-pages 0 20 --concurrency 1 4
+        python -m benchmarks.bench_pipeline --latency 0.5 --seconds-per-token 0.002 --rate-limit-rate 0.05
+        python -m benchmarks.bench_pipeline --invalid-rate 0.1   (cost of repairing invalid ads)
+        python -m benchmarks.bench_pipeline --content-counts 5 20 --seconds-per-token 0.002 --shard-size 0 5
+Add --output results.jsonl to keep one JSON line per scenario for comparing runs over time.
+"""
+import argparse
+import itertools
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from benchmarks.bench_pdf_extraction import build_pdf
+from benchmarks.mock_openai_server import MockOpenAIServer
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _run_once(run_number: int, scenario: Dict[str, Any], settings) -> Dict[str, Any]:
+    from modules import pipeline
+
+    document = None
+    if scenario["doc_pages"]:
+        document = pipeline.SourceFile(name="context.pdf", data=build_pdf(scenario["doc_pages"], tag=f"run {run_number} "))
+    inputs = pipeline.FunnelInputs(
+        company_name=f"Bench Co {run_number}", book_link="https://example.com/book",
+        additional_context_file=document, learn_more_link="https://example.com",
+        magnet_link="https://example.com/guide", content_count=scenario["content_count"],
+    )
+    start = time.perf_counter()
+    result = pipeline.run_pipeline(inputs, settings)
+    return {"seconds": time.perf_counter() - start, "errors": len(result.errors),
+            "ads": sum(len(ads) for ads in result.all_ad_data.values())}
+
+
+def _run_scenario(scenario: Dict[str, Any]) -> None:
+    """Child process entry point: runs one scenario and prints a JSON result line."""
+    from modules import pipeline, rate_limiter, openai_client
+
+    rate_limiter.configure_rate_limits(max_in_flight=scenario["max_requests"])
+    settings = pipeline.PipelineSettings(api_key="bench", base_url=scenario["base_url"], use_cache=False,
+                                         max_concurrency=scenario["max_requests"], stream=scenario["stream"],
+                                         shard_size=scenario["shard_size"])
+    runs = scenario["runs"]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=scenario["concurrency"], thread_name_prefix="bench-run") as executor:
+        outcomes = list(executor.map(lambda i: _run_once(i, scenario, settings), range(runs)))
+    elapsed = time.perf_counter() - start
+    openai_client.close_all_clients()
+
+    latencies = [outcome["seconds"] for outcome in outcomes]
+    # ru_maxrss is KiB on Linux; the children term covers PDF extraction worker processes
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({
+        "p50_seconds": statistics.median(latencies), "p95_seconds": _percentile(latencies, 0.95),
+        "runs_per_minute": runs / elapsed * 60, "peak_rss_mb": peak_kb / 1024,
+        "ads": sum(outcome["ads"] for outcome in outcomes),
+        "generation_errors": sum(outcome["errors"] for outcome in outcomes),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=8, help="Funnel runs per scenario.")
+    parser.add_argument("--content-counts", type=int, nargs="+", default=[3, 10])
+    parser.add_argument("--doc-pages", type=int, nargs="+", default=[0, 20], help="Pages of the generated context PDF.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Funnel runs in flight at once.")
+    parser.add_argument("--max-requests", type=int, default=16, help="Global cap on simultaneous OpenAI requests.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock seconds before each response.")
+    parser.add_argument("--seconds-per-token", type=float, default=0.0, help="Mock generation time per completion token.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock responses that are HTTP 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of mock responses that are HTTP 429.")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Fraction of mock ads dropped or made invalid.")
+    parser.add_argument("--shard-size", type=int, nargs="+", default=[5],
+                        help="Max variations per request (0 = one request per funnel stage).")
+    parser.add_argument("--stream", action="store_true", help="Stream ad responses.")
+    parser.add_argument("--output", help="Append one JSON line per scenario to this file.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_scenario(json.loads(args.child))
+        return
+
+    server = MockOpenAIServer(latency_seconds=args.latency, seconds_per_token=args.seconds_per_token,
+                              error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                              invalid_rate=args.invalid_rate).start()
+    mock_settings = dict(latency=args.latency, seconds_per_token=args.seconds_per_token,
+                         error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, invalid_rate=args.invalid_rate)
+    print(f"{'count':>5} {'shard':>5} {'pages':>5} {'conc':>4}   {'p50':>7} {'p95':>7}   {'runs/min':>8}   {'RSS MB':>7}   errors")
+    try:
+        for content_count, shard_size, doc_pages, concurrency in itertools.product(
+                args.content_counts, args.shard_size, args.doc_pages, args.concurrency):
+            scenario = dict(content_count=content_count, shard_size=shard_size, doc_pages=doc_pages, concurrency=max(1, concurrency),
+                            runs=args.runs, max_requests=args.max_requests, stream=args.stream, base_url=server.base_url)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_pipeline", "--child", json.dumps(scenario)],
+                check=True, capture_output=True, text=True,
+            ).stdout.strip().splitlines()[-1]
+            result = dict(json.loads(output), content_count=content_count, shard_size=shard_size, doc_pages=doc_pages,
+                          concurrency=concurrency, runs=args.runs)
+            print(f"{content_count:>5} {shard_size:>5} {doc_pages:>5} {concurrency:>4}   {result['p50_seconds']:6.2f}s {result['p95_seconds']:6.2f}s"
+                  f"   {result['runs_per_minute']:8.1f}   {result['peak_rss_mb']:7.1f}   {result['generation_errors']}")
+            if args.output:
+                with open(args.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(dict(result, timestamp=time.time(), mock=mock_settings)) + "\n")
+    finally:
+        server.stop()
+    print(f"Mock server: {server.stats['requests']} requests, {server.stats['rate_limited']} rate limited (429), "
+          f"{server.stats['errors']} server errors (500).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Site crawl time against the local fixture site: the old single-page fetch, a cold crawl, and a
+warm re-crawl that revalidates every page against the HTTP cache (304 Not Modified).
+Usage:  python -m benchmarks.bench_site_crawler --pages 20 --latency 0.05
+"""
+import argparse
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fixture_site_server import FixtureSiteServer
+from modules.context_extraction import html_to_text
+from modules.site_crawler import SiteCrawler, HttpCache
+
+
+def single_page(url: str) -> int:
+    """The previous extract_text_from_url: one blocking GET of the homepage."""
+    response = httpx.get(url, timeout=10)
+    response.raise_for_status()
+    return len(html_to_text(response.content))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20, help="Pages on the fixture site.")
+    parser.add_argument("--max-pages", type=int, default=8, help="Crawl page budget.")
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="Server seconds per 200 response.")
+    args = parser.parse_args()
+
+    server = FixtureSiteServer(page_count=args.pages, latency_seconds=args.latency).start()
+    try:
+        start = time.perf_counter()
+        chars = single_page(server.base_url)
+        print(f"{'single page':<12} {time.perf_counter() - start:6.2f} s   1 page    {chars:7d} chars")
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            crawler = SiteCrawler(max_depth=args.depth, max_pages=args.max_pages, cache=HttpCache(cache_dir))
+            for label in ("cold crawl", "warm crawl"):
+                before = server.not_modified_count
+                result = crawler.crawl(server.base_url)
+                chars = sum(len(html_to_text(page.html)) for page in result.pages)
+                print(f"{label:<12} {result.stats['seconds']:6.2f} s   {len(result.pages)} pages   {chars:7d} chars   "
+                      f"{server.not_modified_count - before} x 304")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
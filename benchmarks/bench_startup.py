@@ -0,0 +1,102 @@
+"""
+Cold-start and rerun latency of the Streamlit app, plus an import-time profile.
+Each sample runs app.py headlessly (streamlit.testing AppTest) in a fresh interpreter and times:
+  process    interpreter start to the end of the first script run, measured by this process
+  first run  the first script run (imports of the app's modules included)
+  rerun      a script rerun after typing into a text box, as on every user interaction
+One more child runs under -X importtime; the slowest imports (cumulative) are listed, followed by
+the heavy dependencies that were loaded just to render the form (ideally none).
+Usage:  python -m benchmarks.bench_startup --samples 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+# Only needed once the user generates something; rendering the form should not import them
+HEAVY_MODULES = ["openai", "httpx", "pdfplumber", "pdfminer", "pptx", "docx", "openpyxl", "bs4", "lxml", "tiktoken"]
+
+
+def _child(reruns: int) -> None:
+    """Child process entry point: renders the app, reruns it and prints a JSON result line."""
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=60)
+    app.secrets["OPENAI_API_KEY"] = "bench"
+    first_start = time.perf_counter()
+    app.run()
+    first_run = time.perf_counter() - first_start
+    rerun_times = []
+    for i in range(reruns):
+        rerun_start = time.perf_counter()
+        app.text_input(key="company_name").input(f"Bench Co {i}").run()
+        rerun_times.append(time.perf_counter() - rerun_start)
+    print(json.dumps({
+        "startup_seconds": first_start - start, "first_run_seconds": first_run,
+        "rerun_seconds": statistics.median(rerun_times) if rerun_times else None,
+        "exceptions": [str(e.value) for e in app.exception],
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def _run_child(reruns: int, importtime: bool = False) -> Tuple[Dict, float, str]:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + \
+              ["-m", "benchmarks.bench_startup", "--child", str(reruns)]
+    start = time.perf_counter()
+    completed = subprocess.run(command, check=True, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    return json.loads(completed.stdout.strip().splitlines()[-1]), elapsed, completed.stderr
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for every line of -X importtime output."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name[1:].rstrip(), int(self_us), int(cumulative_us))) # Drop the separator space
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5, help="Fresh interpreters to time.")
+    parser.add_argument("--reruns", type=int, default=5, help="Reruns timed per sample.")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list.")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        _child(args.child)
+        return
+
+    samples = [_run_child(args.reruns) for _ in range(args.samples)]
+    results = [result for result, _, _ in samples]
+    if results[0]["exceptions"]:
+        print(f"App raised: {results[0]['exceptions']}")
+
+    def median_ms(values: List[float]) -> str:
+        return f"{statistics.median(values) * 1000:8.1f} ms"
+
+    print(f"process    {median_ms([elapsed for _, elapsed, _ in samples])}   (median of {args.samples})")
+    print(f"first run  {median_ms([r['first_run_seconds'] for r in results])}")
+    print(f"rerun      {median_ms([r['rerun_seconds'] for r in results])}")
+
+    result, _, stderr = _run_child(0, importtime=True)
+    imports = parse_importtime(stderr)
+    top_level = [entry for entry in imports if not entry[0].startswith(" ")] # Indented names are nested imports
+    print(f"\nSlowest top-level imports ({len(imports)} modules, {sum(e[1] for e in imports) / 1000:.0f} ms in total):")
+    for name, _, cumulative_us in sorted(top_level, key=lambda entry: -entry[2])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    print(f"\nHeavy dependencies loaded to render the form: {', '.join(result['heavy_modules']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
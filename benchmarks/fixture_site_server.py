@@ -0,0 +1,119 @@
+"""
+Local website fixture for the site crawler: a homepage linking to N pages (each linking onward),
+served with ETag and Last-Modified so conditional requests get 304 Not Modified.
+Run standalone with:  python -m benchmarks.fixture_site_server --port 8766 --pages 20
+"""
+import argparse
+import hashlib
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+PARAGRAPH = ("Acme helps revenue teams qualify leads faster with automated research, "
+             "enrichment and routing that plugs into the CRM they already use. ")
+
+
+def build_site(page_count: int, paragraphs: int = 20) -> Dict[str, bytes]:
+    """Path -> HTML. The homepage links to every page; page i links to page i + 1 and back home."""
+    site = {}
+    nav = "".join(f'<a href="/page-{i}">Page {i}</a> ' for i in range(page_count))
+    site["/"] = (f"<html><head><title>Home</title><style>body{{}}</style></head><body>"
+                 f"<nav>{nav}</nav><p>Welcome to Acme.</p>{'<p>' + PARAGRAPH * paragraphs + '</p>'}"
+                 f'<a href="mailto:hi@example.com">Mail</a><a href="https://elsewhere.example/">Out</a>'
+                 f'<a href="/brochure.pdf">Brochure</a></body></html>').encode("utf-8")
+    for i in range(page_count):
+        site[f"/page-{i}"] = (f"<html><body><h1>Page {i}</h1><p>{PARAGRAPH * paragraphs}</p>"
+                              f'<a href="/page-{i + 1}#top">Next</a> <a href="/">Home</a>'
+                              f"<script>var x = {i};</script></body></html>").encode("utf-8")
+    site["/robots.txt"] = b"User-agent: *\nDisallow: /private\n"
+    return site
+
+
+class FixtureSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output clean
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        path = self.path.split("?")[0]
+        body = server.site.get(path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if server.latency_seconds:
+            time.sleep(server.latency_seconds)
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            with server.lock:
+                server.not_modified_count += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        content_type = "text/plain" if path.endswith(".txt") else "text/html; charset=utf-8"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", server.last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FixtureSiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, page_count: int = 20, latency_seconds: float = 0.0):
+        super().__init__((host, port), FixtureSiteHandler)
+        self.site = build_site(page_count)
+        self.latency_seconds = latency_seconds
+        self.last_modified = formatdate(time.time(), usegmt=True)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.not_modified_count = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FixtureSiteServer":
+        """Serves requests on a background thread and returns self."""
+        self._thread = threading.Thread(target=self.serve_forever, name="fixture-site", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local website fixture with ETag / Last-Modified support.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each 200 response.")
+    args = parser.parse_args()
+    server = FixtureSiteServer(args.host, args.port, args.pages, args.latency)
+    print(f"Fixture site listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
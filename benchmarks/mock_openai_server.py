@@ -0,0 +1,418 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, used by the benchmarks.
+Ad prompts (final message starting "Channel: <name>.") get schema-valid "ads" JSON for that
+channel: the requested number of ads with every column of the channel, Google length limits
+respected, unless --invalid-rate breaks some of them (dropped, missing a field or over a limit).
+Repair requests for invalid items ("exactly N replacement ads") get N fresh ads for the original
+prompt. Anything else (summaries) gets plain text. Latency, a per-token generation delay,
+server errors (500) and rate limits (429 with Retry-After) are configurable.
+The Batch API is mocked too: POST /files (purpose "batch"), POST /batches, GET /batches/{id} and
+GET /files/{id}/content. A batch completes --batch-seconds after it is created; --error-rate
+moves that fraction of its requests to the error file.
+Run standalone with:  python -m benchmarks.mock_openai_server --port 8765 --latency 0.5 --rate-limit-rate 0.05
+then point the app at it with OPENAI_BASE_URL = "http://127.0.0.1:8765/v1".
+"""
+import argparse
+import email.parser
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from modules import channels
+
+WORDS = ("pipeline revenue automate onboarding teams customers platform insights workflow integrate "
+         "secure scale analytics growth demo results trusted partners enterprise faster simple").split()
+# Character limits the Google channels enforce; other fields get text sized to the channel's token estimate
+FIELD_LIMITS = {"Headline": 30, "Description": 90}
+
+_CHANNEL_PATTERN = re.compile(r"^Channel: ([^.\n]+)\.", re.MULTILINE)
+_STAGE_PATTERN = re.compile(r"Funnel Stage: ([A-Za-z ]+?)\s*(?:\(|\n|$)")
+_COUNT_PATTERN = re.compile(r"exactly (\d+)")
+_REPAIR_PATTERN = re.compile(r"exactly (\d+) replacement ads")
+_DESTINATION_PATTERN = re.compile(r"(?:Destination Link|Booking Link \(for CTA\)): ?(\S*)")
+_CTA_PATTERN = re.compile(r"CTA Button Text: ([^\n]+)")
+
+
+def _usage(request: Dict[str, Any], content: str, cached_tokens: int = 0) -> Dict[str, Any]:
+    """Token counts at ~4 characters per token, in the shape of the real usage field."""
+    prompt_tokens = sum(len(m.get("content") or "") for m in request.get("messages", [])) // 4 + 1
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+
+def _completion_body(model: str, content: str, usage: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage or {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+    }
+
+
+def _text(rng: random.Random, max_chars: int) -> str:
+    """Random marketing words, at most max_chars long."""
+    words: List[str] = []
+    length = -1
+    while True:
+        word = rng.choice(WORDS)
+        if length + len(word) + 1 > max_chars:
+            break
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words).capitalize()
+
+
+def mock_ads(prompt: str, rng: random.Random, count: Optional[int] = None) -> Optional[List[Dict[str, str]]]:
+    """Ads matching the channel named in an ad prompt (count overrides its "exactly N"), or None for non-ad prompts."""
+    match = _CHANNEL_PATTERN.search(prompt)
+    spec = channels.get_channel(match.group(1).strip()) if match else None
+    if spec is None:
+        return None
+    count_match = _COUNT_PATTERN.search(prompt)
+    if count is None:
+        count = int(count_match.group(1)) if count_match else spec.expected_count(3)
+    stage_match = _STAGE_PATTERN.search(prompt)
+    stage = stage_match.group(1).strip() if stage_match else ""
+    destination_match = _DESTINATION_PATTERN.search(prompt)
+    cta_match = _CTA_PATTERN.search(prompt)
+    # Free-text fields share the channel's expected output size (~4 characters per token)
+    text_columns = [c for c in spec.columns if c not in FIELD_LIMITS and c not in ("Ad Name", "Funnel Stage")]
+    field_chars = max(20, spec.output_tokens_per_item * 4 // max(1, len(text_columns)))
+
+    ads = []
+    for i in range(1, count + 1):
+        ad = {}
+        for column in spec.columns:
+            if column == "Ad Name":
+                ad[column] = f"{spec.name.replace(' ', '')}_{stage.replace(' ', '')}_Ver_{i}"
+            elif column == "Funnel Stage":
+                ad[column] = stage
+            elif column == "Destination":
+                ad[column] = destination_match.group(1) if destination_match else ""
+            elif column in ("CTA Button", "CTA") and cta_match:
+                ad[column] = cta_match.group(1).strip()
+            elif column in FIELD_LIMITS:
+                ad[column] = _text(rng, FIELD_LIMITS[column])
+            else:
+                ad[column] = _text(rng, field_chars)
+        if spec.name == "Google Search" and i > 4:
+            ad["Description"] = "" # Only the first 4 headlines get descriptions
+        ads.append(ad)
+    return ads
+
+
+def break_ads(ads: List[Dict[str, str]], rng: random.Random, invalid_rate: float) -> List[Dict[str, str]]:
+    """Drops or damages each ad with probability invalid_rate, as a real model occasionally does."""
+    broken = []
+    for ad in ads:
+        if rng.random() >= invalid_rate:
+            broken.append(ad)
+            continue
+        fault = rng.choice(("drop", "missing", "too_long"))
+        if fault == "missing":
+            ad = dict(ad)
+            ad.pop(rng.choice([column for column in ad if column not in ("Ad Name", "Destination")] or list(ad)), None)
+        elif fault == "too_long":
+            ad = dict(ad, Headline=_text(rng, 60) + " " + _text(rng, 60))
+        if fault != "drop":
+            broken.append(ad)
+    return broken
+
+
+def mock_content(request: Dict[str, Any], rng: random.Random, invalid_rate: float = 0.0) -> str:
+    """Response content for a chat request: ads JSON for ad prompts, a short summary otherwise."""
+    messages = request.get("messages") or [{}]
+    prompt = messages[-1].get("content") or ""
+    repair = _REPAIR_PATTERN.search(prompt)
+    if repair and len(messages) >= 3:
+        # Follow-up for invalid items: fresh ads for the original prompt (before the previous answer)
+        ads = mock_ads(messages[-3].get("content") or "", rng, count=int(repair.group(1)))
+    else:
+        ads = mock_ads(prompt, rng)
+    if ads is not None:
+        return json.dumps({"ads": break_ads(ads, rng, invalid_rate)})
+    return " ".join(_text(rng, 120) + "." for _ in range(8))
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; avoid Nagle/delayed-ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output clean
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_bytes(self, data: bytes, content_type: str = "application/octet-stream") -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self) -> None:
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def do_GET(self):
+        server = self.server
+        parts = self.path.rstrip("/").split("/")
+        if len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in server.batches:
+            self._send_json(200, server.batches[parts[-1]])
+        elif len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content" and parts[-2] in server.files:
+            self._send_bytes(server.files[parts[-2]]["data"])
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.path.endswith("/files"):
+            self._send_json(200, self.server.upload_file(self.headers.get("Content-Type", ""), body))
+            return
+        request = json.loads(body or b"{}")
+        if self.path.endswith("/batches"):
+            if request.get("input_file_id") not in self.server.files:
+                self._send_json(400, {"error": {"message": "Unknown input_file_id", "type": "invalid_request_error"}})
+                return
+            self._send_json(200, self.server.create_batch(request))
+            return
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        server = self.server
+        fault = server.draw_fault()
+        if fault == "rate_limit":
+            self._send_json(429, {"error": {"message": "Rate limit reached (mock).", "type": "requests",
+                                            "code": "rate_limit_exceeded"}},
+                            headers={"retry-after-ms": str(int(server.retry_after_seconds * 1000))})
+            return
+        if server.latency_seconds:
+            time.sleep(server.latency_seconds)
+        if fault == "error":
+            self._send_json(500, {"error": {"message": "The server had an error (mock).", "type": "server_error"}})
+            return
+        content = server.content_for(request)
+        usage = _usage(request, content, server.cached_prefix_tokens(request))
+        if server.seconds_per_token:
+            time.sleep(usage["completion_tokens"] * server.seconds_per_token)
+        if request.get("stream"):
+            self._send_stream(request.get("model", "mock"), content, usage)
+        else:
+            self._send_json(200, _completion_body(request.get("model", "mock"), content, usage))
+
+    def _send_stream(self, model: str, content: str, usage: Dict[str, Any], chunk_chars: int = 16) -> None:
+        """Server-sent events in the chat.completion.chunk format, ending with a usage chunk and [DONE]."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data: str) -> None:
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n" % len(payload) + payload + b"\r\n")
+
+        base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        for i in range(0, len(content), chunk_chars):
+            delta = {"content": content[i:i + chunk_chars]}
+            if i == 0:
+                delta["role"] = "assistant"
+            send_event(json.dumps(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])))
+        send_event(json.dumps(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])))
+        send_event(json.dumps(dict(base, choices=[], usage=usage)))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_seconds: float = 0.0,
+                 seconds_per_token: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after_seconds: float = 0.05, seed: Optional[int] = 0, invalid_rate: float = 0.0,
+                 batch_seconds: float = 0.5):
+        """
+        latency_seconds: wait before every response (time to first token).
+        seconds_per_token: extra wait per completion token (generation time).
+        error_rate / rate_limit_rate: fraction of requests answered with 500 / 429.
+        retry_after_seconds: Retry-After sent with each 429.
+        invalid_rate: fraction of generated ads that are dropped or fail validation.
+        batch_seconds: time from creating a batch to its completion.
+        """
+        super().__init__((host, port), MockOpenAIHandler)
+        self.latency_seconds = latency_seconds
+        self.seconds_per_token = seconds_per_token
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.invalid_rate = invalid_rate
+        self.batch_seconds = batch_seconds
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "batches": 0, "batch_requests": 0}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._seen_prefixes = set()
+        self._prefix_lock = threading.Lock()
+
+    def draw_fault(self) -> Optional[str]:
+        """Counts the request and decides whether to fail it: "rate_limit", "error" or None."""
+        with self._lock:
+            self.stats["requests"] += 1
+            draw = self._rng.random()
+            if draw < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return "rate_limit"
+            if draw < self.rate_limit_rate + self.error_rate:
+                self.stats["errors"] += 1
+                return "error"
+        return None
+
+    def content_for(self, request: Dict[str, Any]) -> str:
+        with self._lock:
+            rng = random.Random(self._rng.random())
+        return mock_content(request, rng, self.invalid_rate)
+
+    def _store_file(self, name: str, data: bytes, purpose: str) -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        self.files[file_id] = {"data": data, "object": {
+            "id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+            "filename": name, "purpose": purpose, "status": "processed",
+        }}
+        return self.files[file_id]["object"]
+
+    def upload_file(self, content_type: str, body: bytes) -> Dict[str, Any]:
+        """Stores a multipart/form-data upload (fields "file" and "purpose") and returns its file object."""
+        message = email.parser.BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        fields = {part.get_param("name", header="content-disposition"): part for part in message.get_payload()}
+        upload = fields["file"]
+        purpose = fields["purpose"].get_payload(decode=True).decode() if "purpose" in fields else "batch"
+        return self._store_file(upload.get_filename() or "upload.jsonl", upload.get_payload(decode=True), purpose)
+
+    def create_batch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Registers a batch and completes it on a background thread after batch_seconds."""
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        lines = [json.loads(line) for line in self.files[request["input_file_id"]]["data"].decode("utf-8").splitlines()
+                 if line.strip()]
+        self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": request.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": request["input_file_id"], "completion_window": request.get("completion_window", "24h"),
+            "status": "validating", "created_at": int(time.time()), "output_file_id": None, "error_file_id": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0}, "metadata": request.get("metadata"),
+        }
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["batch_requests"] += len(lines)
+        threading.Thread(target=self._run_batch, args=(batch_id, lines), daemon=True).start()
+        return self.batches[batch_id]
+
+    def _run_batch(self, batch_id: str, lines: List[Dict[str, Any]]) -> None:
+        batch = self.batches[batch_id]
+        batch["status"] = "in_progress"
+        time.sleep(self.batch_seconds)
+        outputs, errors = [], []
+        for line in lines:
+            request = line["body"]
+            with self._lock:
+                failed = self._rng.random() < self.error_rate
+            if failed:
+                errors.append({"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": line["custom_id"], "error": None,
+                               "response": {"status_code": 500, "request_id": uuid.uuid4().hex,
+                                            "body": {"error": {"message": "The server had an error (mock).",
+                                                               "type": "server_error"}}}})
+                continue
+            content = self.content_for(request)
+            body = _completion_body(request.get("model", "mock"), content, _usage(request, content))
+            outputs.append({"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": line["custom_id"], "error": None,
+                            "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": body}})
+
+        def jsonl(items: List[Dict[str, Any]]) -> bytes:
+            return "".join(json.dumps(item) + "\n" for item in items).encode("utf-8")
+        if outputs:
+            batch["output_file_id"] = self._store_file(f"{batch_id}_output.jsonl", jsonl(outputs), "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self._store_file(f"{batch_id}_errors.jsonl", jsonl(errors), "batch_output")["id"]
+        batch["request_counts"] = {"total": len(lines), "completed": len(outputs), "failed": len(errors)}
+        batch["status"] = "completed"
+
+    def cached_prefix_tokens(self, request: Dict[str, Any]) -> int:
+        """
+        Mimics OpenAI prompt caching: everything before the last message counts as cached once it
+        has been seen before, if it is at least 1024 tokens (rounded down to 128-token steps).
+        """
+        prefix = json.dumps(request.get("messages", [])[:-1], sort_keys=True)
+        tokens = len(prefix) // 4
+        with self._prefix_lock:
+            seen = prefix in self._seen_prefixes
+            self._seen_prefixes.add(prefix)
+        return tokens // 128 * 128 if seen and tokens >= 1024 else 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        """Serves requests on a background thread and returns self."""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response.")
+    parser.add_argument("--seconds-per-token", type=float, default=0.0, help="Extra wait per completion token.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429.")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After seconds sent with each 429.")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Fraction of ads dropped or made invalid.")
+    parser.add_argument("--batch-seconds", type=float, default=5.0, help="Time for a batch to complete.")
+    args = parser.parse_args()
+    server = MockOpenAIServer(args.host, args.port, args.latency, seconds_per_token=args.seconds_per_token,
+                              error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                              retry_after_seconds=args.retry_after, seed=None, invalid_rate=args.invalid_rate,
+                              batch_seconds=args.batch_seconds)
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Callable, Optional, Tuple, TYPE_CHECKING
+
+from .openai_client import get_openai_client, create_chat_completion
+from .openai_batch import BatchDeferred
+from .json_stream import AdsStreamParser
+from . import ad_validation, channels, telemetry
+
+if TYPE_CHECKING:
+    from openai import OpenAI # openai itself is imported on the first request (see openai_client)
+
+AD_RESPONSE_FORMAT = {"type": "json_object"}
+
+# Default cap on simultaneous OpenAI requests across all channels: every request of a run at once, up to
+# content_count 20 with the default shard size (pipeline.DEFAULT_SHARD_SIZE). The rate limiter still
+# enforces the model's RPM/TPM budgets.
+DEFAULT_MAX_CONCURRENCY = 32
+
+
+def _placeholder_ads(channel_name: str, ad_name: str, label: str, component_label: str) -> List[Dict[str, Any]]:
+    """Placeholder row(s) for a call that returned unusable content, as laid out by the channel registry."""
+    spec = channels.get_channel(channel_name)
+    if spec is None:
+        return [{"Ad Name": ad_name, "Headline": label}]
+    return spec.placeholder_ads(ad_name, label, component_label)
+
+
+def add_usage(totals: Dict[str, Any], completion: Dict[str, Any], seconds: float = 0.0) -> None:
+    """
+    Accumulates the usage of a create_chat_completion result: prompt/completion tokens, prompt tokens
+    served from the provider's prefix cache (cached_tokens), and call latency split by whether the
+    prefix cache was hit. Answers from the local completion cache are only counted (cached_calls).
+    """
+    if completion.get("cached"):
+        totals["cached_calls"] = totals.get("cached_calls", 0) + 1
+        return
+    call_usage = completion.get("usage") or {}
+    totals["calls"] = totals.get("calls", 0) + 1
+    for key in ("prompt_tokens", "completion_tokens"):
+        totals[key] = totals.get(key, 0) + int(call_usage.get(key) or 0)
+    cached_tokens = int((call_usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0)
+    totals["cached_tokens"] = totals.get("cached_tokens", 0) + cached_tokens
+    outcome = "prefix_hit" if cached_tokens else "prefix_miss"
+    totals[f"{outcome}_calls"] = totals.get(f"{outcome}_calls", 0) + 1
+    totals[f"{outcome}_seconds"] = totals.get(f"{outcome}_seconds", 0.0) + seconds
+
+
+def prefix_cache_summary(usage: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """
+    Hit rate (share of prompt tokens served from the provider's prefix cache) and the latency saved,
+    estimated as (mean miss latency - mean hit latency) x hit calls. None when there is nothing to compare.
+    """
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    hit_calls, miss_calls = usage.get("prefix_hit_calls", 0), usage.get("prefix_miss_calls", 0)
+    seconds_saved = None
+    if hit_calls and miss_calls:
+        mean_hit = usage["prefix_hit_seconds"] / hit_calls
+        mean_miss = usage["prefix_miss_seconds"] / miss_calls
+        seconds_saved = (mean_miss - mean_hit) * hit_calls
+    return {
+        "hit_rate": usage.get("cached_tokens", 0) / prompt_tokens if prompt_tokens else None,
+        "seconds_saved": seconds_saved,
+    }
+
+
+def _parse_ads(content: str) -> Tuple[Optional[List[Any]], Optional[str]]:
+    """(ads, None) for a {"ads": [...]} response, else (None, "json: <error>") or (None, "structure")."""
+    try:
+        json_data = json.loads(content)
+    except json.JSONDecodeError as e:
+        return None, f"json: {e}"
+    if isinstance(json_data, dict) and isinstance(json_data.get("ads"), list):
+        return json_data["ads"], None
+    return None, "structure"
+
+
+def request_ads(client: "OpenAI", model_name: str, messages: List[Dict[str, str]],
+                channel_name: str, call_number: int, use_cache: bool = True,
+                on_ad: Optional[Callable[[Dict[str, Any]], None]] = None,
+                usage: Optional[Dict[str, int]] = None,
+                expected_count: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Runs a single ad generation call and returns (ads, error_messages).
+    With on_ad, the response is streamed and on_ad receives each ad as soon as its JSON object closes.
+    With usage, the call's token usage is added to it (see add_usage).
+    With expected_count, the ads are validated against the channel's rules (see ad_validation) and
+    only the missing or invalid items are requested again, up to MAX_REPAIR_ROUNDS follow-ups;
+    items still invalid after that are returned as they are and reported in error_messages.
+    Streamed ads are then only passed to on_ad once they pass validation, so the live preview never
+    shows an ad that the repair rounds replace: invalid items follow once repaired (or given up on).
+    Safe to call from worker threads: it never touches Streamlit, errors are returned to the caller.
+    """
+    import openai
+
+    errors: List[str] = []
+    spec = channels.get_channel(channel_name)
+    validate = spec is not None and expected_count is not None
+    on_delta = None
+    streamed: List[int] = []  # Slots already passed to on_ad
+    if on_ad is not None:
+        parser = AdsStreamParser()
+
+        def on_delta(delta: str) -> None:
+            for position, ad in parser.feed(delta):
+                if not validate:
+                    on_ad(ad)
+                elif position < expected_count and not ad_validation.item_problems(spec, ad, position):
+                    streamed.append(position)
+                    on_ad(ad)
+    try:
+        call_started_at = time.perf_counter()
+        completion = create_chat_completion(
+            client, model_name, messages,
+            response_format=AD_RESPONSE_FORMAT, # Requires newer models
+            use_cache=use_cache,
+            on_delta=on_delta
+        )
+        content = completion["content"]
+        if usage is not None:
+            add_usage(usage, completion, time.perf_counter() - call_started_at)
+        ads, parse_error = _parse_ads(content)
+
+        if validate:
+            check = ad_validation.validate_ads(spec, ads or [], expected_count)
+            repair_rounds = 0
+            while check.problems and repair_rounds < ad_validation.MAX_REPAIR_ROUNDS:
+                repair_rounds += 1
+                repair_started_at = time.perf_counter()
+                repair = create_chat_completion(
+                    client, model_name, ad_validation.repair_messages(spec, messages, content, check),
+                    response_format=AD_RESPONSE_FORMAT, use_cache=use_cache
+                )
+                if usage is not None:
+                    add_usage(usage, repair, time.perf_counter() - repair_started_at)
+                replacements, _ = _parse_ads(repair["content"])
+                ad_validation.apply_replacements(spec, check, replacements or [])
+            span = telemetry.current_span()
+            if span is not None and repair_rounds:
+                span.set(repair_rounds=repair_rounds, invalid_items=len(check.problems))
+            if ads is not None or check.final_ads():
+                if on_ad is not None:
+                    for index, ad in enumerate(check.ads):
+                        if ad is not None and index not in streamed:
+                            on_ad(ad) # Repaired, or invalid after the last round
+                errors.extend(check.error_messages(channel_name, call_number))
+                return check.final_ads(), errors
+
+        if parse_error and parse_error.startswith("json: "):
+            errors.append(f"Failed to parse JSON for {channel_name} (API Call {call_number}): {parse_error[6:]}. Response: {content[:300]}...")
+            return _placeholder_ads(channel_name, f"JSONError_{channel_name}_Call_{call_number}", "JSON Parse Error", "JSON Parse Error"), errors
+        if parse_error:
+            errors.append(f"Unexpected JSON structure for {channel_name} (API Call {call_number}). Expected 'ads' list. Got: {content[:300]}...")
+            return _placeholder_ads(channel_name, f"StructError_{channel_name}_Call_{call_number}", "Generation Error", "JSON Structure Error"), errors
+        return ads, errors
+
+    except (openai.AuthenticationError, BatchDeferred):
+        raise # Handled by the caller, which stops the remaining calls (or reruns them after the batch)
+    except openai.RateLimitError:
+        errors.append(f"OpenAI API rate limit still exceeded after retrying during {channel_name} generation (API Call {call_number}). Try again later.")
+        return [{"Ad Name": f"RateLimitError_{channel_name}", "Headline": "Rate Limit Exceeded"}], errors
+    except openai.APIConnectionError as e:
+        errors.append(f"OpenAI API connection error for {channel_name} (API Call {call_number}): {e}")
+        return [{"Ad Name": f"ConnectionError_{channel_name}", "Headline": "API Connection Error"}], errors
+    except openai.BadRequestError as e:
+        errors.append(f"OpenAI Invalid Request for {channel_name} (API Call {call_number}): {e}. This might be due to prompt issues or model limitations.")
+        return [{"Ad Name": f"InvalidRequest_{channel_name}", "Headline": "Invalid Request to OpenAI"}], errors
+    except openai.APIStatusError as e:
+        errors.append(f"OpenAI API error for {channel_name} (API Call {call_number}): Status {e.status_code}, Response: {e.response}")
+        return [{"Ad Name": f"APIStatusError_{channel_name}", "Headline": f"API Error {e.status_code}"}], errors
+    except Exception as e:
+        errors.append(f"An unexpected error occurred calling OpenAI for {channel_name} (API Call {call_number}): {e}")
+        return [{"Ad Name": f"UnexpectedError_{channel_name}", "Headline": "Unexpected OpenAI Error"}], errors
+
+
+def merge_call_ads(call_ads: Dict[str, List[Optional[List[Dict[str, Any]]]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Flattens per-call ads (channel -> one list per API call) into all_ad_data: ads keep the order of
+    their calls, channels follow registry order (unregistered channels follow in insertion order).
+    """
+    ordered_channels = [c for c in channels.CHANNELS if c in call_ads] + [c for c in call_ads if c not in channels.CHANNELS]
+    all_ad_data: Dict[str, List[Dict[str, Any]]] = {}
+    for channel_name in ordered_channels:
+        channel_ads: List[Dict[str, Any]] = []
+        for ads in call_ads[channel_name]:
+            # Collapse repeated auth markers so a channel reports the failure once, as before
+            if ads and ads[0].get("Ad Name") == f"AuthError_{channel_name}" and any(
+                    a.get("Ad Name") == f"AuthError_{channel_name}" for a in channel_ads):
+                continue
+            channel_ads.extend(ads or [])
+        all_ad_data[channel_name] = channel_ads
+    return all_ad_data
+
+
+def generate_calls(api_key: str, model_name: str,
+                   channel_message_sets: Dict[str, List[List[Dict[str, str]]]],
+                   max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                   progress_callback: Optional[Callable[[str, int, int], None]] = None,
+                   base_url: Optional[str] = None,
+                   use_cache: bool = True,
+                   stream: bool = False,
+                   ad_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                   expected_counts: Optional[Dict[str, Any]] = None
+                   ) -> Tuple[Dict[str, List[List[Dict[str, Any]]]], Dict[str, List[List[str]]], Dict[str, Any]]:
+    """
+    Same as generate_ads_concurrently, but keeps each API call's result separate:
+    returns (call_ads, call_errors, metrics), where call_ads[channel][i] and call_errors[channel][i]
+    belong to the channel's i-th message set. An expected_counts value may also be a list with
+    one count per message set (shards of different sizes).
+    """
+    import openai
+
+    client = get_openai_client(api_key, base_url)
+    auth_failed = threading.Event()
+    results: Dict[str, List[Optional[List[Dict[str, Any]]]]] = {
+        channel: [None] * len(message_sets) for channel, message_sets in channel_message_sets.items()
+    }
+    result_errors: Dict[str, List[List[str]]] = {
+        channel: [[] for _ in message_sets] for channel, message_sets in channel_message_sets.items()
+    }
+    completed = {channel: 0 for channel in channel_message_sets}
+    usage: Dict[str, Any] = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cached_calls": 0}
+    started_at = time.perf_counter()
+    first_ad_at: Dict[str, float] = {}
+    # Streamed ads are handed from the worker threads to the calling (script) thread through this queue
+    streamed_ads: "queue.Queue[Tuple[str, Dict[str, Any], float]]" = queue.Queue()
+
+    def expected_count(channel_name: str, call_index: int) -> Optional[int]:
+        expected = (expected_counts or {}).get(channel_name)
+        return expected[call_index] if isinstance(expected, list) else expected
+
+    def run_call(channel_name: str, call_number: int, messages: List[Dict[str, str]]):
+        call_usage: Dict[str, Any] = {}
+        if auth_failed.is_set():
+            return [{"Ad Name": f"AuthError_{channel_name}", "Headline": "OpenAI Auth Failed"}], [], call_usage
+        on_ad = None
+        if stream:
+            on_ad = lambda ad: streamed_ads.put((channel_name, ad, time.perf_counter()))
+        try:
+            with telemetry.span("ads.request", channel=channel_name, call=f"{channel_name} #{call_number}") as span:
+                ads, call_errors = request_ads(client, model_name, messages, channel_name, call_number, use_cache,
+                                               on_ad, usage=call_usage,
+                                               expected_count=expected_count(channel_name, call_number - 1))
+                if span is not None:
+                    span.set(ads=len(ads), failed=bool(call_errors))
+            return ads, call_errors, call_usage
+        except openai.AuthenticationError:
+            # Same key for every channel: skip the calls that have not started yet
+            auth_failed.set()
+            return ([{"Ad Name": f"AuthError_{channel_name}", "Headline": "OpenAI Auth Failed"}],
+                    ["OpenAI API Key is invalid or not authorized. Halting ad generation."], call_usage)
+
+    def drain_streamed_ads() -> None:
+        while True:
+            try:
+                channel_name, ad, received_at = streamed_ads.get_nowait()
+            except queue.Empty:
+                return
+            first_ad_at.setdefault(channel_name, received_at - started_at)
+            if ad_callback:
+                ad_callback(channel_name, ad)
+
+    max_workers = max(1, min(max_concurrency, sum(len(m) for m in channel_message_sets.values()) or 1))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ad-gen") as executor:
+        futures = {}
+        for channel_name, message_sets in channel_message_sets.items():
+            for i, messages in enumerate(message_sets):
+                futures[executor.submit(telemetry.wrap(run_call), channel_name, i + 1, messages)] = (channel_name, i)
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.1 if stream else None, return_when=FIRST_COMPLETED)
+            drain_streamed_ads()
+            for future in done:
+                channel_name, i = futures[future]
+                ads, call_errors, call_usage = future.result()
+                for key, value in call_usage.items():
+                    usage[key] = usage.get(key, 0) + value
+                results[channel_name][i] = ads
+                expected = expected_count(channel_name, i)
+                if expected is not None and not call_errors and len(ads) != expected:
+                    call_errors = call_errors + [f"{channel_name} (API Call {i + 1}) returned {len(ads)} ads, expected {expected}."]
+                result_errors[channel_name][i] = call_errors
+                completed[channel_name] += 1
+                if not stream and ads:
+                    first_ad_at.setdefault(channel_name, time.perf_counter() - started_at)
+                if progress_callback:
+                    progress_callback(channel_name, completed[channel_name], len(results[channel_name]))
+        drain_streamed_ads()
+
+    metrics: Dict[str, Any] = {
+        "time_to_first_ad": dict(first_ad_at, overall=min(first_ad_at.values())) if first_ad_at else {},
+        "total_seconds": time.perf_counter() - started_at,
+        "usage": usage,
+    }
+    return results, result_errors, metrics
+
+
+def generate_ads_concurrently(api_key: str, model_name: str,
+                              channel_message_sets: Dict[str, List[List[Dict[str, str]]]],
+                              max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                              progress_callback: Optional[Callable[[str, int, int], None]] = None,
+                              base_url: Optional[str] = None,
+                              use_cache: bool = True,
+                              stream: bool = False,
+                              ad_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                              expected_counts: Optional[Dict[str, int]] = None
+                              ) -> Tuple[Dict[str, List[Dict[str, Any]]], List[str], Dict[str, Any]]:
+    """
+    Sends every message set of every channel at once through a bounded thread pool.
+    Returns (all_ad_data, error_messages, metrics). Within a channel, ads keep the order of its message sets,
+    and channels are merged in registry order (unregistered channels follow in insertion order).
+    progress_callback(channel_name, completed_calls, total_calls) is invoked on the calling thread.
+    With stream=True, ad_callback(channel_name, ad) is also invoked on the calling thread for each ad
+    as soon as it has been parsed from the streaming response.
+    expected_counts maps channel name to the number of ads each of its calls should return; with it,
+    responses are validated and their failing items re-requested (see request_ads), and calls that
+    still return a different number are reported in error_messages.
+    metrics holds "time_to_first_ad" (seconds from start, per channel and "overall"), "total_seconds"
+    and "usage" (API calls, prompt and completion tokens actually billed, prompt tokens served from the
+    provider's prefix cache with per-call latency, and calls answered from the local completion cache).
+    """
+    call_ads, call_errors, metrics = generate_calls(
+        api_key, model_name, channel_message_sets, max_concurrency=max_concurrency,
+        progress_callback=progress_callback, base_url=base_url, use_cache=use_cache,
+        stream=stream, ad_callback=ad_callback, expected_counts=expected_counts
+    )
+    errors = [message for channel_errors in call_errors.values() for messages in channel_errors for message in messages]
+    # Deduplicate identical auth messages coming from several calls
+    return merge_call_ads(call_ads), list(dict.fromkeys(errors)), metrics
@@ -0,0 +1,119 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# Checks ad responses against their channel's rules (count, required fields, character limits,
+# see channels.ChannelSpec) and builds follow-up requests that ask only for the failing items.
+
+MAX_REPAIR_ROUNDS = 2  # Follow-up requests per API call before invalid items are shipped as they are
+
+
+@dataclass
+class AdCheck:
+    """Validation state of one call's ads: one slot per expected ad (None = not returned yet)."""
+    ads: List[Optional[Dict[str, Any]]]
+    problems: Dict[int, List[str]] = field(default_factory=dict)  # Slot index -> what is wrong with it
+
+    def final_ads(self) -> List[Dict[str, Any]]:
+        """
+        The ads to report: valid ones and invalid ones that could not be repaired, in slot order.
+        Fields the model returned as lists or objects are flattened to text (see text_value).
+        """
+        return [{column: text_value(value) for column, value in ad.items()} for ad in self.ads if ad is not None]
+
+    def error_messages(self, channel_name: str, call_number: int) -> List[str]:
+        return [f"{channel_name} (API Call {call_number}) item {index + 1}: {'; '.join(reasons)}."
+                for index, reasons in sorted(self.problems.items())]
+
+
+def text_value(value: Any) -> Any:
+    """A field value that fits one spreadsheet cell: lists joined by newlines, objects as JSON, anything else as is."""
+    if isinstance(value, (list, tuple)):
+        return "\n".join(str(text_value(item)) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def required_fields(spec, position: int) -> List[str]:
+    """Columns the ad at position (0-based) must fill: all but optional_fields and field_rows past their rows."""
+    return [column for column in spec.columns
+            if column not in spec.optional_fields and position < spec.field_rows.get(column, position + 1)]
+
+
+def item_problems(spec, ad: Any, position: int) -> List[str]:
+    """What is wrong with the ad at position (0-based) for the channels.ChannelSpec; empty if valid."""
+    if not isinstance(ad, dict):
+        return ["not a JSON object"]
+    problems = []
+    required_columns = required_fields(spec, position)
+    for column in spec.columns:
+        value = ad.get(column)
+        if isinstance(value, (dict, list)):
+            problems.append(f"{column} must be text")
+            continue
+        text = "" if value is None else str(value).strip()
+        required = column in required_columns
+        if required and not text:
+            problems.append(f"{column} is missing")
+        limit = spec.field_limits.get(column)
+        if limit is not None and len(text) > limit:
+            problems.append(f"{column} has {len(text)} characters (limit {limit})")
+    return problems
+
+
+def validate_ads(spec, ads: List[Any], expected_count: int) -> AdCheck:
+    """Fills expected_count slots from ads (extra ads are dropped) and records every slot's problems."""
+    check = AdCheck(ads=[ad if isinstance(ad, dict) else None for ad in ads[:expected_count]])
+    check.ads.extend([None] * (expected_count - len(check.ads)))
+    for index, ad in enumerate(ads[:expected_count]):
+        problems = item_problems(spec, ad, index)
+        if problems:
+            check.problems[index] = problems
+    for index in range(len(ads), expected_count):
+        check.problems[index] = ["missing from the response"]
+    return check
+
+
+def repair_messages(spec, messages: List[Dict[str, str]], previous_content: str, check: AdCheck) -> List[Dict[str, str]]:
+    """
+    The original conversation plus the answer and a request for replacements of the failing slots
+    only. It starts with the original messages, so it reuses their cached prompt prefix. Each item
+    lists the fields it needs (required_fields, the same rule item_problems checks), since fields in
+    field_rows are only needed by some items.
+    """
+    lines = []
+    for index, reasons in sorted(check.problems.items()):
+        ad = check.ads[index]
+        name = f' (Ad Name "{ad["Ad Name"]}")' if ad and ad.get("Ad Name") else ""
+        lines.append(f"- Item {index + 1}{name}: {'; '.join(reasons)}. Needs {', '.join(required_fields(spec, index))}.")
+    rules = [f"{column} at most {limit} characters" for column, limit in spec.field_limits.items()]
+    rules += [f"leave {column} empty in items that do not list it" for column in spec.field_rows]
+    kept = [column for column in ("Ad Name", "Funnel Stage") if column in spec.columns]
+    content = (
+        f"Channel: {spec.name}. Some items in your previous answer were missing or invalid:\n" + "\n".join(lines) + "\n"
+        f"Return a JSON object with an \"ads\" list of exactly {len(check.problems)} replacement ads for these items, "
+        f"in the order listed, with the fields {json.dumps(spec.columns)}. Fill the fields each item needs"
+        + (f"; {'; '.join(rules)}" if rules else "") + "."
+        + (f" Keep each item's {' and '.join(kept)}." if kept else "")
+    )
+    return messages + [{"role": "assistant", "content": previous_content}, {"role": "user", "content": content}]
+
+
+def apply_replacements(spec, check: AdCheck, replacements: List[Any]) -> int:
+    """Puts replacements into the failing slots (in slot order) and revalidates them; returns how many were fixed."""
+    fixed = 0
+    for index, ad in zip(sorted(check.problems), replacements):
+        if not isinstance(ad, dict):
+            continue
+        problems = item_problems(spec, ad, index)
+        previous = check.ads[index]
+        if problems and previous is not None and len(problems) >= len(check.problems[index]):
+            continue  # Not better than what the slot already has
+        check.ads[index] = ad
+        if problems:
+            check.problems[index] = problems
+        else:
+            del check.problems[index]
+            fixed += 1
+    return fixed
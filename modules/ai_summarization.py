@@ -1,49 +1,184 @@
-import streamlit as st
-from openai import OpenAI
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Optional, TYPE_CHECKING
 
-# This function will be cached in app.py where it's called with specific inputs
-def summarize_text(text_to_summarize: str, api_key: str, model_name: str = "gpt-4.1-mini", target_chars: int = 2500) -> str:
+from .openai_client import get_openai_client, create_chat_completion
+from .tokenizer import count_tokens, CHARS_PER_TOKEN
+from . import telemetry
+from .openai_batch import BatchDeferred
+
+if TYPE_CHECKING:
+    from openai import OpenAI # openai itself is imported on the first request (see openai_client)
+
+# Inputs above this many tokens are summarized map-reduce style, chunk by chunk
+DEFAULT_CHUNK_TOKENS = 6000
+# Character budget for each chunk (and intermediate) summary in the map/reduce passes
+CHUNK_SUMMARY_CHARS = 1200
+# Simultaneous chunk summarization calls
+DEFAULT_MAX_PARALLEL_CHUNKS = 4
+
+
+# Summaries are made in worker threads without a Streamlit script context, so failures are raised
+class SummarizationError(Exception):
+    """Summarizing one source failed; the run can continue without it."""
+
+
+class ApiKeyError(Exception):
+    """The OpenAI API key is missing or was rejected; no request of the run can succeed."""
+
+
+def _split_oversized(piece: str, max_tokens: int) -> List[str]:
+    """Splits a paragraph that alone exceeds max_tokens on sentence, then hard character boundaries."""
+    parts: List[str] = []
+    current = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", piece):
+        candidate = f"{current} {sentence}" if current else sentence
+        if count_tokens(candidate) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            parts.append(current)
+        if count_tokens(sentence) <= max_tokens:
+            current = sentence
+        else:
+            step = int(max_tokens * CHARS_PER_TOKEN * 0.9)
+            parts.extend(sentence[i:i + step] for i in range(0, len(sentence), step))
+            current = ""
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_into_chunks(text: str, max_chunk_tokens: int = DEFAULT_CHUNK_TOKENS) -> List[str]:
+    """
+    Splits text into chunks of at most max_chunk_tokens on paragraph boundaries.
+    Chunk ends are content-defined (chosen from a hash of the closing paragraph once a chunk is
+    at least a quarter full), so an edit only moves the boundaries around the edited paragraphs
+    and the other chunks keep their exact text - and their cached summaries.
+    """
+    paragraphs: List[str] = []
+    for paragraph in re.split(r"\n\s*\n|\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) > max_chunk_tokens:
+            paragraphs.extend(_split_oversized(paragraph, max_chunk_tokens))
+        else:
+            paragraphs.append(paragraph)
+
+    min_chunk_tokens = max_chunk_tokens // 4
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for paragraph in paragraphs:
+        paragraph_tokens = count_tokens(paragraph) + 1
+        if current and current_tokens + paragraph_tokens > max_chunk_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += paragraph_tokens
+        if current_tokens >= min_chunk_tokens and zlib.crc32(paragraph.encode("utf-8")) % 4 == 0:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _summarize_once(client: "OpenAI", model_name: str, text: str, target_chars: int, use_cache: bool) -> str:
+    """One summarization call. OpenAI errors propagate so callers (and worker threads) can handle them."""
+    # Prompt for summarization
+    prompt_content = f"Summarize this text to approximately {target_chars} characters:\n\n{text}"
+
+    # Estimate max_tokens (tokens ≈ chars / 3.5)
+    max_tokens_for_summary = int(target_chars / CHARS_PER_TOKEN)
+
+    completion = create_chat_completion(
+        client, model_name,
+        messages=[
+            {"role": "system", "content": "You are an expert summarization AI."},
+            {"role": "user", "content": prompt_content}
+        ],
+        max_tokens=max_tokens_for_summary,
+        temperature=0.3,
+        use_cache=use_cache
+    )
+    return completion["content"]
+
+
+def _summarize_all(executor: ThreadPoolExecutor, summarize, texts: List[str]) -> List[str]:
+    """
+    Like executor.map, but every call finishes before the first error is re-raised, so in batch
+    mode all chunks are queued in the same batch (executor.map cancels the rest on the first error).
+    """
+    futures = [executor.submit(telemetry.wrap(summarize), text) for text in texts]
+    wait(futures)
+    return [future.result() for future in futures]
+
+
+def _map_reduce_summary(client: "OpenAI", model_name: str, chunks: List[str], target_chars: int,
+                        max_chunk_tokens: int, max_workers: int, use_cache: bool) -> str:
+    """Summarizes chunks in parallel, then merges the summaries level by level until one call fits."""
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="summarize") as executor:
+        summaries = _summarize_all(
+            executor, lambda chunk: _summarize_once(client, model_name, chunk, CHUNK_SUMMARY_CHARS, use_cache), chunks
+        )
+        combined = "\n\n".join(summaries)
+        while count_tokens(combined) > max_chunk_tokens:
+            groups = split_into_chunks(combined, max_chunk_tokens)
+            if len(groups) >= len(summaries):
+                break # Summaries are not shrinking any further; let the final call handle it
+            summaries = _summarize_all(
+                executor, lambda group: _summarize_once(client, model_name, group, CHUNK_SUMMARY_CHARS, use_cache), groups
+            )
+            combined = "\n\n".join(summaries)
+    return _summarize_once(client, model_name, combined, target_chars, use_cache)
+
+
+def summarize_text(text_to_summarize: str, api_key: str, model_name: str = "gpt-4.1-mini", target_chars: int = 2500,
+                   base_url: Optional[str] = None, use_cache: bool = True,
+                   max_chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                   max_workers: int = DEFAULT_MAX_PARALLEL_CHUNKS) -> str:
     """
     Summarizes text using OpenAI API.
+    Texts longer than max_chunk_tokens are split into chunks that are summarized in parallel and then
+    reduced hierarchically to target_chars. Every call goes through the completion cache, so
+    chunk summaries are reused for any chunk whose text is unchanged.
+    Raises ApiKeyError for a missing or rejected key and SummarizationError for other failures.
     The prompt is kept simple and can be manually edited later.
     """
     if not text_to_summarize:
         return ""
     if not api_key:
-        st.error("OpenAI API key not found. Please set it in secrets.toml.")
-        return "Error: API key not configured."
+        raise ApiKeyError("OpenAI API key not found. Please set it in secrets.toml.")
+
+    import openai
 
     try:
-        client = openai.OpenAI(api_key=api_key)
-
-        # Prompt for summarization
-        prompt_content = f"Summarize this text to approximately {target_chars} characters:\n\n{text_to_summarize}"
-
-        # Estimate max_tokens (tokens ≈ chars / 3.5)
-        max_tokens_for_summary = int(target_chars / 3.5)
-
-        response = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": "You are an expert summarization AI."},
-                {"role": "user", "content": prompt_content}
-            ],
-            max_tokens=max_tokens_for_summary,
-            temperature=0.3
-        )
+        client = get_openai_client(api_key, base_url)
+
+        with telemetry.span("summarize", input_chars=len(text_to_summarize)) as span:
+            if count_tokens(text_to_summarize) <= max_chunk_tokens:
+                summary = _summarize_once(client, model_name, text_to_summarize, target_chars, use_cache)
+                chunk_count = 1
+            else:
+                chunks = split_into_chunks(text_to_summarize, max_chunk_tokens)
+                chunk_count = len(chunks)
+                summary = _map_reduce_summary(client, model_name, chunks, target_chars, max_chunk_tokens,
+                                              max_workers, use_cache)
+            if span is not None:
+                span.set(chunks=chunk_count, output_chars=len(summary))
+            return summary
 
-        summary = response.choices[0].message.content.strip()
-        return summary
-
-    except openai.AuthenticationError:
-        st.error("OpenAI API Key is invalid or not authorized. Please check your secrets.toml.")
-        return "Error: OpenAI Authentication Failed."
-    except openai.RateLimitError:
-        st.error("OpenAI API rate limit exceeded. Please try again later or check your plan.")
-        return "Error: OpenAI Rate Limit Exceeded."
-    except openai.InvalidRequestError as e:
-        st.error(f"OpenAI Invalid Request: {e}. This might be due to excessive input length or model issues.")
-        return f"Error: OpenAI Invalid Request - {e}."
+    # Never return an error message as the summary: it would be fed into the ad prompts
+    except BatchDeferred:
+        raise # Batch mode: the run is retried once the batch has the answer
+    except openai.AuthenticationError as e:
+        raise ApiKeyError("OpenAI API Key is invalid or not authorized. Please check your secrets.toml.") from e
+    except openai.RateLimitError as e:
+        raise SummarizationError("OpenAI API rate limit still exceeded after retrying. Please try again later or check your plan.") from e
+    except openai.BadRequestError as e:
+        raise SummarizationError(f"OpenAI Invalid Request: {e}. This might be due to excessive input length or model issues.") from e
     except Exception as e:
-        st.error(f"An unexpected error occurred during summarization with OpenAI: {e}")
-        return f"Error during summarization: {e}"
\ No newline at end of file
+        raise SummarizationError(f"An unexpected error occurred during summarization with OpenAI: {e}") from e
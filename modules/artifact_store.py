@@ -0,0 +1,159 @@
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+# Size-bounded on-disk store for generated files (DOCX/XLSX reports). Jobs and sessions keep only
+# the handle returned by put(); the bytes stay on disk and are read when a download is clicked.
+# Files older than ttl_seconds, then the least recently used ones above max_bytes, are evicted.
+
+DEFAULT_ARTIFACT_DIR = os.path.join(".cache", "artifacts")
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def process_rss_bytes() -> int:
+    """Current resident memory of this process (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024 # Bytes on macOS, KiB elsewhere
+
+
+class ArtifactStore:
+    """
+    Files under root/<id>/<file name>; the handle is "<id>/<file name>". The modification time
+    records the last use (reads touch it), so eviction is least-recently-used.
+    """
+
+    def __init__(self, root: str = DEFAULT_ARTIFACT_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evicted = 0  # Files evicted by this process
+        self._lock = threading.Lock()
+
+    def _path(self, handle: str) -> Optional[str]:
+        """Path of a handle, or None if it is malformed (it must stay inside root)."""
+        parts = (handle or "").split("/")
+        if len(parts) != 2 or any(part in ("", ".", "..") or os.sep in part for part in parts):
+            return None
+        return os.path.join(self.root, *parts)
+
+    def put(self, data: bytes, file_name: str) -> str:
+        """Writes data (atomically) and returns its handle, then evicts to stay within the limits."""
+        handle = f"{uuid.uuid4().hex}/{os.path.basename(file_name)}"
+        path = self._path(handle)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.evict(keep=(handle,))
+        return handle
+
+    def exists(self, handle: str) -> bool:
+        path = self._path(handle)
+        return path is not None and os.path.exists(path)
+
+    def open(self, handle: str) -> Optional[BinaryIO]:
+        """The file opened for reading (marked as used), or None if it was evicted."""
+        path = self._path(handle)
+        try:
+            f = open(path, "rb") if path else None
+        except OSError:
+            return None
+        if f is not None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return f
+
+    def read(self, handle: str) -> Optional[bytes]:
+        f = self.open(handle)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def delete(self, handle: str) -> None:
+        path = self._path(handle)
+        if path:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """(last use, size, handle) of every stored file."""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for entry_id in os.listdir(self.root):
+            directory = os.path.join(self.root, entry_id)
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue # Being written
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, f"{entry_id}/{name}"))
+        return entries
+
+    def evict(self, keep: Tuple[str, ...] = ()) -> int:
+        """Deletes expired files, then the least recently used ones until under max_bytes. Returns how many."""
+        with self._lock:
+            now = time.time()
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            for used_at, size, handle in entries:
+                expired = self.ttl_seconds and now - used_at > self.ttl_seconds
+                if handle in keep or not (expired or (self.max_bytes and total > self.max_bytes)):
+                    continue
+                self.delete(handle)
+                total -= size
+                evicted += 1
+            self.evicted += evicted
+            return evicted
+
+    def usage(self) -> Dict[str, Any]:
+        """Files and bytes on disk, the disk limit, files evicted so far and this process's memory."""
+        entries = self._entries()
+        return {"files": len(entries), "disk_bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes,
+                "evicted": self.evicted, "rss_bytes": process_rss_bytes()}
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def configure_artifact_store(root: Optional[str] = None, max_bytes: Optional[int] = None,
+                             ttl_seconds: Optional[float] = None) -> ArtifactStore:
+    """Applies settings to the process-wide store; None keeps the current value. Safe to call on every rerun."""
+    global _store
+    with _store_lock:
+        if _store is None or (root and root != _store.root):
+            _store = ArtifactStore(root=root or DEFAULT_ARTIFACT_DIR)
+        if max_bytes is not None:
+            _store.max_bytes = int(max_bytes)
+        if ttl_seconds is not None:
+            _store.ttl_seconds = float(ttl_seconds)
+    return _store
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Returns the process-wide artifact store, creating it with defaults on first use."""
+    if _store is None:
+        return configure_artifact_store()
+    return _store
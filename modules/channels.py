@@ -0,0 +1,168 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prompts import email_prompts, linkedin_prompts, facebook_prompts, google_search_prompts, google_display_prompts
+
+# Message sets for one API call each: [[{"role": ..., "content": ...}, ...], ...]
+MessageSets = List[List[Dict[str, str]]]
+
+
+@dataclass(frozen=True)
+class ChannelSpec:
+    """
+    Everything the engine needs to know about one ad channel. Generation, count checks, error
+    placeholders and the XLSX sheet are all driven from these fields, so a new channel only
+    needs a prompt builder and a register_channel() call.
+    """
+    name: str # Channel name, all_ad_data key and sheet name
+    columns: List[str] # Ad fields, in XLSX column order
+    # build_messages(inputs, summaries) -> one message set per API call; inputs is a pipeline.FunnelInputs
+    build_messages: Callable[[Any, Dict[str, str]], MessageSets]
+    # Fixed number of items per call (Google components); None means content_count variations per call
+    fixed_count: Optional[int] = None
+    # Column that carries the error label in a placeholder row, plus fixed values for other columns
+    error_label_column: str = "Headline"
+    error_fields: Dict[str, str] = field(default_factory=dict)
+    unit: str = "ad variations" # Used in progress messages
+    # Funnel stage of each message set, in call order (empty: one call covers the whole channel)
+    stages: Tuple[str, ...] = ()
+    # Summaries (pipeline.SOURCE_KEYS) the prompts include; these are what token budgeting trims.
+    # Every built-in channel sends all three in the shared prompt prefix (prompts/shared_context.py).
+    context_keys: Tuple[str, ...] = ("url", "additional_context", "lead_magnet")
+    # Validation (ad_validation.py): every column must be filled except optional_fields; fields in
+    # field_rows are only required in the first N items; field_limits caps characters per field
+    optional_fields: Tuple[str, ...] = ()
+    field_rows: Dict[str, int] = field(default_factory=dict)
+    field_limits: Dict[str, int] = field(default_factory=dict)
+    # Prompt tokens allowed per message set (None = no limit) and completion tokens expected per ad
+    prompt_token_budget: Optional[int] = None
+    output_tokens_per_item: int = 110
+
+    def expected_count(self, content_count: int) -> int:
+        """Ads each API call of this channel should return."""
+        return self.fixed_count if self.fixed_count is not None else content_count
+
+    def stage_label(self, call_index: int) -> str:
+        """Funnel stage of the call_index-th message set, used to regenerate a single stage."""
+        if call_index < len(self.stages):
+            return self.stages[call_index]
+        return "All stages" if call_index == 0 else f"Call {call_index + 1}"
+
+    def placeholder_ads(self, ad_name: str, label: str, component_label: str) -> List[Dict[str, Any]]:
+        """Row(s) written to the report when a call returns unusable content."""
+        if self.fixed_count is not None:
+            # Component sheets have no Ad Name column: one row with the error tag and label
+            return [{self.columns[0]: ad_name.split("_")[0], self.columns[1]: component_label}]
+        row = {column: "" for column in self.columns}
+        row.update(self.error_fields)
+        row["Ad Name"] = ad_name
+        row[self.error_label_column] = label
+        return [row]
+
+
+def _email_messages(inputs, summaries: Dict[str, str]) -> MessageSets:
+    return email_prompts.get_email_prompts_messages(
+        summaries.get("url", ""), summaries.get("additional_context", ""),
+        inputs.lead_objective, inputs.book_link, inputs.content_count, summaries.get("lead_magnet", "")
+    )
+
+
+def _linkedin_messages(inputs, summaries: Dict[str, str]) -> MessageSets:
+    return linkedin_prompts.get_linkedin_prompts_messages(
+        summaries.get("url", ""), summaries.get("additional_context", ""), summaries.get("lead_magnet", ""),
+        inputs.learn_more_link, inputs.magnet_link, inputs.book_link, inputs.lead_objective, inputs.content_count
+    )
+
+
+def _facebook_messages(inputs, summaries: Dict[str, str]) -> MessageSets:
+    return facebook_prompts.get_facebook_prompts_messages(
+        summaries.get("url", ""), summaries.get("additional_context", ""), summaries.get("lead_magnet", ""),
+        inputs.learn_more_link, inputs.magnet_link, inputs.book_link, inputs.lead_objective, inputs.content_count
+    )
+
+
+def _google_search_messages(inputs, summaries: Dict[str, str]) -> MessageSets:
+    return google_search_prompts.get_google_search_prompts_messages(
+        summaries.get("url", ""), summaries.get("additional_context", ""), summaries.get("lead_magnet", "")
+    )
+
+
+def _google_display_messages(inputs, summaries: Dict[str, str]) -> MessageSets:
+    return google_display_prompts.get_google_display_prompts_messages(
+        summaries.get("url", ""), summaries.get("additional_context", ""), summaries.get("lead_magnet", "")
+    )
+
+
+# Message set order of the per-stage prompt builders (LinkedIn, Facebook)
+FUNNEL_STAGES = ("Brand Awareness", "Demand Gen", "Demand Capture")
+
+# Character limits the Google prompts ask for
+GOOGLE_FIELD_LIMITS = {"Headline": 30, "Description": 90}
+
+# Registered channels in report order (dict lookups replace per-channel string comparisons)
+CHANNELS: Dict[str, ChannelSpec] = {}
+
+
+def register_channel(spec: ChannelSpec) -> ChannelSpec:
+    """Adds (or replaces) a channel; new channels are appended to the report order."""
+    CHANNELS[spec.name] = spec
+    return spec
+
+
+def get_channel(name: str) -> Optional[ChannelSpec]:
+    return CHANNELS.get(name)
+
+
+register_channel(ChannelSpec(
+    name="Email",
+    columns=["Ad Name", "Funnel Stage", "Headline", "Subject Line", "Body", "CTA"],
+    build_messages=_email_messages,
+    error_label_column="Headline",
+    error_fields={"Funnel Stage": "Demand Capture"},
+    stages=("Demand Capture",),
+    prompt_token_budget=2600,
+    output_tokens_per_item=150,
+))
+register_channel(ChannelSpec(
+    name="LinkedIn",
+    columns=["Ad Name", "Funnel Stage", "Introductory Text", "Image Copy", "Headline", "Destination", "CTA Button"],
+    build_messages=_linkedin_messages,
+    error_label_column="Introductory Text",
+    error_fields={"Funnel Stage": "Error"},
+    stages=FUNNEL_STAGES,
+    optional_fields=("Destination",), # Empty when the matching link was not given
+    prompt_token_budget=2700,
+    output_tokens_per_item=120,
+))
+register_channel(ChannelSpec(
+    name="Facebook",
+    columns=["Ad Name", "Funnel Stage", "Primary Text", "Image Copy", "Headline", "Link Description", "Destination", "CTA Button"],
+    build_messages=_facebook_messages,
+    error_label_column="Primary Text",
+    error_fields={"Funnel Stage": "Error"},
+    stages=FUNNEL_STAGES,
+    optional_fields=("Destination",), # Empty when the matching link was not given
+    prompt_token_budget=2800,
+    output_tokens_per_item=140,
+))
+register_channel(ChannelSpec(
+    name="Google Search",
+    columns=["Headline", "Description"], # Description blank for rows 5-15
+    build_messages=_google_search_messages,
+    fixed_count=15,
+    field_rows={"Description": 4},
+    field_limits=GOOGLE_FIELD_LIMITS,
+    unit="ad components",
+    prompt_token_budget=2600,
+    output_tokens_per_item=20,
+))
+register_channel(ChannelSpec(
+    name="Google Display",
+    columns=["Headline", "Description"],
+    build_messages=_google_display_messages,
+    fixed_count=5,
+    field_limits=GOOGLE_FIELD_LIMITS,
+    unit="ad components",
+    prompt_token_budget=2400,
+    output_tokens_per_item=25,
+))
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Default location and limits for the on-disk completion cache
+DEFAULT_CACHE_PATH = os.path.join(".cache", "completions.sqlite3")
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600  # Entries older than this are treated as misses
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024  # Least recently used entries are evicted above this size
+
+
+def make_cache_key(model: str, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None,
+                   **params) -> str:
+    """Content-addressed key: SHA-256 over the model, messages, response format and sampling params."""
+    payload = {
+        "model": model,
+        "messages": messages,
+        "response_format": response_format,
+        "params": {k: v for k, v in params.items() if v is not None},
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    SQLite-backed cache of chat completion results shared by every session and worker process.
+    Values are JSON-serializable dicts (content and usage). Reads refresh the LRU timestamp,
+    writes evict expired entries and then the least recently used ones until under max_bytes.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES, enabled: bool = True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS completions ("
+                        " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                        " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_accessed ON completions (accessed_at)")
+                    conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+                    self._initialized = True
+        return conn
+
+    def _ensure_dir(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _count(self, conn: sqlite3.Connection, name: str) -> None:
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the cached value for key, or None on a miss (including expired entries)."""
+        if not self.enabled:
+            return None
+        try:
+            self._ensure_dir()
+            conn = self._connect()
+            try:
+                now = time.time()
+                row = conn.execute("SELECT value, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+                if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    self._count(conn, "misses")
+                    return None
+                conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                self._count(conn, "hits")
+                return json.loads(row[0])
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError, ValueError):
+            # The cache is an optimization; never fail a generation because of it
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Stores value under key, then enforces TTL and the size budget."""
+        if not self.enabled:
+            return
+        encoded = json.dumps(value, ensure_ascii=False)
+        try:
+            self._ensure_dir()
+            conn = self._connect()
+            try:
+                now = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO completions (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, encoded, len(encoded.encode("utf-8")), now, now),
+                )
+                self._evict(conn, now)
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError):
+            pass
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_free = total - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, size in conn.execute("SELECT key, size FROM completions ORDER BY accessed_at ASC"):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= to_free:
+                break
+        conn.executemany("DELETE FROM completions WHERE key = ?", stale_keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process and across all processes, plus current size."""
+        result = {"enabled": self.enabled, "session_hits": self.hits, "session_misses": self.misses,
+                  "total_hits": 0, "total_misses": 0, "entries": 0, "bytes": 0}
+        if not os.path.exists(self.path):
+            return result
+        try:
+            conn = self._connect()
+            try:
+                counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+                entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return result
+        result.update(total_hits=counters.get("hits", 0), total_misses=counters.get("misses", 0),
+                      entries=entries, bytes=size)
+        return result
+
+    def clear(self) -> None:
+        """Removes every cached completion and resets the counters."""
+        if not os.path.exists(self.path):
+            return
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM completions")
+            conn.execute("DELETE FROM counters")
+        finally:
+            conn.close()
+        self.hits = self.misses = 0
+
+
+_cache: Optional[CompletionCache] = None
+_cache_lock = threading.Lock()
+
+
+def configure_completion_cache(path: Optional[str] = None, ttl_seconds: Optional[float] = None,
+                               max_bytes: Optional[int] = None, enabled: Optional[bool] = None) -> CompletionCache:
+    """
+    Applies settings to the process-wide cache; None keeps the current value.
+    Safe to call on every Streamlit rerun: the cache object and its counters are kept.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None or (path and path != _cache.path):
+            _cache = CompletionCache(path=path or DEFAULT_CACHE_PATH)
+        if ttl_seconds is not None:
+            _cache.ttl_seconds = float(ttl_seconds)
+        if max_bytes is not None:
+            _cache.max_bytes = int(max_bytes)
+        if enabled is not None:
+            _cache.enabled = bool(enabled)
+    return _cache
+
+
+def get_completion_cache() -> CompletionCache:
+    """Returns the process-wide completion cache, creating it with defaults on first use."""
+    if _cache is None:
+        return configure_completion_cache()
+    return _cache
@@ -1,60 +1,86 @@
-import streamlit as st
-import requests
-from bs4 import BeautifulSoup
-import pdfplumber
-from pptx import Presentation
+import importlib.metadata
+import json
+import os
+import threading
 from io import BytesIO
+from typing import Optional, Union
 from .utils import add_http_if_missing
+from .pdf_extraction import extract_pdf_text
+from .site_crawler import crawl_site
+from .completion_cache import CompletionCache
+from . import html_extraction, telemetry, uploads
 
-@st.cache_data(show_spinner=False)
-def extract_text_from_url(url: str) -> str:
-    """Extracts all text content from a given URL."""
+class ExtractionError(Exception):
+    """A source could not be read. Extraction runs in worker threads, so failures are raised, not shown."""
+
+def html_to_text(html: bytes) -> str:
+    """Visible text of an HTML page (see modules/html_extraction.py for backends and boilerplate removal)."""
+    return html_extraction.html_to_text(html)
+
+def extract_text_from_url(url: str, max_depth: Optional[int] = None, max_pages: Optional[int] = None) -> str:
+    """
+    Extracts text from a website: the given page plus same-site pages it links to (see
+    modules/site_crawler.py; max_depth / max_pages override the configured crawl budget).
+    Pages are separated by a "Page: <url>" line. Responses are revalidated against the
+    on-disk HTTP cache, so repeat runs mostly get 304 Not Modified.
+    Raises ExtractionError when no page could be fetched or parsed.
+    """
     if not url:
         return ""
     
     processed_url = add_http_if_missing(url)
-    try:
-        response = requests.get(processed_url, timeout=10)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remove script and style elements
-        for script_or_style in soup(["script", "style"]):
-            script_or_style.decompose()
-        
-        # Get text
-        text = soup.get_text(separator=' ', strip=True)
+    with telemetry.span("extract.url", url=processed_url) as span:
+        text = _crawl_to_text(processed_url, max_depth, max_pages, span)
+        if span is not None:
+            span.set(chars=len(text))
         return text
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error fetching URL ({processed_url}): {e}")
-        return ""
+
+def _crawl_to_text(processed_url: str, max_depth: Optional[int], max_pages: Optional[int], span) -> str:
+    try:
+        result = crawl_site(processed_url, max_depth=max_depth, max_pages=max_pages)
     except Exception as e:
-        st.error(f"Error parsing URL content ({processed_url}): {e}")
-        return ""
+        raise ExtractionError(f"Error fetching URL ({processed_url}): {e}") from e
+    if span is not None:
+        span.set(pages=len(result.pages), requests=int(result.stats.get("requests", 0)),
+                 not_modified=int(result.stats.get("not_modified", 0)), failed_pages=len(result.errors))
+    if not result.pages:
+        error = next(iter(result.errors.values()), "no HTML content")
+        raise ExtractionError(f"Error fetching URL ({processed_url}): {error}")
+
+    sections = []
+    parse_errors = []
+    for page in result.pages:
+        try:
+            text = html_to_text(page.html)
+        except Exception as e:
+            parse_errors.append(f"Error parsing URL content ({page.url}): {e}")
+            continue
+        if text:
+            sections.append(text if len(result.pages) == 1 else f"Page: {page.url}\n{text}")
+    if not sections and parse_errors:
+        raise ExtractionError(parse_errors[0])
+    return "\n\n".join(sections)
 
-@st.cache_data(show_spinner=False)
-def extract_text_from_pdf(uploaded_file: BytesIO) -> str:
-    """Extracts text from an uploaded PDF file."""
+def extract_text_from_pdf(uploaded_file: Union[BytesIO, str], max_pages: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+    """
+    Extracts text from an uploaded PDF file (or a PDF on disk, read in place).
+    Large PDFs are extracted in parallel page ranges (see modules/pdf_extraction.py);
+    max_pages / max_chars stop extraction early. Raises ExtractionError if the file cannot be read.
+    """
     if not uploaded_file:
         return ""
     try:
-        with pdfplumber.open(uploaded_file) as pdf:
-            text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        return text.strip()
+        pdf = uploaded_file if isinstance(uploaded_file, str) else uploaded_file.getvalue()
+        return extract_pdf_text(pdf, max_pages=max_pages, max_chars=max_chars)
     except Exception as e:
-        st.error(f"Error reading PDF file: {e}")
-        return ""
+        raise ExtractionError(f"Error reading PDF file: {e}") from e
 
-@st.cache_data(show_spinner=False)
-def extract_text_from_ppt(uploaded_file: BytesIO) -> str:
-    """Extracts text from an uploaded PPTX file."""
+def extract_text_from_ppt(uploaded_file: Union[BytesIO, str]) -> str:
+    """Extracts text from an uploaded PPTX file (or a PPTX on disk). Raises ExtractionError if it cannot be read."""
     if not uploaded_file:
         return ""
     try:
+        from pptx import Presentation # Imported on first use so app startup does not pay for python-pptx
         prs = Presentation(uploaded_file)
         text = []
         for slide in prs.slides:
@@ -63,23 +89,88 @@ def extract_text_from_ppt(uploaded_file: BytesIO) -> str:
                     text.append(shape.text)
         return "\n".join(text).strip()
     except Exception as e:
-        st.error(f"Error reading PPTX file: {e}")
+        raise ExtractionError(f"Error reading PPTX file: {e}") from e
+
+# Text extracted from documents, keyed by content digest, shared across sessions and restarts, so
+# re-uploading the same deck skips extraction. Bump EXTRACTOR_VERSION when extraction output changes.
+EXTRACTOR_VERSION = 1
+DEFAULT_EXTRACTION_CACHE_PATH = os.path.join(".cache", "extractions.sqlite3")
+DEFAULT_EXTRACTION_TTL_SECONDS = 30 * 24 * 3600
+_EXTRACTOR_LIBRARIES = {"pdf": "pdfplumber", "pptx": "python-pptx"}
+
+_extraction_cache: Optional[CompletionCache] = None
+_extraction_cache_lock = threading.Lock()
+
+def configure_extraction_cache(path: Optional[str] = None, ttl_seconds: Optional[float] = None,
+                               max_bytes: Optional[int] = None, enabled: Optional[bool] = None) -> CompletionCache:
+    """Applies settings to the process-wide extraction cache; None keeps the current value."""
+    global _extraction_cache
+    with _extraction_cache_lock:
+        if _extraction_cache is None or (path and path != _extraction_cache.path):
+            _extraction_cache = CompletionCache(path=path or DEFAULT_EXTRACTION_CACHE_PATH,
+                                                ttl_seconds=DEFAULT_EXTRACTION_TTL_SECONDS)
+        if ttl_seconds is not None:
+            _extraction_cache.ttl_seconds = float(ttl_seconds)
+        if max_bytes is not None:
+            _extraction_cache.max_bytes = int(max_bytes)
+        if enabled is not None:
+            _extraction_cache.enabled = bool(enabled)
+    return _extraction_cache
+
+def get_extraction_cache() -> CompletionCache:
+    """Returns the process-wide extraction cache, creating it with defaults on first use."""
+    if _extraction_cache is None:
+        return configure_extraction_cache()
+    return _extraction_cache
+
+def _library_version(kind: str) -> str:
+    try:
+        return importlib.metadata.version(_EXTRACTOR_LIBRARIES[kind])
+    except importlib.metadata.PackageNotFoundError:
         return ""
 
-def extract_text_from_uploaded_file(uploaded_file) -> str:
+def _extraction_key(digest: str, kind: str, max_pages: Optional[int], max_chars: Optional[int]) -> str:
+    """Content digest plus everything that changes the extracted text."""
+    limits = {"max_pages": max_pages, "max_chars": max_chars} if kind == "pdf" else {}
+    return json.dumps({"digest": digest, "kind": kind, "extractor": EXTRACTOR_VERSION,
+                       "library": _library_version(kind), **limits}, sort_keys=True)
+
+def extract_text_from_uploaded_file(uploaded_file, max_pages: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """
-    Detects file type (PDF/PPTX) from an UploadedFile object and extracts text.
+    Detects file type (PDF/PPTX) from an UploadedFile or pipeline.SourceFile and extracts text,
+    reusing the text cached for the same content. max_pages / max_chars cap PDF extraction.
+    Raises ExtractionError for unsupported or unreadable files.
     """
     if uploaded_file is None:
         return ""
-    
-    file_bytes = BytesIO(uploaded_file.getvalue())
+
     file_name = uploaded_file.name.lower()
+    kind = "pdf" if file_name.endswith(".pdf") else "pptx" if file_name.endswith(".pptx") else None
+    if kind is None:
+        raise ExtractionError(f"Unsupported file type: {uploaded_file.name}. Please upload PDF or PPTX.")
 
-    if file_name.endswith(".pdf"):
-        return extract_text_from_pdf(file_bytes)
-    elif file_name.endswith(".pptx"):
-        return extract_text_from_ppt(file_bytes)
-    else:
-        st.warning(f"Unsupported file type: {uploaded_file.name}. Please upload PDF or PPTX.")
-        return ""
\ No newline at end of file
+    # Spooled uploads and manifest files are read in place, in-memory ones are read once
+    path = getattr(uploaded_file, "path", None)
+    try:
+        if path:
+            size, source = os.path.getsize(path), path
+        else:
+            data = uploaded_file.getvalue()
+            size, source = len(data), BytesIO(data)
+        digest = uploaded_file.content_digest() if hasattr(uploaded_file, "content_digest") else uploads.digest_buffer(data)
+    except OSError as e:
+        raise ExtractionError(f"Error reading {uploaded_file.name}: {e}") from e
+
+    with telemetry.span("extract.file", file_type=kind, bytes=size) as span:
+        cache = get_extraction_cache()
+        key = _extraction_key(digest, kind, max_pages, max_chars)
+        cached = cache.get(key)
+        if cached is not None:
+            text = cached["text"]
+        else:
+            text = extract_text_from_pdf(source, max_pages, max_chars) if kind == "pdf" else extract_text_from_ppt(source)
+            if text: # Empty documents are retried next time
+                cache.set(key, {"text": text})
+        if span is not None:
+            span.set(chars=len(text), cache_hit=cached is not None)
+        return text
@@ -1,161 +1,162 @@
-import openpyxl
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
 from io import BytesIO
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, BinaryIO, Tuple, TYPE_CHECKING
+
+from . import channels, telemetry
+from .ad_validation import text_value
+
+if TYPE_CHECKING:
+    import openpyxl
+    from openpyxl.styles import NamedStyle
+
+# openpyxl is imported on first use so app startup does not pay for it
+
+MAX_COLUMN_WIDTH = 50 # Max width to prevent extremely wide columns
+
+
+def _build_named_styles() -> Tuple["NamedStyle", "NamedStyle"]:
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
 
-def create_excel_report(ad_data_dict: Dict[str, List[Dict[str, Any]]]) -> BytesIO:
-    """
-    Creates an XLSX report from ad data and returns it as a BytesIO stream.
-    """
-    wb = openpyxl.Workbook()
-    # Remove default sheet if it exists
-    if "Sheet" in wb.sheetnames and len(wb.sheetnames) > 1: # Keep if it's the only sheet
-        default_sheet = wb["Sheet"]
-        wb.remove(default_sheet)
-    elif "Sheet" in wb.sheetnames and len(wb.sheetnames) == 1 and not ad_data_dict: # No data, keep default
-        pass
-    elif "Sheet" in wb.sheetnames and len(wb.sheetnames) == 1 and ad_data_dict: # Data exists, remove default
-         default_sheet = wb["Sheet"]
-         wb.remove(default_sheet)
-
-
-    header_font = Font(color="FFFFFF", bold=True) # White font
-    header_fill = PatternFill(start_color="000000", end_color="000000", fill_type="solid") # Black fill
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    content_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
     thin_border_side = Side(style='thin', color="000000")
     cell_border = Border(left=thin_border_side,
                          right=thin_border_side,
                          top=thin_border_side,
                          bottom=thin_border_side)
+    header_style = NamedStyle(name="Ad Header")
+    header_style.font = Font(color="FFFFFF", bold=True) # White font
+    header_style.fill = PatternFill(start_color="000000", end_color="000000", fill_type="solid") # Black fill
+    header_style.alignment = Alignment(horizontal="center", vertical="center")
+    header_style.border = cell_border
+    content_style = NamedStyle(name="Ad Content")
+    content_style.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+    content_style.border = cell_border
+    return header_style, content_style
+
+
+def _display_width(value: Any) -> int:
+    """Length of the longest line of a cell value (0 for empty values)."""
+    if not value:
+        return 0
+    text = str(value)
+    if "\n" not in text:
+        return len(text)
+    return max(len(line) for line in text.split("\n"))
+
+
+def _column_width(max_length: int) -> float:
+    return min((max_length + 2) * 1.2, MAX_COLUMN_WIDTH) # Add padding and factor
+
+
+def _sheet_rows(headers: List[str], ads: List[Dict[str, Any]]) -> Tuple[List[List[Any]], List[int]]:
+    """Row values and the display width of every column, collected in one pass over the data."""
+    widths = [_display_width(header) for header in headers]
+    rows = []
+    for ad in ads:
+        values = [text_value(ad.get(header, "")) for header in headers]
+        for col_idx, value in enumerate(values):
+            width = _display_width(value)
+            if width > widths[col_idx]:
+                widths[col_idx] = width
+        rows.append(values)
+    return rows, widths
+
+
+def _write_sheet(wb: "openpyxl.Workbook", sheet_name: str, headers: List[str], ads: List[Dict[str, Any]]) -> None:
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    ws = wb.create_sheet(sheet_name)
+
+    # In write-only mode the widths must be set before the first row is appended
+    rows, widths = _sheet_rows(headers, ads)
+    for col_idx, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = _column_width(width)
+
+    def styled(value: Any, style: str) -> "WriteOnlyCell":
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+
+    ws.append([styled(header, "Ad Header") for header in headers])
+    for values in rows:
+        ws.append([styled(value, "Ad Content") for value in values])
+
+
+def create_excel_report(ad_data_dict: Dict[str, List[Dict[str, Any]]], output: Optional[BinaryIO] = None):
+    """
+    Creates an XLSX report from ad data.
+    Rows are streamed with openpyxl's write-only mode and shared named styles, so memory stays flat
+    for large batch exports. Writes to output (any writable binary file object) when given and
+    returns it; otherwise returns a new BytesIO stream positioned at the start.
+    """
+    import openpyxl
+
+    with telemetry.span("report.xlsx", rows=sum(len(ads) for ads in ad_data_dict.values())):
+        wb = openpyxl.Workbook(write_only=True)
+        header_style, content_style = _build_named_styles()
+        wb.add_named_style(header_style)
+        wb.add_named_style(content_style)
+
+        # One sheet per registered channel with data, in registry order, with the channel's columns
+        for spec in channels.CHANNELS.values():
+            if ad_data_dict.get(spec.name):
+                _write_sheet(wb, spec.name, spec.columns, ad_data_dict[spec.name])
+
+        if not wb.worksheets: # No data: keep an empty default sheet so the file is still valid
+            wb.create_sheet("Sheet")
 
-    def style_header_cell(cell):
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = cell_border
-    
-    def style_content_cell(cell):
-        cell.alignment = content_alignment
-        cell.border = cell_border
-
-    # Email Page
-    if 'Email' in ad_data_dict and ad_data_dict['Email']:
-        ws_email = wb.create_sheet("Email")
-        email_headers = ["Ad Name", "Funnel Stage", "Headline", "Subject Line", "Body", "CTA"]
-        for col_num, header_text in enumerate(email_headers, 1):
-            cell = ws_email.cell(row=1, column=col_num, value=header_text)
-            style_header_cell(cell)
-        
-        for row_idx, ad in enumerate(ad_data_dict['Email'], 2):
-            ws_email.cell(row=row_idx, column=1, value=ad.get("Ad Name", "")).border = cell_border
-            ws_email.cell(row=row_idx, column=2, value=ad.get("Funnel Stage", "")).border = cell_border
-            ws_email.cell(row=row_idx, column=3, value=ad.get("Headline", "")).border = cell_border
-            ws_email.cell(row=row_idx, column=4, value=ad.get("Subject Line", "")).border = cell_border
-            ws_email.cell(row=row_idx, column=5, value=ad.get("Body", "")).border = cell_border
-            ws_email.cell(row=row_idx, column=6, value=ad.get("CTA", "")).border = cell_border
-            for col_idx in range(1, len(email_headers) + 1):
-                 style_content_cell(ws_email.cell(row=row_idx, column=col_idx))
-
-
-    # LinkedIn Page
-    if 'LinkedIn' in ad_data_dict and ad_data_dict['LinkedIn']:
-        ws_linkedin = wb.create_sheet("LinkedIn")
-        linkedin_headers = ["Ad Name", "Funnel Stage", "Introductory Text", "Image Copy", "Headline", "Destination", "CTA Button"]
-        for col_num, header_text in enumerate(linkedin_headers, 1):
-            cell = ws_linkedin.cell(row=1, column=col_num, value=header_text)
-            style_header_cell(cell)
-
-        for row_idx, ad in enumerate(ad_data_dict['LinkedIn'], 2):
-            ws_linkedin.cell(row=row_idx, column=1, value=ad.get("Ad Name", "")).border = cell_border
-            ws_linkedin.cell(row=row_idx, column=2, value=ad.get("Funnel Stage", "")).border = cell_border
-            ws_linkedin.cell(row=row_idx, column=3, value=ad.get("Introductory Text", "")).border = cell_border
-            ws_linkedin.cell(row=row_idx, column=4, value=ad.get("Image Copy", "")).border = cell_border
-            ws_linkedin.cell(row=row_idx, column=5, value=ad.get("Headline", "")).border = cell_border
-            ws_linkedin.cell(row=row_idx, column=6, value=ad.get("Destination", "")).border = cell_border
-            ws_linkedin.cell(row=row_idx, column=7, value=ad.get("CTA Button", "")).border = cell_border
-            for col_idx in range(1, len(linkedin_headers) + 1):
-                 style_content_cell(ws_linkedin.cell(row=row_idx, column=col_idx))
-
-    # FaceBook Page
-    if 'Facebook' in ad_data_dict and ad_data_dict['Facebook']:
-        ws_facebook = wb.create_sheet("Facebook")
-        facebook_headers = ["Ad Name", "Funnel Stage", "Primary Text", "Image Copy", "Headline", "Link Description", "Destination", "CTA Button"]
-        for col_num, header_text in enumerate(facebook_headers, 1):
-            cell = ws_facebook.cell(row=1, column=col_num, value=header_text)
-            style_header_cell(cell)
-
-        for row_idx, ad in enumerate(ad_data_dict['Facebook'], 2):
-            ws_facebook.cell(row=row_idx, column=1, value=ad.get("Ad Name", "")).border = cell_border
-            ws_facebook.cell(row=row_idx, column=2, value=ad.get("Funnel Stage", "")).border = cell_border
-            ws_facebook.cell(row=row_idx, column=3, value=ad.get("Primary Text", "")).border = cell_border
-            ws_facebook.cell(row=row_idx, column=4, value=ad.get("Image Copy", "")).border = cell_border
-            ws_facebook.cell(row=row_idx, column=5, value=ad.get("Headline", "")).border = cell_border
-            ws_facebook.cell(row=row_idx, column=6, value=ad.get("Link Description", "")).border = cell_border
-            ws_facebook.cell(row=row_idx, column=7, value=ad.get("Destination", "")).border = cell_border
-            ws_facebook.cell(row=row_idx, column=8, value=ad.get("CTA Button", "")).border = cell_border
-            for col_idx in range(1, len(facebook_headers) + 1):
-                 style_content_cell(ws_facebook.cell(row=row_idx, column=col_idx))
-
-    # Google Search Page
-    if 'Google Search' in ad_data_dict and ad_data_dict['Google Search']:
-        ws_gsearch = wb.create_sheet("Google Search")
-        gsearch_headers = ["Headline", "Description"]
-        for col_num, header_text in enumerate(gsearch_headers, 1):
-            cell = ws_gsearch.cell(row=1, column=col_num, value=header_text)
-            style_header_cell(cell)
-        
-        for row_idx, ad in enumerate(ad_data_dict['Google Search'], 2): # Max 15 ads
-            ws_gsearch.cell(row=row_idx, column=1, value=ad.get("Headline", "")).border = cell_border
-            ws_gsearch.cell(row=row_idx, column=2, value=ad.get("Description", "")).border = cell_border # Blank for rows 5-15
-            for col_idx in range(1, len(gsearch_headers) + 1):
-                 style_content_cell(ws_gsearch.cell(row=row_idx, column=col_idx))
-
-
-    # Google Display Page
-    if 'Google Display' in ad_data_dict and ad_data_dict['Google Display']:
-        ws_gdisplay = wb.create_sheet("Google Display")
-        gdisplay_headers = ["Headline", "Description"]
-        for col_num, header_text in enumerate(gdisplay_headers, 1):
-            cell = ws_gdisplay.cell(row=1, column=col_num, value=header_text)
-            style_header_cell(cell)
-
-        for row_idx, ad in enumerate(ad_data_dict['Google Display'], 2): # Max 5 ads
-            ws_gdisplay.cell(row=row_idx, column=1, value=ad.get("Headline", "")).border = cell_border
-            ws_gdisplay.cell(row=row_idx, column=2, value=ad.get("Description", "")).border = cell_border
-            for col_idx in range(1, len(gdisplay_headers) + 1):
-                 style_content_cell(ws_gdisplay.cell(row=row_idx, column=col_idx))
-    
-    # Auto-adjust column widths for all sheets
-    for sheet_name in wb.sheetnames:
-        ws = wb[sheet_name]
-        for col in ws.columns:
-            max_length = 0
-            column_letter = col[0].column_letter 
-            for cell in col:
-                try:
-                    if cell.value:
-                        cell_text_length = len(str(cell.value))
-                        # For wrapped text, consider line breaks or estimate based on a max line width
-                        # This is a simple approach; more sophisticated needed for perfect auto-fit with wrap
-                        lines = str(cell.value).count('\n') + 1
-                        max_line_length = 0
-                        if lines > 1:
-                            max_line_length = max(len(s) for s in str(cell.value).split('\n'))
-                        else:
-                            max_line_length = cell_text_length
-                        
-                        if max_line_length > max_length:
-                            max_length = max_line_length
-                except:
-                    pass
-            adjusted_width = (max_length + 2) * 1.2 # Add padding and factor
-            if adjusted_width > 50: # Max width to prevent extremely wide columns
-                adjusted_width = 50
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-
-    file_stream = BytesIO()
-    wb.save(file_stream)
-    file_stream.seek(0)
-    return file_stream
\ No newline at end of file
+        file_stream = output if output is not None else BytesIO()
+        wb.save(file_stream)
+        if output is None:
+            file_stream.seek(0)
+        return file_stream
+
+
+def replace_sheets(xlsx_file: BinaryIO, ad_data_dict: Dict[str, List[Dict[str, Any]]]) -> BytesIO:
+    """
+    Rewrites only the sheets of the channels in ad_data_dict inside an existing report (a readable
+    binary file object, e.g. BytesIO) and returns the updated workbook as a new BytesIO stream.
+    Other sheets are carried over untouched; a channel with no ads loses its sheet, a new one is
+    inserted at its registry position.
+    """
+    import openpyxl
+    from openpyxl.utils import get_column_letter
+
+    with telemetry.span("report.xlsx", rows=sum(len(ads) for ads in ad_data_dict.values()), sheets=len(ad_data_dict)):
+        wb = openpyxl.load_workbook(xlsx_file)
+        existing_styles = set(wb.named_styles)
+        for style in _build_named_styles():
+            if style.name not in existing_styles:
+                wb.add_named_style(style)
+
+        registry_order = list(channels.CHANNELS)
+        for channel_name, ads in ad_data_dict.items():
+            index = None
+            if channel_name in wb.sheetnames:
+                index = wb.sheetnames.index(channel_name)
+                wb.remove(wb[channel_name])
+            if not ads:
+                continue
+            if index is None: # Before the first sheet of a later channel
+                later = registry_order[registry_order.index(channel_name) + 1:] if channel_name in registry_order else []
+                index = next((i for i, name in enumerate(wb.sheetnames) if name in later), len(wb.sheetnames))
+            spec = channels.get_channel(channel_name)
+            headers = spec.columns if spec else list(ads[0])
+            ws = wb.create_sheet(channel_name, index)
+            rows, widths = _sheet_rows(headers, ads)
+            for col_idx, width in enumerate(widths, 1):
+                ws.column_dimensions[get_column_letter(col_idx)].width = _column_width(width)
+            for row_idx, values in enumerate([headers] + rows, 1):
+                style = "Ad Header" if row_idx == 1 else "Ad Content"
+                for col_idx, value in enumerate(values, 1):
+                    ws.cell(row=row_idx, column=col_idx, value=value).style = style
+
+        # The empty placeholder sheet of a report without data goes once a channel has a sheet
+        if "Sheet" in wb.sheetnames and len(wb.sheetnames) > 1 and wb["Sheet"].max_row == 1 and wb["Sheet"]["A1"].value is None:
+            wb.remove(wb["Sheet"])
+        if not wb.worksheets:
+            wb.create_sheet("Sheet")
+
+        file_stream = BytesIO()
+        wb.save(file_stream)
+        file_stream.seek(0)
+        return file_stream
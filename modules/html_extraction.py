@@ -0,0 +1,204 @@
+import functools
+import importlib.util
+from typing import Any, Callable, Dict, List, Optional
+
+# HTML -> visible text backends, fastest first. selectolax and lxml are optional; the
+# BeautifulSoup html.parser backend always works and is the reference the others are compared to.
+# Every parser, bs4 included, is imported on first use.
+BACKEND_ORDER = ["selectolax", "lxml", "bs4"]
+_BACKEND_MODULES = {"selectolax": "selectolax", "lxml": "lxml", "bs4": "bs4"}
+
+# Never visible text
+NON_TEXT_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe", "object"]
+# Site chrome repeated on every page: navigation, footers, sidebars (<header> often holds the page title, so it stays)
+BOILERPLATE_TAGS = ["nav", "footer", "aside"]
+BOILERPLATE_ROLES = ["navigation", "banner", "contentinfo", "dialog", "alertdialog"]
+# Cookie / consent banners are plain divs: match known banner ids and whole class names (not substrings,
+# so wrappers like <body class="has-cookie-banner"> or <div class="gdpr-compliant"> are kept)
+BOILERPLATE_IDS = {"onetrust-banner-sdk", "onetrust-consent-sdk", "cybotcookiebotdialog", "cookie-banner",
+                   "cookie-notice", "cookie-consent", "cookie-law-info-bar", "gdpr-banner", "gdpr-consent",
+                   "consent-banner", "usercentrics-root", "truste-consent-track", "newsletter-popup"}
+BOILERPLATE_CLASSES = {"cookie-banner", "cookie-notice", "cookie-consent", "cookie-bar", "cookies-banner",
+                       "cookie-popup", "consent-banner", "gdpr-banner", "cc-banner", "cc-window", "newsletter-popup"}
+# Never removed as a banner: page containers
+BOILERPLATE_PROTECTED_TAGS = {"html", "body", "main", "article"}
+# A "banner" holding more than this share of the page's text is the page itself
+BOILERPLATE_MAX_TEXT_SHARE = 0.5
+
+_settings: Dict[str, Any] = {"backend": None, "remove_boilerplate": True}
+
+
+def configure_html_extraction(backend: Optional[str] = None, remove_boilerplate: Optional[bool] = None) -> None:
+    """Sets the preferred backend (None = fastest available) and whether boilerplate is removed."""
+    if backend is not None:
+        _settings["backend"] = backend or None
+    if remove_boilerplate is not None:
+        _settings["remove_boilerplate"] = bool(remove_boilerplate)
+
+
+@functools.lru_cache(maxsize=None)
+def available_backends() -> List[str]:
+    """Installed backends in BACKEND_ORDER."""
+    return [name for name in BACKEND_ORDER if importlib.util.find_spec(_BACKEND_MODULES[name]) is not None]
+
+
+def _decode(html: bytes) -> str:
+    """Decodes using the declared charset (meta tag / BOM), then UTF-8, then Windows-1252, like BeautifulSoup."""
+    if isinstance(html, str):
+        return html
+    from bs4 import UnicodeDammit
+    return UnicodeDammit(html, is_html=True).unicode_markup or ""
+
+
+def _is_boilerplate_attrs(element_id: Optional[str], element_class: Optional[str]) -> bool:
+    if (element_id or "").strip().lower() in BOILERPLATE_IDS:
+        return True
+    return any(token.lower() in BOILERPLATE_CLASSES for token in (element_class or "").split())
+
+
+def _is_banner(tag: str, element_id: Optional[str], element_class: Optional[str],
+               text_length: Callable[[], int], page_length: int) -> bool:
+    """Cookie / consent banner by id or class; never a page container or an element with most of the page's text."""
+    if str(tag).lower() in BOILERPLATE_PROTECTED_TAGS or not _is_boilerplate_attrs(element_id, element_class):
+        return False
+    return text_length() <= page_length * BOILERPLATE_MAX_TEXT_SHARE
+
+
+def _bs4_text(html: bytes, remove_boilerplate: bool) -> str:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(NON_TEXT_TAGS):
+        element.decompose()
+    if remove_boilerplate:
+        for element in soup(BOILERPLATE_TAGS):
+            element.decompose()
+        for element in soup.find_all(attrs={"role": BOILERPLATE_ROLES}):
+            element.decompose()
+        page_length = len(soup.get_text(strip=True))
+        banners = soup.find_all(lambda tag: _is_banner(tag.name, tag.get("id"), " ".join(tag.get("class") or []),
+                                                       lambda: len(tag.get_text(strip=True)), page_length))
+        for element in banners:
+            if not element.decomposed:
+                element.decompose()
+    return soup.get_text(separator=" ", strip=True)
+
+
+def _lxml_text(html: bytes, remove_boilerplate: bool) -> str:
+    import lxml.html
+    from lxml import etree
+
+    markup = _decode(html)
+    if not markup.strip():
+        return ""
+    try:
+        root = lxml.html.document_fromstring(markup)
+    except ValueError:
+        # Unicode input with an XML encoding declaration: let lxml decode the bytes itself
+        root = lxml.html.document_fromstring(html)
+    # with_tail=False keeps the text that follows a removed element
+    etree.strip_elements(root, etree.Comment, etree.ProcessingInstruction, *NON_TEXT_TAGS, with_tail=False)
+    if remove_boilerplate:
+        etree.strip_elements(root, *BOILERPLATE_TAGS, with_tail=False)
+        roles = " or ".join(f"@role='{role}'" for role in BOILERPLATE_ROLES)
+        page_length = len(root.text_content().strip())
+        for element in root.xpath(f"//*[{roles}]") + [
+                e for e in root.xpath("//*[@id or @class]")
+                if _is_banner(e.tag, e.get("id"), e.get("class"), lambda e=e: len(e.text_content().strip()), page_length)]:
+            if element.getparent() is not None:
+                element.drop_tree()
+    texts = (text.strip() for text in root.itertext())
+    return " ".join(text for text in texts if text)
+
+
+def _selectolax_text(html: bytes, remove_boilerplate: bool) -> str:
+    from selectolax.parser import HTMLParser
+
+    tree = HTMLParser(_decode(html))
+    if tree.root is None:
+        return ""
+    tree.strip_tags(NON_TEXT_TAGS)
+    if remove_boilerplate:
+        tree.strip_tags(BOILERPLATE_TAGS)
+        for node in tree.css(", ".join(f"[role='{role}']" for role in BOILERPLATE_ROLES)):
+            node.decompose()
+        page_length = len(tree.root.text(strip=True))
+        for node in tree.css("[id], [class]"):
+            if _is_banner(node.tag, node.attributes.get("id"), node.attributes.get("class"),
+                          lambda: len(node.text(strip=True)), page_length):
+                node.decompose()
+    return tree.root.text(separator=" ", strip=True)
+
+
+BACKENDS: Dict[str, Callable[[bytes, bool], str]] = {
+    "selectolax": _selectolax_text,
+    "lxml": _lxml_text,
+    "bs4": _bs4_text,
+}
+
+
+def resolve_backend(name: Optional[str] = None) -> str:
+    """The requested backend if installed, else the fastest available one."""
+    available = available_backends()
+    if name in available:
+        return name
+    return available[0] if available else "bs4"
+
+
+def _bs4_hrefs(html: bytes) -> List[str]:
+    from bs4 import BeautifulSoup
+
+    return [anchor["href"] for anchor in BeautifulSoup(html, "html.parser").find_all("a", href=True)]
+
+
+def _lxml_hrefs(html: bytes) -> List[str]:
+    import lxml.html
+
+    markup = _decode(html)
+    if not markup.strip():
+        return []
+    try:
+        root = lxml.html.document_fromstring(markup)
+    except ValueError:
+        root = lxml.html.document_fromstring(html)
+    return [str(href) for href in root.xpath("//a/@href")]
+
+
+def _selectolax_hrefs(html: bytes) -> List[str]:
+    from selectolax.parser import HTMLParser
+
+    return [node.attributes["href"] or "" for node in HTMLParser(_decode(html)).css("a[href]")]
+
+
+HREF_BACKENDS: Dict[str, Callable[[bytes], List[str]]] = {
+    "selectolax": _selectolax_hrefs,
+    "lxml": _lxml_hrefs,
+    "bs4": _bs4_hrefs,
+}
+
+
+def extract_hrefs(html: bytes, backend: Optional[str] = None) -> List[str]:
+    """Raw href values of every <a> in the page, in document order."""
+    name = resolve_backend(backend or _settings["backend"])
+    if name != "bs4":
+        try:
+            return HREF_BACKENDS[name](html)
+        except Exception:
+            pass
+    return _bs4_hrefs(html)
+
+
+def html_to_text(html: bytes, backend: Optional[str] = None, remove_boilerplate: Optional[bool] = None) -> str:
+    """
+    Visible text of an HTML page as one space-separated string. Uses the configured (or fastest
+    installed) backend and falls back to BeautifulSoup's html.parser if that backend fails.
+    """
+    if remove_boilerplate is None:
+        remove_boilerplate = _settings["remove_boilerplate"]
+    name = resolve_backend(backend or _settings["backend"])
+    if name != "bs4":
+        try:
+            return BACKENDS[name](html, remove_boilerplate)
+        except Exception:
+            pass # Malformed markup a fast parser rejects: the reference parser copes with anything
+    return _bs4_text(html, remove_boilerplate)
@@ -0,0 +1,457 @@
+import copy
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+from . import pipeline, telemetry, utils, artifact_store
+
+# Background funnel runs: a Streamlit rerun, refresh or disconnect no longer kills a generation.
+# Jobs run on an in-process worker pool; their state lives in a SQLite job table so any session
+# (or a later visit with ?job=<id>) can poll progress and download the finished artifacts, which
+# are kept in the artifact store (artifact_store.py) and referenced by handle.
+
+DEFAULT_JOBS_PATH = os.path.join(".cache", "jobs.sqlite3")
+DEFAULT_MAX_WORKERS = 2  # Funnel runs at once; each already sends its OpenAI calls concurrently
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600  # Finished jobs are purged after this (files follow the store's limits)
+FLUSH_INTERVAL_SECONDS = 0.5  # Streamed ads reach the job table at most this late
+MAX_TRACES = 20  # Telemetry traces kept in memory for the most recent jobs
+# Each process refreshes the heartbeat of the jobs it runs; another process's active jobs are only
+# marked interrupted once that process has exited (same host) or its heartbeat is this old
+HEARTBEAT_SECONDS = 10
+STALE_AFTER_SECONDS = 60
+
+ACTIVE_STATUSES = ("queued", "running")
+ARTIFACT_FILES = {"docx": "{stem}_ai_report.docx", "xlsx": "{stem}_lead.xlsx"}
+_JSON_FIELDS = ("progress", "ads", "errors", "metrics", "artifacts", "state")
+
+
+@dataclass
+class Job:
+    job_id: str
+    company_name: str
+    status: str = "queued"  # queued, running, done, failed or interrupted (its server process stopped mid-run)
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    stage: str = ""  # Latest pipeline status message
+    progress: Dict[str, List[int]] = field(default_factory=dict)  # Channel -> [completed calls, total calls]
+    ads: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)  # Streamed so far, final ads once done
+    errors: List[str] = field(default_factory=list)
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    artifacts: Dict[str, str] = field(default_factory=dict)  # "docx" / "xlsx" -> artifact store handle
+    error: Optional[str] = None  # Why the job failed
+    state: Dict[str, Any] = field(default_factory=dict)  # pipeline.RunState.as_dict(), for regenerate()
+    owner: str = ""  # "<host>:<pid>:<token>" of the process running it
+    heartbeat_at: Optional[float] = None  # Last time the owner reported it alive
+
+    @property
+    def finished(self) -> bool:
+        return self.status not in ACTIVE_STATUSES
+
+
+def _process_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    """False if the owner is a process on this host that has exited (other hosts rely on heartbeats)."""
+    parts = (owner or "").rsplit(":", 2)
+    if len(parts) != 3:
+        return False # Jobs from before owners were recorded
+    host, pid, _ = parts
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass # Exists under another user, or not a pid: trust the heartbeat
+    return True
+
+
+class JobStore:
+    """SQLite job table shared by every session and worker thread (one row per job, JSON columns)."""
+
+    def __init__(self, path: str = DEFAULT_JOBS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS jobs ("
+                        " job_id TEXT PRIMARY KEY, company_name TEXT NOT NULL, status TEXT NOT NULL,"
+                        " created_at REAL NOT NULL, started_at REAL, finished_at REAL, stage TEXT,"
+                        " progress TEXT, ads TEXT, errors TEXT, metrics TEXT, artifacts TEXT, error TEXT, state TEXT)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at)")
+                    columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+                    for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+                        if column not in columns: # Tables created before jobs had owners
+                            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+                    self._initialized = True
+        return conn
+
+    def save(self, job: Job) -> None:
+        row = dict(vars(job))
+        for name in _JSON_FIELDS:
+            row[name] = json.dumps(row[name], ensure_ascii=False, default=str)
+        columns = ", ".join(row)
+        conn = self._connect()
+        try:
+            conn.execute(f"INSERT OR REPLACE INTO jobs ({columns}) VALUES ({', '.join('?' * len(row))})",
+                         tuple(row.values()))
+        finally:
+            conn.close()
+
+    def _to_job(self, row: sqlite3.Row) -> Job:
+        values = dict(row)
+        for name in _JSON_FIELDS:
+            values[name] = json.loads(values[name]) if values[name] else Job.__dataclass_fields__[name].default_factory()
+        return Job(**values)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._to_job(row) if row is not None else None
+
+    def list_jobs(self, job_ids: List[str], limit: int = 20) -> List[Job]:
+        """The given jobs, most recent first, without their ads (use get() for those)."""
+        if not job_ids:
+            return []
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                "SELECT job_id, company_name, status, created_at, started_at, finished_at, stage, error"
+                f" FROM jobs WHERE job_id IN ({', '.join('?' * len(job_ids))}) ORDER BY created_at DESC LIMIT ?",
+                (*job_ids, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [Job(**dict(row)) for row in rows]
+
+    def claim(self, job_id: str, owner: str, stage: str) -> bool:
+        """Queues a finished job for owner; False if it is not done (another process claimed it first)."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', stage = ?, progress = '{}', error = NULL, owner = ?, heartbeat_at = ?"
+                " WHERE job_id = ? AND status = 'done'", (stage, owner, time.time(), job_id)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def heartbeat(self, owner: str) -> None:
+        """Marks the owner's queued and running jobs as alive."""
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN (?, ?)",
+                         (time.time(), owner, *ACTIVE_STATUSES))
+        finally:
+            conn.close()
+
+    def mark_interrupted(self, owner: str, stale_after: float = STALE_AFTER_SECONDS) -> int:
+        """
+        Jobs whose process is gone can never finish: marks the queued and running jobs of other
+        owners that have exited or stopped sending heartbeats as interrupted; returns how many.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT job_id, owner, heartbeat_at FROM jobs WHERE status IN (?, ?) AND owner IS NOT ?",
+                                (*ACTIVE_STATUSES, owner)).fetchall()
+            gone = [(now, job_id, *ACTIVE_STATUSES) for job_id, job_owner, heartbeat_at in rows
+                    if not _owner_alive(job_owner) or not heartbeat_at or now - heartbeat_at > stale_after]
+            cursor = conn.executemany(
+                "UPDATE jobs SET status = 'interrupted', finished_at = ? WHERE job_id = ? AND status IN (?, ?)", gone
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def purge(self, older_than: float) -> List[str]:
+        """Deletes finished jobs created before the given Unix time and returns their ids."""
+        conn = self._connect()
+        try:
+            job_ids = [row[0] for row in conn.execute(
+                "SELECT job_id FROM jobs WHERE created_at < ? AND status NOT IN (?, ?)", (older_than, *ACTIVE_STATUSES))]
+            conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+        finally:
+            conn.close()
+        return job_ids
+
+
+class JobManager:
+    """
+    Runs funnel jobs (pipeline.run_pipeline) on a bounded in-process thread pool. Extra jobs wait
+    in the queue, so several users can submit at once without tying up Streamlit's script threads.
+    Workers update the job in memory and write it through to the JobStore, so get() is cheap to poll.
+    """
+
+    def __init__(self, store: JobStore, max_workers: int = DEFAULT_MAX_WORKERS, retention_seconds: float = DEFAULT_RETENTION_SECONDS,
+                 metrics_path: Optional[str] = None, otlp_endpoint: Optional[str] = None):
+        self.store = store
+        self.max_workers = max(1, int(max_workers))
+        self.retention_seconds = retention_seconds
+        self.metrics_path = metrics_path
+        self.otlp_endpoint = otlp_endpoint
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="funnel-job")
+        self._lock = threading.Lock()
+        self._live: Dict[str, Job] = {}  # Queued and running jobs of this process
+        self._traces: "OrderedDict[str, telemetry.RunTrace]" = OrderedDict()
+        self.owner = _process_owner()
+        store.mark_interrupted(self.owner)
+        self.purge()
+        threading.Thread(target=self._heartbeat_loop, name="funnel-job-heartbeat", daemon=True).start()
+
+    # --- Submitting and polling ---
+
+    def submit(self, inputs: pipeline.FunnelInputs, settings: pipeline.PipelineSettings) -> str:
+        """
+        Queues a funnel run and returns its job id. Input files must already be spooled to disk or read into
+        memory (pipeline.SourceFile): Streamlit's uploaded files are released when the session reruns.
+        """
+        job = Job(job_id=uuid.uuid4().hex[:12], company_name=inputs.company_name, created_at=time.time(),
+                  stage="Queued", owner=self.owner, heartbeat_at=time.time())
+        with self._lock:
+            self._live[job.job_id] = job
+        self.store.save(job)
+        self._executor.submit(self._run, job, inputs, settings)
+        return job.job_id
+
+    def regenerate(self, job_id: str, settings: pipeline.PipelineSettings,
+                   channel_name: Optional[str] = None, stage: Optional[str] = None) -> None:
+        """
+        Queues pipeline.regenerate for one channel (or one funnel stage of it) of a finished job.
+        The job keeps its id: its ads, errors and XLSX file are updated in place when it is done.
+        Raises ValueError when the job cannot be regenerated, including while a regeneration of it
+        is queued or running (in this or another process).
+        """
+        target = f"{channel_name} {stage}" if stage else channel_name or "changed prompts"
+        # Checked and claimed under the lock, so two clicks cannot start two regenerations
+        with self._lock:
+            if job_id in self._live:
+                raise ValueError(f"Job {job_id} is still running")
+            job = self.store.get(job_id)
+            if job is None or job.status != "done" or not job.state:
+                raise ValueError(f"Job {job_id} has no finished run to regenerate")
+            calls = job.state["calls"].get(channel_name, []) if channel_name else None
+            if channel_name and not calls:
+                raise ValueError(f"Unknown channel: {channel_name}")
+            if channel_name and stage and stage not in [call["stage"] for call in calls]:
+                raise ValueError(f"{channel_name} has no '{stage}' stage")
+            if not self.store.claim(job_id, self.owner, f"Queued: regenerate {target}"):
+                raise ValueError(f"Job {job_id} is still running")
+            job.status, job.stage, job.progress, job.error = "queued", f"Queued: regenerate {target}", {}, None
+            job.owner, job.heartbeat_at = self.owner, time.time()
+            self._live[job.job_id] = job
+        self._executor.submit(self._regenerate, job, settings, channel_name, stage)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A snapshot of the job (from memory while it is active in this process, else from the table)."""
+        with self._lock:
+            job = self._live.get(job_id)
+            if job is not None:
+                return copy.deepcopy(job)
+        return self.store.get(job_id)
+
+    def list_jobs(self, job_ids: List[str], limit: int = 20) -> List[Job]:
+        """
+        Summaries of the given jobs only: job ids are what grants access to a job's files, so a
+        session lists the jobs it submitted, never the whole table.
+        """
+        return self.store.list_jobs(job_ids, limit)
+
+    def queue_position(self, job_id: str) -> int:
+        """Number of jobs queued ahead of job_id (0 once it is running)."""
+        with self._lock:
+            job = self._live.get(job_id)
+            if job is None or job.status != "queued":
+                return 0
+            return sum(1 for other in self._live.values() if other.status == "queued" and other.created_at < job.created_at)
+
+    def trace(self, job_id: str) -> Optional[telemetry.RunTrace]:
+        """Telemetry of a recent job finished in this process (None after a restart)."""
+        with self._lock:
+            return self._traces.get(job_id)
+
+    def read_artifact(self, job_id: str, name: str) -> Optional[bytes]:
+        """Bytes of a finished job's "docx" or "xlsx" file, or None if it is not available (or was evicted)."""
+        job = self.get(job_id)
+        handle = job.artifacts.get(name) if job is not None else None
+        return artifact_store.get_artifact_store().read(handle) if handle else None
+
+    def purge(self) -> None:
+        """Removes finished jobs older than the retention period."""
+        if not self.retention_seconds:
+            return
+        self.store.purge(time.time() - self.retention_seconds)
+
+    # --- Worker side ---
+
+    def _heartbeat_loop(self) -> None:
+        """Keeps this process's jobs alive in the table and interrupts those of processes that are gone."""
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                self.store.heartbeat(self.owner)
+                self.store.mark_interrupted(self.owner)
+            except sqlite3.Error:
+                pass # Retried on the next beat
+
+    def _update(self, job: Job, **fields) -> None:
+        with self._lock:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.heartbeat_at = time.time()
+            snapshot = copy.deepcopy(job)
+        self.store.save(snapshot)
+
+    def _write_artifacts(self, job: Job, result: pipeline.FunnelResult) -> Dict[str, str]:
+        """Moves the result's files to the artifact store (replacing the job's earlier versions) and returns their handles."""
+        store = artifact_store.get_artifact_store()
+        stem = utils.sanitize_filename(job.company_name)
+        artifacts = {}
+        for name, stream in (("docx", result.docx_bytes), ("xlsx", result.xlsx_bytes)):
+            if stream is not None:
+                artifacts[name] = store.put(stream.getvalue(), ARTIFACT_FILES[name].format(stem=stem))
+                if job.artifacts.get(name):
+                    store.delete(job.artifacts[name])
+        return artifacts
+
+    def _record_trace(self, job_id: str, trace: telemetry.RunTrace) -> None:
+        with self._lock:
+            self._traces[job_id] = trace
+            while len(self._traces) > MAX_TRACES:
+                self._traces.popitem(last=False)
+        try:
+            telemetry.append_run(trace, self.metrics_path or telemetry.DEFAULT_METRICS_PATH)
+            if self.otlp_endpoint:
+                telemetry.export_otlp(trace, self.otlp_endpoint)
+        except Exception:
+            pass # Telemetry must never fail a finished job
+
+    def _run(self, job: Job, inputs: pipeline.FunnelInputs, settings: pipeline.PipelineSettings) -> None:
+        self._update(job, status="running", started_at=time.time(), stage="Starting")
+        last_flush = [0.0]
+
+        def on_status(message: str) -> None:
+            self._update(job, stage=message)
+
+        def on_progress(channel_name: str, completed_calls: int, total_calls: int) -> None:
+            self._update(job, progress=dict(job.progress, **{channel_name: [completed_calls, total_calls]}))
+
+        def on_ad(channel_name: str, ad: Dict[str, Any]) -> None:
+            with self._lock:
+                job.ads.setdefault(channel_name, []).append(ad)
+            if time.monotonic() - last_flush[0] >= FLUSH_INTERVAL_SECONDS:
+                last_flush[0] = time.monotonic()
+                self._update(job)
+
+        trace = None
+        try:
+            with telemetry.start_run("funnel_run", job_id=job.job_id, company=job.company_name) as trace:
+                result = pipeline.run_pipeline(inputs, settings, status_callback=on_status,
+                                               progress_callback=on_progress, ad_callback=on_ad)
+            artifacts = self._write_artifacts(job, result)
+            self._update(job, status="done", stage="Done", finished_at=time.time(), ads=result.all_ad_data,
+                         errors=result.errors, metrics=result.metrics, artifacts=artifacts,
+                         state=result.state.as_dict())
+        except Exception as e:
+            self._update(job, status="failed", stage="Failed", finished_at=time.time(), error=f"{type(e).__name__}: {e}")
+        finally:
+            if trace is not None:
+                self._record_trace(job.job_id, trace)
+            with self._lock:
+                self._live.pop(job.job_id, None)
+
+    def _regenerate(self, job: Job, settings: pipeline.PipelineSettings,
+                    channel_name: Optional[str], stage: Optional[str]) -> None:
+        target = f"{channel_name} {stage}" if stage else channel_name or "changed prompts"
+        self._update(job, status="running", started_at=time.time(), stage=f"Regenerating {target}")
+
+        def on_progress(name: str, completed_calls: int, total_calls: int) -> None:
+            self._update(job, progress=dict(job.progress, **{name: [completed_calls, total_calls]}))
+
+        trace = None
+        try:
+            with telemetry.start_run("funnel_regenerate", job_id=job.job_id, company=job.company_name,
+                                     channel=channel_name, stage=stage) as trace:
+                xlsx_bytes = self.read_artifact(job.job_id, "xlsx")
+                result = pipeline.regenerate(pipeline.RunState.from_dict(job.state), settings, channel_name, stage,
+                                             xlsx_file=BytesIO(xlsx_bytes) if xlsx_bytes else None,
+                                             progress_callback=on_progress)
+            artifacts = dict(job.artifacts, **self._write_artifacts(job, result))
+            regenerations = job.metrics.get("regenerations", []) + [dict(
+                target=target, calls=sum(len(stages) for stages in result.metrics["calls"].values()),
+                seconds=result.metrics["total_seconds"], cost_usd=result.metrics["cost_usd"], at=time.time()
+            )]
+            # Errors of the regenerated calls are replaced, the others' are kept
+            self._update(job, status="done", stage="Done", finished_at=time.time(), ads=result.all_ad_data,
+                         errors=result.state.errors(), artifacts=artifacts, state=result.state.as_dict(),
+                         metrics=dict(job.metrics, regenerations=regenerations))
+        except Exception as e:
+            # The previous results are still valid, so the job stays done
+            self._update(job, status="done", stage="Done", finished_at=time.time(),
+                         errors=job.errors + [f"Regenerating {target} failed: {type(e).__name__}: {e}"])
+        finally:
+            if trace is not None:
+                self._record_trace(job.job_id, trace)
+            with self._lock:
+                self._live.pop(job.job_id, None)
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def configure_job_manager(path: Optional[str] = None, max_workers: Optional[int] = None, retention_seconds: Optional[float] = None,
+                          metrics_path: Optional[str] = None, otlp_endpoint: Optional[str] = None) -> JobManager:
+    """
+    Creates the process-wide job manager on first call; None keeps the current value.
+    The job table and worker count are fixed once the manager exists
+    (restart the app to change them); telemetry settings can change at any time.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(
+                JobStore(path or DEFAULT_JOBS_PATH), max_workers=max_workers or DEFAULT_MAX_WORKERS,
+                retention_seconds=DEFAULT_RETENTION_SECONDS if retention_seconds is None else float(retention_seconds),
+            )
+        if metrics_path is not None:
+            _manager.metrics_path = metrics_path
+        if otlp_endpoint is not None:
+            _manager.otlp_endpoint = otlp_endpoint or None
+    return _manager
+
+
+def get_job_manager() -> JobManager:
+    """Returns the process-wide job manager, creating it with defaults on first use."""
+    if _manager is None:
+        return configure_job_manager()
+    return _manager
@@ -0,0 +1,103 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class AdsStreamParser:
+    """
+    Incremental parser for responses shaped like {"ads": [{...}, {...}]}.
+    Feed it text chunks as they stream in; feed() returns (index, object) for every object of the
+    top-level "ads" array completed by that chunk, where index counts every element of the array
+    (nulls and strings too), as in json.loads(...)["ads"]. Each character is scanned only once,
+    however the response is split into chunks, and only the unfinished object (or key) is kept
+    in the buffer, so long responses are not copied again on every chunk.
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._buffer = ""  # Unscanned text plus the part of the scanned text still needed
+        self._offset = 0  # Position of _buffer[0] in the whole response
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key: Optional[str] = None
+        self._ads_depth: Optional[int] = None # Stack depth inside the "ads" array
+        self._object_start: Optional[int] = None
+        self._elements = 0  # Elements of the "ads" array started so far
+        self._expect_element = False  # After "[" or ",": the next value starts an element
+        self.ads_emitted = 0
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> List[Tuple[int, Dict[str, Any]]]:
+        completed: List[Tuple[int, Dict[str, Any]]] = []
+        if not chunk:
+            return completed
+        self._chunks.append(chunk)
+        buffer = self._buffer + chunk
+        offset = self._offset
+        end = offset + len(buffer)
+        for i in range(self._pos, end):
+            char = buffer[i - offset]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._ads_depth is None:
+                        # A string directly inside the top-level object: remember it as a candidate key
+                        self._last_key = buffer[self._string_start + 1 - offset:i - offset]
+                continue
+
+            if self._ads_depth is not None and len(self._stack) == self._ads_depth and not char.isspace():
+                if char == ",":
+                    self._expect_element = True
+                elif char != "]" and self._expect_element:
+                    self._elements += 1
+                    self._expect_element = False
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                if (char == "[" and self._ads_depth is None and len(self._stack) == 1
+                        and self._last_key == "ads"):
+                    self._ads_depth = len(self._stack) + 1
+                    self._expect_element = True
+                elif char == "{" and self._ads_depth is not None and len(self._stack) == self._ads_depth:
+                    self._object_start = i
+                self._stack.append(char)
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if char == "}" and self._object_start is not None and len(self._stack) == self._ads_depth:
+                    try:
+                        ad = json.loads(buffer[self._object_start - offset:i + 1 - offset])
+                    except json.JSONDecodeError:
+                        ad = None
+                    if isinstance(ad, dict):
+                        completed.append((self._elements - 1, ad))
+                        self.ads_emitted += 1
+                    self._object_start = None
+                elif char == "]" and self._ads_depth is not None and len(self._stack) == self._ads_depth - 1:
+                    self._ads_depth = None
+                    self._last_key = None
+            elif char == "," and len(self._stack) == 1:
+                self._last_key = None
+        self._pos = end
+        # Keep only what a later chunk can still refer to: the open ad object or string
+        keep = end
+        if self._object_start is not None:
+            keep = min(keep, self._object_start)
+        if self._in_string:
+            keep = min(keep, self._string_start)
+        self._buffer = buffer[keep - offset:]
+        self._offset = keep
+        return completed
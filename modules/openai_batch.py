@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+import time
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
+
+from . import token_budget
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+# Offline execution through the OpenAI Batch API (half price, separate rate limits, results within
+# the completion window). While a session is configured, create_chat_completion answers requests
+# from finished batches and defers every other request by raising BatchDeferred; the caller
+# (batch_cli.py) reruns the deferred work once run_round() has sent the collected requests as one
+# batch and fetched the results. Each round gets further: summaries first, then the ad prompts
+# built from them, then repairs of invalid ads.
+# Everything is kept in state_dir, so a crashed run resumes by polling its in-flight batches
+# instead of resubmitting them:
+#   batches.json        batch id -> input file, custom ids, status, whether its results were fetched
+#   results.jsonl       one line per finished request: custom_id with content and usage, or error
+#                       (requests the Batch API rejected are sent directly; their answers are added
+#                       with "direct": true, so the rerun builds the same follow-up requests)
+#   requests_<n>.jsonl  the input file of each submitted batch
+
+DEFAULT_POLL_SECONDS = 30.0
+COMPLETION_WINDOW = "24h"
+BATCH_PRICE_FACTOR = 0.5  # Batch API requests cost half the synchronous price
+# Terminal batch statuses; expired and cancelled batches still return the requests they finished
+FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchDeferred(Exception):
+    """A request was queued for the next batch instead of being sent; rerun the work after run_round()."""
+
+
+class BatchSession:
+    """
+    Requests collected in the current round, in-flight batches and finished results, keyed by
+    custom_id (completion_cache.make_cache_key of the request, so identical requests from different
+    companies are sent once). Requests the Batch API rejected individually are sent synchronously.
+    """
+
+    def __init__(self, state_dir: str, poll_seconds: float = DEFAULT_POLL_SECONDS):
+        self.state_dir = state_dir
+        self.poll_seconds = poll_seconds
+        self.results: Dict[str, Dict[str, Any]] = {}  # custom_id -> {"content", "usage", "direct"}
+        self.failed: Dict[str, str] = {}  # custom_id -> error message
+        self.pending: Dict[str, Dict[str, Any]] = {}  # custom_id -> request body, collected this round
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.rounds = 0
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.state_dir, name)
+
+    def _load(self) -> None:
+        if os.path.exists(self._path("batches.json")):
+            with open(self._path("batches.json"), encoding="utf-8") as f:
+                self.batches = json.load(f)
+        if os.path.exists(self._path("results.jsonl")):
+            with open(self._path("results.jsonl"), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._add_result(json.loads(line))
+                    except (json.JSONDecodeError, KeyError):
+                        continue # Partially written line from an interrupted run
+
+    def _save_batches(self) -> None:
+        tmp_path = self._path("batches.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.batches, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path("batches.json"))
+
+    def _add_result(self, record: Dict[str, Any]) -> None:
+        if record.get("error"):
+            self.failed[record["custom_id"]] = record["error"]
+        else:
+            self.results[record["custom_id"]] = {"content": record["content"], "usage": record.get("usage") or {},
+                                                 "direct": bool(record.get("direct"))}
+            self.failed.pop(record["custom_id"], None)
+
+    def _append_results(self, records: List[Dict[str, Any]]) -> None:
+        with self._lock, open(self._path("results.jsonl"), "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            for record in records:
+                self._add_result(record)
+
+    def in_flight(self) -> List[str]:
+        """Ids of submitted batches whose results have not been fetched yet."""
+        return [batch_id for batch_id, batch in self.batches.items() if not batch.get("collected")]
+
+    def result(self, custom_id: str) -> Optional[Dict[str, Any]]:
+        return self.results.get(custom_id)
+
+    def defer(self, custom_id: str, body: Dict[str, Any]) -> None:
+        """Queues body for the next batch and raises BatchDeferred; returns (send it now) if the Batch API rejected it."""
+        if custom_id in self.failed:
+            return
+        with self._lock:
+            self.pending[custom_id] = body
+        raise BatchDeferred(custom_id)
+
+    def record_direct(self, custom_id: str, content: str, usage: Dict[str, Any]) -> None:
+        """Keeps the answer to a request that was sent directly (see defer)."""
+        self._append_results([{"custom_id": custom_id, "content": content, "usage": usage, "direct": True}])
+
+    def submit(self, client: "OpenAI") -> Optional[str]:
+        """Sends the requests collected since the last round (minus those already in flight) as one batch."""
+        with self._lock:
+            in_flight = {custom_id for batch_id in self.in_flight() for custom_id in self.batches[batch_id]["custom_ids"]}
+            requests = {custom_id: body for custom_id, body in self.pending.items()
+                        if custom_id not in in_flight and custom_id not in self.results}
+            self.pending.clear()
+        if not requests:
+            return None
+        lines = [json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body},
+                            ensure_ascii=False) for custom_id, body in requests.items()]
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        input_name = f"requests_{len(self.batches) + 1}.jsonl"
+        with open(self._path(input_name), "wb") as f:
+            f.write(data)
+        uploaded = client.files.create(file=(input_name, BytesIO(data)), purpose="batch")
+        batch = client.batches.create(input_file_id=uploaded.id, endpoint="/v1/chat/completions",
+                                      completion_window=COMPLETION_WINDOW)
+        self.batches[batch.id] = {"input_file": input_name, "custom_ids": list(requests), "status": batch.status,
+                                  "created_at": time.time(), "collected": False}
+        self._save_batches()
+        return batch.id
+
+    def wait(self, client: "OpenAI", progress_callback: Optional[Callable[[str, Any], None]] = None) -> None:
+        """
+        Polls every in-flight batch until it finishes and records its results. Requests of a batch
+        that failed or expired without an answer are neither results nor failures, so the next
+        round defers and resubmits them.
+        """
+        waiting = self.in_flight()
+        while waiting:
+            for batch_id in list(waiting):
+                batch = client.batches.retrieve(batch_id)
+                self.batches[batch_id]["status"] = batch.status
+                if progress_callback:
+                    progress_callback(batch_id, batch)
+                if batch.status not in FINISHED_STATUSES:
+                    continue
+                records: List[Dict[str, Any]] = []
+                for file_id in (batch.output_file_id, batch.error_file_id):
+                    if file_id:
+                        records.extend(parse_output(client.files.content(file_id).text))
+                self._append_results(records)
+                self.batches[batch_id]["collected"] = True
+                self._save_batches()
+                waiting.remove(batch_id)
+            if waiting:
+                time.sleep(self.poll_seconds)
+
+    def run_round(self, client: "OpenAI", progress_callback: Optional[Callable[[str, Any], None]] = None) -> Optional[str]:
+        """Submits the deferred requests and waits for every in-flight batch. Returns the new batch id, if any."""
+        self.rounds += 1
+        batch_id = self.submit(client)
+        self.wait(client, progress_callback)
+        return batch_id
+
+    def stats(self, model: str) -> Dict[str, Any]:
+        """Request counts and token usage of every batch result, with their cost at batch prices."""
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        batch_results = [result for result in self.results.values() if not result["direct"]]
+        for result in batch_results:
+            usage["prompt_tokens"] += int(result["usage"].get("prompt_tokens") or 0)
+            usage["completion_tokens"] += int(result["usage"].get("completion_tokens") or 0)
+            usage["cached_tokens"] += int((result["usage"].get("prompt_tokens_details") or {}).get("cached_tokens") or 0)
+        cost = token_budget.estimate_cost(model, usage["prompt_tokens"], usage["completion_tokens"], usage["cached_tokens"])
+        return dict(usage, batches=len(self.batches), rounds=self.rounds, results=len(batch_results),
+                    direct=len(self.results) - len(batch_results) + len(self.failed), cost_usd=cost * BATCH_PRICE_FACTOR)
+
+
+def parse_output(text: str) -> List[Dict[str, Any]]:
+    """Batch output or error file lines as results.jsonl records: custom_id with content and usage, or error."""
+    records = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        body = response.get("body") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            error = item.get("error") or body.get("error") or {}
+            message = error.get("message") if isinstance(error, dict) else str(error)
+            records.append({"custom_id": item["custom_id"],
+                            "error": f"Status {response.get('status_code')}: {message or 'request failed'}"})
+            continue
+        content = ((body.get("choices") or [{}])[0].get("message") or {}).get("content") or ""
+        records.append({"custom_id": item["custom_id"], "content": content.strip(), "usage": body.get("usage") or {}})
+    return records
+
+
+_session: Optional[BatchSession] = None
+
+
+def configure_batch_session(state_dir: Optional[str], poll_seconds: float = DEFAULT_POLL_SECONDS) -> Optional[BatchSession]:
+    """Turns batch mode on for the whole process (state kept in state_dir), or off with None."""
+    global _session
+    _session = BatchSession(state_dir, poll_seconds) if state_dir else None
+    return _session
+
+
+def get_batch_session() -> Optional[BatchSession]:
+    """The process-wide batch session, or None when requests are sent synchronously."""
+    return _session
@@ -0,0 +1,180 @@
+import threading
+import importlib.util
+from typing import Callable, Dict, List, Optional, Tuple, Any, TYPE_CHECKING
+
+from .completion_cache import get_completion_cache, make_cache_key
+from .rate_limiter import get_scheduler, estimate_request_tokens
+from . import telemetry, openai_batch
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import OpenAI # openai and httpx are imported when the first client is created
+
+# Connection pool defaults shared by every client in the process
+DEFAULT_POOL_SETTINGS: Dict[str, Any] = {
+    "max_connections": 20,            # Upper bound on open sockets per client
+    "max_keepalive_connections": 10,  # Idle sockets kept warm for reuse
+    "keepalive_expiry": 60.0,         # Seconds an idle socket stays in the pool
+    "http2": False,                   # Needs the optional 'h2' package
+    "timeout": 120.0,                 # Seconds per request (long ad batches can take a while)
+}
+
+_pool_settings: Dict[str, Any] = dict(DEFAULT_POOL_SETTINGS)
+_clients: Dict[Tuple[str, Optional[str]], "OpenAI"] = {}
+_clients_lock = threading.Lock()
+
+
+def configure_client_pool(**settings) -> None:
+    """
+    Overrides connection pool settings (see DEFAULT_POOL_SETTINGS) for clients created afterwards.
+    Unknown keys are ignored; None values keep the current setting.
+    """
+    with _clients_lock:
+        for name, value in settings.items():
+            if name in _pool_settings and value is not None:
+                _pool_settings[name] = value
+
+
+def _http2_supported() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_http_client() -> "httpx.Client":
+    """Builds a pooled HTTP client from the current pool settings."""
+    import httpx
+    from openai import DefaultHttpxClient
+
+    limits = httpx.Limits(
+        max_connections=int(_pool_settings["max_connections"]),
+        max_keepalive_connections=int(_pool_settings["max_keepalive_connections"]),
+        keepalive_expiry=float(_pool_settings["keepalive_expiry"]),
+    )
+    http2 = bool(_pool_settings["http2"]) and _http2_supported()
+    return DefaultHttpxClient(limits=limits, http2=http2, timeout=float(_pool_settings["timeout"]))
+
+
+def get_openai_client(api_key: str, base_url: Optional[str] = None) -> "OpenAI":
+    """
+    Returns the process-wide OpenAI client for (api_key, base_url), creating it on first use.
+    Clients are thread-safe, so summarization and ad generation share one connection pool
+    instead of paying connection setup and TLS handshakes on every call.
+    """
+    key = (api_key, base_url or None)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            from openai import OpenAI
+            # Retries are owned by the shared request scheduler (modules/rate_limiter.py)
+            client = OpenAI(api_key=api_key, base_url=base_url or None, http_client=create_http_client(),
+                            max_retries=0)
+            _clients[key] = client
+    return client
+
+
+def close_all_clients() -> None:
+    """Closes every pooled client (e.g. at the end of a batch run or in benchmarks)."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def _stream_completion(client: "OpenAI", model: str, messages: List[Dict[str, str]],
+                       on_delta: Callable[[str], None], **request_kwargs) -> Tuple[str, Dict[str, Any]]:
+    """Streams a completion, passing each content delta to on_delta. Returns (content, usage)."""
+    parts: List[str] = []
+    usage: Dict[str, Any] = {}
+    stream = client.chat.completions.create(
+        model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **request_kwargs
+    )
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage.model_dump()
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            on_delta(delta)
+    return "".join(parts).strip(), usage
+
+
+def create_chat_completion(client: "OpenAI", model: str, messages: List[Dict[str, str]],
+                           response_format: Optional[Dict[str, Any]] = None, use_cache: bool = True,
+                           on_delta: Optional[Callable[[str], None]] = None,
+                           **params) -> Dict[str, Any]:
+    """
+    Single entry point for chat completions used by summarization and ad generation.
+    Returns {"content": str, "usage": dict, "cached": bool}. Identical requests (same model, messages,
+    response_format and sampling params) are answered from the on-disk completion cache.
+    When on_delta is given the response is streamed and on_delta receives each text delta
+    (a cache hit delivers the whole content as one delta).
+    Requests are queued and retried by the shared rate-limit scheduler; OpenAI exceptions that
+    survive its retries propagate to the caller unchanged. In batch mode (openai_batch) a request
+    is answered from a finished batch or raises openai_batch.BatchDeferred.
+    Each call is recorded as an "openai.chat" telemetry span with token usage and cache hits.
+    """
+    with telemetry.span("openai.chat", model=model, stream=on_delta is not None) as span:
+        result = _create_chat_completion(client, model, messages, response_format, use_cache, on_delta, **params)
+        if span is not None:
+            usage = result["usage"] or {}
+            span.set(
+                completion_cache_hit=result["cached"],
+                prompt_tokens=int(usage.get("prompt_tokens") or 0),
+                completion_tokens=int(usage.get("completion_tokens") or 0),
+                cached_tokens=int((usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0),
+            )
+        return result
+
+
+def _create_chat_completion(client: "OpenAI", model: str, messages: List[Dict[str, str]],
+                            response_format: Optional[Dict[str, Any]], use_cache: bool,
+                            on_delta: Optional[Callable[[str], None]], **params) -> Dict[str, Any]:
+    cache = get_completion_cache()
+    key = None
+    if use_cache and cache.enabled:
+        key = make_cache_key(model, messages, response_format, **params)
+        cached = cache.get(key)
+        if cached is not None:
+            if on_delta:
+                on_delta(cached["content"])
+            return {"content": cached["content"], "usage": cached.get("usage") or {}, "cached": True}
+
+    request_kwargs = {k: v for k, v in params.items() if v is not None}
+    if response_format is not None:
+        request_kwargs["response_format"] = response_format
+    batch = openai_batch.get_batch_session()
+    if batch is not None:
+        custom_id = key or make_cache_key(model, messages, response_format, **params)
+        result = batch.result(custom_id)
+        if result is not None:
+            if on_delta:
+                on_delta(result["content"])
+            if key is not None:
+                cache.set(key, result)
+            return {"content": result["content"], "usage": result["usage"], "cached": False}
+        batch.defer(custom_id, dict(request_kwargs, model=model, messages=messages))
+    delivered = [False] # Once a stream has produced output, retrying would duplicate it
+
+    def tracked_delta(delta: str) -> None:
+        delivered[0] = True
+        on_delta(delta)
+
+    def call() -> Tuple[str, Dict[str, Any]]:
+        if on_delta:
+            return _stream_completion(client, model, messages, tracked_delta, **request_kwargs)
+        response = client.chat.completions.create(model=model, messages=messages, **request_kwargs)
+        content = (response.choices[0].message.content or "").strip()
+        return content, response.usage.model_dump() if getattr(response, "usage", None) else {}
+
+    estimated_tokens = estimate_request_tokens(messages, request_kwargs.get("max_tokens"))
+    content, usage = get_scheduler().run(model, estimated_tokens, call, can_retry=lambda: not delivered[0])
+
+    if batch is not None and content:
+        batch.record_direct(custom_id, content, usage)
+    if key is not None and content:
+        cache.set(key, {"content": content, "usage": usage})
+    return {"content": content, "usage": usage, "cached": False}
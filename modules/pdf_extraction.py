@@ -0,0 +1,154 @@
+import atexit
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Iterator, List, Optional, Dict, Any, Union
+
+# PDFs with fewer pages than this are extracted in-process (pool hand-off costs more than it saves)
+PARALLEL_MIN_PAGES = 40
+# Pages extracted per worker task; results are yielded in page order as each task completes
+PAGES_PER_TASK = 16
+# Worker processes for large PDFs (pdfminer layout analysis is CPU bound)
+DEFAULT_MAX_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0  # Worker count _pool was started with
+_pool_lock = threading.Lock()
+
+# Per worker process: the most recently opened PDF, reused by consecutive tasks on the same file
+_worker_pdf: Dict[str, Any] = {"path": None, "pdf": None}
+
+
+def _open_pdf(path: str):
+    import pdfplumber
+    if _worker_pdf["path"] != path:
+        if _worker_pdf["pdf"] is not None:
+            _worker_pdf["pdf"].close()
+        _worker_pdf["pdf"] = pdfplumber.open(path)
+        _worker_pdf["path"] = path
+    return _worker_pdf["pdf"]
+
+
+def _extract_page_text(page) -> str:
+    text = page.extract_text() or ""
+    # Release the parsed layout objects; large documents otherwise keep every page in memory
+    if hasattr(page, "close"):
+        page.close()
+    return text
+
+
+def _extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """Worker task: text of pages [start, end) of the PDF at path."""
+    pdf = _open_pdf(path)
+    return [_extract_page_text(pdf.pages[i]) for i in range(start, end)]
+
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Long-lived worker pool with max_workers processes, started with forkserver/spawn so the app's
+    threads are never forked. Asking for a different worker count replaces the pool; tasks already
+    submitted to the old one still finish.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != max_workers:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+            _pool_workers = max_workers
+        return _pool
+
+
+def _shutdown_pool() -> None:
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_shutdown_pool)
+
+
+def _iter_serial(pdf_path: str, page_count: int) -> Iterator[str]:
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        for i in range(page_count):
+            yield _extract_page_text(pdf.pages[i])
+
+
+def _iter_parallel(pdf_path: str, page_count: int, max_workers: int) -> Iterator[str]:
+    pool = _get_pool(max_workers)
+    futures: List[Future] = [
+        pool.submit(_extract_page_range, pdf_path, start, min(start + PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PAGES_PER_TASK)
+    ]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        # Consumer stopped early (max_pages/max_chars or an error): drop the tasks not yet started
+        for future in futures:
+            future.cancel()
+
+
+def iter_pdf_file_pages(pdf_path: str, max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                        max_workers: Optional[int] = None) -> Iterator[str]:
+    """
+    Yields the text of each page of the PDF at pdf_path in page order (empty string for pages without text).
+    Large PDFs are split into page ranges extracted by a process pool; pages are streamed as soon as
+    their range is done, so callers can start work before the whole document is parsed.
+    Stops after max_pages pages, or once max_chars characters have been yielded.
+    """
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+    if max_pages is not None:
+        page_count = min(page_count, max_pages)
+
+    workers = max_workers or DEFAULT_MAX_WORKERS
+    if page_count >= PARALLEL_MIN_PAGES and workers > 1:
+        pages = _iter_parallel(pdf_path, page_count, workers)
+    else:
+        pages = _iter_serial(pdf_path, page_count)
+
+    chars = 0
+    try:
+        for page_text in pages:
+            yield page_text
+            chars += len(page_text)
+            if max_chars is not None and chars >= max_chars:
+                break
+    finally:
+        pages.close()
+
+
+def iter_pdf_pages(pdf_bytes: bytes, max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                   max_workers: Optional[int] = None) -> Iterator[str]:
+    """Same as iter_pdf_file_pages for a PDF in memory."""
+    # Workers need a path to open; spool the bytes to a temp file for the duration of the stream
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(pdf_bytes)
+        pdf_path = tmp.name
+    try:
+        yield from iter_pdf_file_pages(pdf_path, max_pages, max_chars, max_workers)
+    finally:
+        os.unlink(pdf_path)
+
+
+def extract_pdf_text(pdf: Union[bytes, str], max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                     max_workers: Optional[int] = None) -> str:
+    """
+    Full text of a PDF (its bytes, or a path, which is read in place): non-empty pages joined by
+    newlines (see iter_pdf_file_pages for the limits).
+    """
+    pages = iter_pdf_file_pages if isinstance(pdf, str) else iter_pdf_pages
+    page_texts = [text for text in pages(pdf, max_pages, max_chars, max_workers) if text]
+    text = "\n".join(page_texts).strip()
+    if max_chars is not None:
+        text = text[:max_chars]
+    return text
@@ -0,0 +1,564 @@
+import math
+import os
+import re
+import time
+from dataclasses import dataclass, field, fields, replace
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import context_extraction, ai_summarization, ad_generation, transparency_report, excel_processing, channels, token_budget, telemetry, stage_graph, uploads
+from .openai_batch import BatchDeferred
+from .completion_cache import make_cache_key
+
+# Importable generation engine: extract -> summarize -> prompts -> generate -> DOCX/XLSX.
+# app.py runs it as a background job (jobs.py), batch_cli.py calls run_pipeline directly.
+# A run's RunState lets regenerate() redo one channel or funnel stage without the earlier stages.
+
+DEFAULT_MODEL = "gpt-4.1-mini"
+# Variation channels asked for more ads than this per stage get several parallel requests (shards)
+DEFAULT_SHARD_SIZE = 5
+# Each shard leans on a different angle so parallel shards do not write the same ads
+SHARD_ANGLES = ["business outcomes and ROI", "the customer's pain points", "product capabilities",
+                "credibility and social proof", "urgency and timing", "ease of getting started"]
+
+# Uploaded documents are extracted up to this many pages / characters (PDF), so a 500-page lead
+# magnet is not parsed and held in memory in full before its summary can start; 0 = no limit
+DEFAULT_SOURCE_MAX_PAGES = 150
+DEFAULT_SOURCE_MAX_CHARS = 400_000  # About 110k tokens, already a long map-reduce summary
+
+# Keys used for the three context sources throughout the engine
+SOURCE_KEYS = ["url", "additional_context", "lead_magnet"]
+
+
+@dataclass
+class SourceFile:
+    """
+    An input document, in memory (data) or on disk (path: a spooled upload or a manifest entry);
+    quacks like Streamlit's UploadedFile. Files on disk are read in place by the extractors.
+    """
+    name: str
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+    digest: str = ""  # Content digest (uploads.py), computed on first use
+
+    def getvalue(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def content_digest(self) -> str:
+        """Digest keying the extraction cache; hashed once per file."""
+        if not self.digest:
+            self.digest = uploads.digest_buffer(self.data) if self.data is not None else uploads.digest_file(self.path)
+        return self.digest
+
+    @classmethod
+    def from_path(cls, path: str) -> "SourceFile":
+        os.stat(path)  # Missing files fail here, not in the middle of a run
+        return cls(name=path, path=path)
+
+    @classmethod
+    def from_upload(cls, uploaded_file) -> "SourceFile":
+        """Spools a Streamlit upload to disk, so the job keeps a path instead of the bytes."""
+        path, digest = uploads.spool_upload(uploaded_file)
+        return cls(name=uploaded_file.name, path=path, digest=digest)
+
+
+@dataclass
+class FunnelInputs:
+    """Everything the user provides for one company. Files are UploadedFile or SourceFile objects."""
+    company_name: str
+    book_link: str
+    client_url: str = ""
+    additional_context_file: Any = None
+    lead_magnet_file: Any = None
+    lead_objective: str = "Demo Booking"
+    learn_more_link: str = ""
+    magnet_link: str = ""
+    content_count: int = 3
+
+
+@dataclass
+class PipelineSettings:
+    """How to talk to OpenAI for a run."""
+    api_key: str
+    model: str = DEFAULT_MODEL
+    base_url: Optional[str] = None
+    use_cache: bool = True
+    max_concurrency: int = ad_generation.DEFAULT_MAX_CONCURRENCY
+    stream: bool = False
+    shard_size: int = DEFAULT_SHARD_SIZE  # Max variations per request (0 = one request per stage)
+    source_max_pages: int = DEFAULT_SOURCE_MAX_PAGES  # Extraction cutoff for uploaded documents (0 = none)
+    source_max_chars: int = DEFAULT_SOURCE_MAX_CHARS
+
+
+@dataclass
+class Shard:
+    """One request of a channel: all or part (first..first+count-1) of a funnel stage's variations."""
+    call_index: int  # The channel message set (funnel stage) it belongs to
+    first: int  # Number of its first variation (1-based)
+    count: int
+    messages: List[Dict[str, str]]
+
+
+@dataclass
+class CallResult:
+    """One ad generation call: its funnel stage, the hash of its request, and what it returned."""
+    stage: str
+    input_hash: str  # completion_cache.make_cache_key of the model and messages
+    ads: List[Dict[str, Any]] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class RunState:
+    """
+    Everything regenerate() needs to redo part of a run without extracting or summarizing again:
+    the text inputs (files are not kept), extracted texts, summaries and every channel's calls.
+    """
+    inputs: Dict[str, Any]  # FunnelInputs fields except the files
+    model: str
+    extracts: Dict[str, str]
+    summaries: Dict[str, str]
+    calls: Dict[str, List[CallResult]] = field(default_factory=dict)  # Channel -> one CallResult per message set
+    source_errors: Dict[str, str] = field(default_factory=dict)  # Source key -> why it was left out of the prompts
+
+    def funnel_inputs(self) -> FunnelInputs:
+        return FunnelInputs(**self.inputs)
+
+    def all_ad_data(self) -> Dict[str, List[Dict[str, Any]]]:
+        return ad_generation.merge_call_ads({name: [call.ads for call in calls] for name, calls in self.calls.items()})
+
+    def errors(self) -> List[str]:
+        messages = list(self.source_errors.values())
+        messages += [message for calls in self.calls.values() for call in calls for message in call.errors]
+        return list(dict.fromkeys(messages))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"inputs": self.inputs, "model": self.model, "extracts": self.extracts, "summaries": self.summaries,
+                "calls": {name: [vars(call) for call in calls] for name, calls in self.calls.items()},
+                "source_errors": self.source_errors}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunState":
+        calls = {name: [CallResult(**call) for call in channel_calls] for name, channel_calls in data.get("calls", {}).items()}
+        return cls(inputs=data["inputs"], model=data["model"], extracts=data.get("extracts", {}),
+                   summaries=data.get("summaries", {}), calls=calls, source_errors=data.get("source_errors", {}))
+
+
+@dataclass
+class FunnelResult:
+    extracts: Dict[str, str]
+    summaries: Dict[str, str]
+    all_ad_data: Dict[str, List[Dict[str, Any]]]
+    errors: List[str] = field(default_factory=list)
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    docx_bytes: Optional[BytesIO] = None
+    xlsx_bytes: Optional[BytesIO] = None
+    state: Optional[RunState] = None
+
+
+_FILE_FIELDS = ("additional_context_file", "lead_magnet_file")
+
+
+def text_inputs(inputs: FunnelInputs) -> Dict[str, Any]:
+    """The FunnelInputs fields the prompts use (everything but the files), for RunState.inputs."""
+    return {f.name: getattr(inputs, f.name) for f in fields(inputs) if f.name not in _FILE_FIELDS}
+
+
+def input_hash(model: str, messages: List[Dict[str, str]]) -> str:
+    return make_cache_key(model, messages, ad_generation.AD_RESPONSE_FORMAT)
+
+
+def extract_source(inputs: FunnelInputs, key: str, max_pages: int = 0, max_chars: int = 0) -> str:
+    """
+    Raw text of one source in SOURCE_KEYS ("" when it was not provided). Uploaded documents stop
+    after max_pages pages / max_chars characters (0 = no limit). Raises context_extraction.ExtractionError.
+    """
+    if key == "url":
+        return context_extraction.extract_text_from_url(inputs.client_url) if inputs.client_url else ""
+    uploaded_file = inputs.additional_context_file if key == "additional_context" else inputs.lead_magnet_file
+    if not uploaded_file:
+        return ""
+    return context_extraction.extract_text_from_uploaded_file(uploaded_file, max_pages=max_pages or None,
+                                                              max_chars=max_chars or None)
+
+
+def extract_sources(inputs: FunnelInputs, settings: Optional[PipelineSettings] = None) -> Dict[str, str]:
+    """Raw text for each source in SOURCE_KEYS ("" when the source was not provided)."""
+    limits = (settings.source_max_pages, settings.source_max_chars) if settings else (0, 0)
+    return {key: extract_source(inputs, key, *limits) for key in SOURCE_KEYS}
+
+
+def summarize_source(raw_text: str, settings: PipelineSettings) -> str:
+    """Raises ai_summarization.SummarizationError, or ApiKeyError for a missing or rejected key."""
+    if not raw_text:
+        return ""
+    return ai_summarization.summarize_text(raw_text, settings.api_key, settings.model,
+                                           base_url=settings.base_url, use_cache=settings.use_cache)
+
+
+def summarize_sources(extracts: Dict[str, str], settings: PipelineSettings) -> Dict[str, str]:
+    return {key: summarize_source(extracts.get(key, ""), settings) for key in SOURCE_KEYS}
+
+
+def shard_counts(count: int, shard_size: int) -> List[int]:
+    """Splits count variations into the fewest shards of at most shard_size, as evenly as possible."""
+    if not shard_size or count <= shard_size:
+        return [count]
+    shards = math.ceil(count / shard_size)
+    return [count // shards + (1 if i < count % shards else 0) for i in range(shards)]
+
+
+def _shard_messages(messages: List[Dict[str, str]], number: int, total: int, first: int, count: int) -> List[Dict[str, str]]:
+    """The stage prompt with a note on which batch of variations this request writes."""
+    note = (f"\n\nThis request is batch {number} of {total} for this stage, written in parallel with the others. "
+            f"Number the Ad Names from Ver_{first} to Ver_{first + count - 1}, and lead with "
+            f"{SHARD_ANGLES[(number - 1) % len(SHARD_ANGLES)]} so these variations differ from the other batches.")
+    return messages[:-1] + [dict(messages[-1], content=messages[-1]["content"] + note)]
+
+
+def plan_generation(inputs: FunnelInputs, summaries: Dict[str, str], model: str = DEFAULT_MODEL, shard_size: int = 0
+                    ) -> Tuple[Dict[str, List[List[Dict[str, str]]]], Dict[str, List[Shard]], token_budget.RunEstimate]:
+    """
+    Message sets for every registered channel (keyed by channel name in report order, one per
+    funnel stage), each fitted to its prompt-token budget; the requests to send for them, where
+    variation channels asked for more than shard_size ads per stage are split into shards (all from
+    the same fitted context, so the shared prompt prefix is unchanged); and the token and cost
+    estimate for sending those requests. Nothing is sent.
+    """
+    context, trimmed_tokens = token_budget.fit_context(channels.CHANNELS, inputs, summaries)
+    channel_message_sets = {name: token_budget.build_channel(spec, inputs, context) for name, spec in channels.CHANNELS.items()}
+    estimate = token_budget.RunEstimate(model=model, trimmed_tokens=trimmed_tokens)
+    channel_shards: Dict[str, List[Shard]] = {}
+    for name, spec in channels.CHANNELS.items():
+        counts = shard_counts(inputs.content_count, shard_size) if spec.fixed_count is None else [spec.fixed_count]
+        shard_sets = {count: token_budget.build_channel(spec, replace(inputs, content_count=count), context)
+                      for count in set(counts)} if len(counts) > 1 else {}
+        channel_shards[name] = []
+        for i, messages in enumerate(channel_message_sets[name]):
+            if len(counts) == 1:
+                channel_shards[name].append(Shard(call_index=i, first=1, count=counts[0], messages=messages))
+                continue
+            first = 1
+            for number, count in enumerate(counts, 1):
+                channel_shards[name].append(Shard(call_index=i, first=first, count=count,
+                                                  messages=_shard_messages(shard_sets[count][i], number, len(counts), first, count)))
+                first += count
+        estimate.channels[name] = token_budget.estimate_channel(
+            spec, [shard.messages for shard in channel_shards[name]], inputs.content_count,
+            item_counts=[shard.count for shard in channel_shards[name]]
+        )
+    return channel_message_sets, channel_shards, estimate
+
+
+_VERSION_SUFFIX = re.compile(r"^(.*_Ver_)\d+$")
+
+
+def merge_shards(spec, shards: List[Shard], shard_ads: List[List[Dict[str, Any]]],
+                 shard_errors: List[List[str]], expected: int) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Joins the shards of one funnel stage: drops ads whose copy repeats an earlier shard's, then
+    renumbers the Ad Names (..._Ver_1 to _Ver_N across shards, other names made unique).
+    """
+    errors = [message for messages in shard_errors for message in messages]
+    if len(shards) == 1:
+        return shard_ads[0], errors
+    seen = set()
+    ads: List[Dict[str, Any]] = []
+    for ad in (ad for ads_of_shard in shard_ads for ad in ads_of_shard):
+        key = tuple(" ".join(str(ad.get(column) or "").lower().split()) for column in spec.columns if column != "Ad Name")
+        if key in seen:
+            continue
+        seen.add(key)
+        ads.append(dict(ad))
+    names = set()
+    for number, ad in enumerate(ads, 1):
+        if "Ad Name" not in ad:
+            continue
+        match = _VERSION_SUFFIX.match(str(ad["Ad Name"]))
+        name = f"{match.group(1)}{number}" if match else str(ad["Ad Name"])
+        ad["Ad Name"] = name if name not in names else f"{name}_{number}"
+        names.add(ad["Ad Name"])
+    duplicates = sum(len(a) for a in shard_ads) - len(ads)
+    if duplicates and len(ads) < expected:
+        errors.append(f"{spec.name} {spec.stage_label(shards[0].call_index)}: {duplicates} duplicate ads across shards removed, "
+                      f"{len(ads)} of {expected} remain.")
+    return ads, errors
+
+
+def generate_stages(settings: PipelineSettings, model: str, channel_shards: Dict[str, List[Shard]], use_cache: bool,
+                    progress_callback: Optional[Callable[[str, int, int], None]] = None,
+                    ad_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None
+                    ) -> Tuple[Dict[str, Dict[int, List[Dict[str, Any]]]], Dict[str, Dict[int, List[str]]], Dict[str, Any]]:
+    """
+    Sends every shard at once (ad_generation.generate_calls) and merges them back per funnel stage.
+    Returns (stage_ads, stage_errors, metrics), keyed by channel and then message set index;
+    metrics["duplicates_removed"] counts ads dropped as repeats of another shard's.
+    """
+    call_ads, call_errors, metrics = ad_generation.generate_calls(
+        settings.api_key, model, {name: [shard.messages for shard in shards] for name, shards in channel_shards.items()},
+        max_concurrency=settings.max_concurrency, progress_callback=progress_callback,
+        base_url=settings.base_url, use_cache=use_cache, stream=settings.stream, ad_callback=ad_callback,
+        expected_counts={name: [shard.count for shard in shards] for name, shards in channel_shards.items()}
+    )
+    stage_ads: Dict[str, Dict[int, List[Dict[str, Any]]]] = {}
+    stage_errors: Dict[str, Dict[int, List[str]]] = {}
+    metrics["duplicates_removed"] = 0
+    for name, shards in channel_shards.items():
+        spec = channels.get_channel(name)
+        for call_index in dict.fromkeys(shard.call_index for shard in shards):
+            positions = [p for p, shard in enumerate(shards) if shard.call_index == call_index]
+            ads, errors = merge_shards(
+                spec, [shards[p] for p in positions], [call_ads[name][p] or [] for p in positions],
+                [call_errors[name][p] for p in positions], sum(shards[p].count for p in positions)
+            )
+            stage_ads.setdefault(name, {})[call_index] = ads
+            metrics["duplicates_removed"] += sum(len(call_ads[name][p] or []) for p in positions) - len(ads)
+            stage_errors.setdefault(name, {})[call_index] = errors
+    return stage_ads, stage_errors, metrics
+
+
+def build_channel_message_sets(inputs: FunnelInputs, summaries: Dict[str, str]) -> Dict[str, List[List[Dict[str, str]]]]:
+    """Message sets for every registered channel, keyed by channel name in report order."""
+    return plan_generation(inputs, summaries)[0]
+
+
+def expected_counts(inputs: FunnelInputs) -> Dict[str, int]:
+    """Ads each API call of every registered channel should return."""
+    return {name: spec.expected_count(inputs.content_count) for name, spec in channels.CHANNELS.items()}
+
+
+def build_docx(inputs: FunnelInputs, extracts: Dict[str, str], summaries: Dict[str, str]) -> BytesIO:
+    with telemetry.span("report.docx"):
+        return transparency_report.create_report_docx(
+            inputs.company_name,
+            extracts.get("url", ""), summaries.get("url", ""),
+            extracts.get("additional_context", ""), summaries.get("additional_context", ""),
+            extracts.get("lead_magnet", ""), summaries.get("lead_magnet", "")
+        )
+
+
+SOURCE_LABELS = {"url": "website", "additional_context": "additional context file", "lead_magnet": "lead magnet"}
+
+
+def _provided_sources(inputs: FunnelInputs) -> List[str]:
+    provided = {"url": inputs.client_url, "additional_context": inputs.additional_context_file,
+                "lead_magnet": inputs.lead_magnet_file}
+    return [key for key in SOURCE_KEYS if provided[key]]
+
+
+def run_pipeline(inputs: FunnelInputs, settings: PipelineSettings,
+                 status_callback: Optional[Callable[[str], None]] = None,
+                 progress_callback: Optional[Callable[[str, int, int], None]] = None,
+                 ad_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> FunnelResult:
+    """
+    Runs the whole funnel for one company without any UI, as a graph of stages (stage_graph):
+    each provided source is extracted and summarized on its own, so one source's summary overlaps
+    another's extraction; ad generation starts once the summaries the channels use (their
+    context_keys) are ready; the DOCX is built alongside generation, off the critical path.
+    status_callback(message) is called as stages start, from worker threads; progress_callback
+    and ad_callback are passed through to ad_generation.generate_calls.
+    metrics["stages"] has each stage's start and duration with the critical path marked.
+    In batch mode (openai_batch) it raises BatchDeferred once every request it can already make
+    has been queued; run it again after the batch.
+    A source that cannot be extracted or summarized is left out and reported in FunnelResult.errors;
+    a missing or rejected API key raises ai_summarization.ApiKeyError before any ads are generated.
+    """
+    def status(message: str) -> None:
+        if status_callback:
+            status_callback(message)
+
+    if not settings.api_key:
+        raise ai_summarization.ApiKeyError("OpenAI API key not found. Please set it in secrets.toml.")
+
+    sources = _provided_sources(inputs)
+    # Summaries any channel puts in its prompts; generation waits for these only
+    needed = {key for spec in channels.CHANNELS.values() for key in spec.context_keys}
+    deferred: List[BatchDeferred] = []
+    source_errors: Dict[str, str] = {}
+
+    def extract(key: str) -> Callable[[Dict[str, Any]], str]:
+        def run(_: Dict[str, Any]) -> str:
+            status(f"Extracting {SOURCE_LABELS[key]}")
+            try:
+                return extract_source(inputs, key, settings.source_max_pages, settings.source_max_chars)
+            except context_extraction.ExtractionError as e:
+                source_errors[key] = f"Left out the {SOURCE_LABELS[key]}: {e}"
+                return ""
+        return run
+
+    def summarize(key: str) -> Callable[[Dict[str, Any]], str]:
+        def run(results: Dict[str, Any]) -> str:
+            status(f"Summarizing {SOURCE_LABELS[key]}")
+            try:
+                return summarize_source(results[f"extract.{key}"], settings)
+            except BatchDeferred as e:
+                deferred.append(e) # Let the other sources queue their requests too
+                return ""
+            except ai_summarization.SummarizationError as e:
+                source_errors[key] = f"Left out the {SOURCE_LABELS[key]} (summary failed): {e}"
+                return ""
+        return run
+
+    def check_deferred() -> None:
+        if deferred:
+            raise deferred[0]
+
+    def texts(results: Dict[str, Any], kind: str) -> Dict[str, str]:
+        return {key: results.get(f"{kind}.{key}", "") for key in SOURCE_KEYS}
+
+    def build_report(results: Dict[str, Any]) -> BytesIO:
+        check_deferred()
+        status("Building transparency report")
+        return build_docx(inputs, texts(results, "extract"), texts(results, "summarize"))
+
+    def plan(results: Dict[str, Any]):
+        check_deferred()
+        return plan_generation(inputs, texts(results, "summarize"), settings.model, settings.shard_size)
+
+    def generate(results: Dict[str, Any]):
+        _, channel_shards, estimate = results["plan"]
+        status(f"Generating ad content (estimated {estimate.input_tokens} input + {estimate.output_tokens} "
+               f"output tokens, ${estimate.cost_usd:.4f})")
+        return generate_stages(settings, settings.model, channel_shards, settings.use_cache,
+                               progress_callback=progress_callback, ad_callback=ad_callback)
+
+    def build_xlsx(results: Dict[str, Any]) -> BytesIO:
+        status("Building Excel report")
+        return excel_processing.create_excel_report(ad_generation.merge_call_ads(
+            {name: list(stage_ads.values()) for name, stage_ads in results["generate"][0].items()}
+        ))
+
+    stages = [stage_graph.Stage(f"extract.{key}", extract(key)) for key in sources]
+    stages += [stage_graph.Stage(f"summarize.{key}", summarize(key), (f"extract.{key}",)) for key in sources]
+    stages += [
+        stage_graph.Stage("docx", build_report, tuple(stage.name for stage in stages)),
+        stage_graph.Stage("plan", plan, tuple(f"summarize.{key}" for key in sources if key in needed)),
+        stage_graph.Stage("generate", generate, ("plan",)),
+        stage_graph.Stage("xlsx", build_xlsx, ("generate",)),
+    ]
+    results, stage_timings = stage_graph.run_stages(stages)
+
+    extracts, summaries = texts(results, "extract"), texts(results, "summarize")
+    channel_message_sets, _, estimate = results["plan"]
+    stage_ads, stage_errors, generation_metrics = results["generate"]
+    state = RunState(inputs=text_inputs(inputs), model=settings.model, extracts=extracts, summaries=summaries,
+                     source_errors={key: source_errors[key] for key in SOURCE_KEYS if key in source_errors})
+    for name, message_sets in channel_message_sets.items():
+        spec = channels.get_channel(name)
+        state.calls[name] = [
+            CallResult(stage=spec.stage_label(i), input_hash=input_hash(settings.model, messages),
+                       ads=stage_ads[name][i], errors=stage_errors[name][i])
+            for i, messages in enumerate(message_sets)
+        ]
+    _add_cost_metrics(generation_metrics, settings.model)
+    generation_metrics["estimate"] = estimate.as_dict()
+    timings = {
+        "generate_seconds": stage_timings["generate"].seconds,
+        "total_seconds": max(timing.end for timing in stage_timings.values()),
+        "stages": {name: {"start": round(timing.start, 3), "seconds": round(timing.seconds, 3), "critical": timing.critical}
+                   for name, timing in sorted(stage_timings.items(), key=lambda item: item[1].start)},
+        "critical_path": stage_graph.critical_path(stage_timings),
+    }
+
+    return FunnelResult(
+        extracts=extracts, summaries=summaries, all_ad_data=state.all_ad_data(), errors=state.errors(),
+        metrics=dict(generation_metrics, **timings), docx_bytes=results["docx"], xlsx_bytes=results["xlsx"], state=state
+    )
+
+
+def _add_cost_metrics(generation_metrics: Dict[str, Any], model: str) -> None:
+    usage = generation_metrics["usage"]
+    generation_metrics["cost_usd"] = token_budget.estimate_cost(model, usage["prompt_tokens"],
+                                                                usage["completion_tokens"], usage["cached_tokens"])
+    generation_metrics["prefix_cache"] = ad_generation.prefix_cache_summary(usage)
+
+
+def select_calls(state: RunState, channel_message_sets: Dict[str, List[List[Dict[str, str]]]],
+                 channel_name: Optional[str] = None, stage: Optional[str] = None) -> Dict[str, List[int]]:
+    """
+    Indexes of the message sets to regenerate, per channel: every call of channel_name (or only its
+    call for stage), or without a channel, every call whose input hash no longer matches its
+    current prompts (e.g. after a link or the content count changed).
+    """
+    if channel_name is None:
+        selected: Dict[str, List[int]] = {}
+        for name, message_sets in channel_message_sets.items():
+            recorded = state.calls.get(name, [])
+            stale = [i for i, messages in enumerate(message_sets)
+                     if i >= len(recorded) or recorded[i].input_hash != input_hash(state.model, messages)]
+            if stale:
+                selected[name] = stale
+        return selected
+
+    spec = channels.get_channel(channel_name)
+    if spec is None or channel_name not in channel_message_sets:
+        raise ValueError(f"Unknown channel: {channel_name}")
+    indexes = list(range(len(channel_message_sets[channel_name])))
+    if stage is not None:
+        indexes = [i for i in indexes if spec.stage_label(i) == stage]
+        if not indexes:
+            raise ValueError(f"{channel_name} has no '{stage}' stage")
+    return {channel_name: indexes}
+
+
+def regenerate(state: RunState, settings: PipelineSettings, channel_name: Optional[str] = None,
+               stage: Optional[str] = None, inputs: Optional[FunnelInputs] = None,
+               xlsx_file: Optional[Any] = None,
+               progress_callback: Optional[Callable[[str, int, int], None]] = None,
+               ad_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> FunnelResult:
+    """
+    Redoes part of a finished run from its RunState: one channel, one funnel stage of a channel, or
+    (without channel_name) only the calls whose prompts changed since the run, e.g. after passing
+    new inputs. Nothing is extracted or summarized again and the other calls' ads are kept.
+    Prompts are rebuilt for every channel so the shared prompt prefix stays identical to the run's.
+    An explicitly selected channel or stage bypasses the completion cache (the same prompts would
+    otherwise return the same ads). With xlsx_file (the run's report), only the affected sheets are
+    rewritten; otherwise a full report is built. The result carries the updated state; its errors
+    and metrics cover the regenerated calls only, and docx_bytes is None (summaries are unchanged).
+    """
+    started_at = time.perf_counter()
+    funnel_inputs = inputs or state.funnel_inputs()
+    channel_message_sets, channel_shards, _ = plan_generation(funnel_inputs, state.summaries, state.model,
+                                                              settings.shard_size)
+    selected = select_calls(state, channel_message_sets, channel_name, stage)
+    model = state.model
+    new_state = replace(state, inputs=text_inputs(funnel_inputs),
+                        calls={name: list(calls) for name, calls in state.calls.items()})
+
+    stage_ads: Dict[str, Dict[int, List[Dict[str, Any]]]] = {}
+    stage_errors: Dict[str, Dict[int, List[str]]] = {}
+    generation_metrics: Dict[str, Any] = {"usage": {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}}
+    if selected:
+        with telemetry.span("step.regenerate", calls=sum(len(indexes) for indexes in selected.values())):
+            stage_ads, stage_errors, generation_metrics = generate_stages(
+                settings, model,
+                {name: [shard for shard in channel_shards[name] if shard.call_index in indexes]
+                 for name, indexes in selected.items()},
+                settings.use_cache and channel_name is None,
+                progress_callback=progress_callback, ad_callback=ad_callback
+            )
+    for name, indexes in selected.items():
+        spec = channels.get_channel(name)
+        calls = new_state.calls.setdefault(name, [])
+        calls.extend(CallResult(stage=spec.stage_label(i), input_hash="") for i in range(len(calls), len(channel_message_sets[name])))
+        for i in indexes:
+            calls[i] = CallResult(stage=spec.stage_label(i), input_hash=input_hash(model, channel_message_sets[name][i]),
+                                  ads=stage_ads[name][i], errors=stage_errors[name][i])
+
+    all_ad_data = new_state.all_ad_data()
+    if xlsx_file is not None:
+        xlsx_bytes = excel_processing.replace_sheets(xlsx_file, {name: all_ad_data.get(name, []) for name in selected})
+    else:
+        xlsx_bytes = excel_processing.create_excel_report(all_ad_data)
+    _add_cost_metrics(generation_metrics, model)
+    errors = [message for channel_errors in stage_errors.values() for messages in channel_errors.values() for message in messages]
+    metrics = dict(generation_metrics, calls={name: [channels.get_channel(name).stage_label(i) for i in indexes]
+                                              for name, indexes in selected.items()},
+                   total_seconds=time.perf_counter() - started_at)
+    return FunnelResult(
+        extracts=state.extracts, summaries=state.summaries, all_ad_data=all_ad_data,
+        errors=list(dict.fromkeys(errors)), metrics=metrics, xlsx_bytes=xlsx_bytes, state=new_state
+    )
@@ -0,0 +1,225 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from .tokenizer import count_message_tokens
+from . import telemetry
+
+T = TypeVar("T")
+
+# Requests-per-minute / tokens-per-minute budgets per model; "default" applies to unlisted models.
+# Keep these a little under the organisation's real limits so bursts from several users queue here.
+DEFAULT_MODEL_LIMITS: Dict[str, Dict[str, int]] = {
+    "gpt-4.1-mini": {"rpm": 450, "tpm": 180_000},
+    "default": {"rpm": 450, "tpm": 180_000},
+}
+# Completion tokens assumed when a request sets no max_tokens (a 20-variation ad batch is ~3k tokens)
+DEFAULT_COMPLETION_TOKENS = 2000
+# Retry policy for 429s, timeouts, connection errors and 5xx responses
+DEFAULT_MAX_RETRIES = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+
+def retryable_errors() -> Tuple[type, ...]:
+    """OpenAI errors worth retrying (openai is imported here, on the first request, not at startup)."""
+    import openai
+    return (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+            openai.InternalServerError)
+
+
+class TokenBucket:
+    """
+    Continuous-refill token bucket. reserve() deducts immediately (the balance may go negative)
+    and returns how long the caller must wait, so concurrent callers are served in arrival order.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity) # A request larger than the bucket just waits for a full one
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_per_second
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Reads Retry-After (or retry-after-ms) from an OpenAI error response, if present."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class RequestScheduler:
+    """
+    Process-wide scheduler for OpenAI calls: per-model RPM and TPM buckets, plus retries with
+    jittered exponential backoff that honour Retry-After. Callers queue (sleep) instead of failing.
+    A 429 pauses the whole model, not just the request that hit it.
+    """
+
+    def __init__(self, model_limits: Optional[Dict[str, Dict[str, int]]] = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES, max_in_flight: Optional[int] = None):
+        self.model_limits = dict(model_limits or DEFAULT_MODEL_LIMITS)
+        self.max_retries = max_retries
+        # Optional process-wide cap on simultaneous requests (e.g. batch runs of many companies)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        self._buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        self._paused_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {"requests": 0, "retries": 0, "rate_limited": 0, "queued_seconds": 0.0}
+
+    def configure(self, model_limits: Dict[str, Dict[str, int]]) -> None:
+        """Merges per-model {"rpm": ..., "tpm": ...} limits; buckets are rebuilt on next use."""
+        with self._lock:
+            for model, limits in model_limits.items():
+                merged = dict(self.model_limits.get(model, {}), **dict(limits))
+                if merged != self.model_limits.get(model):
+                    self.model_limits[model] = merged
+                    self._buckets.pop(model, None)
+
+    def _buckets_for(self, model: str) -> Dict[str, TokenBucket]:
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            limits = dict(self.model_limits.get("default", {}), **self.model_limits.get(model, {}))
+            buckets = {
+                "rpm": TokenBucket(limits["rpm"], limits["rpm"] / 60.0),
+                "tpm": TokenBucket(limits["tpm"], limits["tpm"] / 60.0),
+            }
+            self._buckets[model] = buckets
+        return buckets
+
+    def acquire(self, model: str, estimated_tokens: int) -> float:
+        """Blocks until one request of estimated_tokens fits the model's budget. Returns the wait."""
+        with self._lock:
+            now = time.monotonic()
+            buckets = self._buckets_for(model)
+            wait = max(buckets["rpm"].reserve(1, now), buckets["tpm"].reserve(estimated_tokens, now),
+                       self._paused_until.get(model, 0.0) - now)
+            self.stats["requests"] += 1
+            self.stats["queued_seconds"] += max(0.0, wait)
+        if wait > 0:
+            span = telemetry.current_span()
+            if span is not None:
+                span.add("queued_seconds", wait)
+            time.sleep(wait)
+        return max(0.0, wait)
+
+    def set_max_in_flight(self, max_in_flight: Optional[int]) -> None:
+        """Caps simultaneous requests across all callers; None or 0 removes the cap."""
+        self._in_flight = threading.BoundedSemaphore(int(max_in_flight)) if max_in_flight else None
+
+    def pause(self, model: str, seconds: float) -> None:
+        """Holds every queued request for model for at least seconds (e.g. after a 429)."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._paused_until[model] = max(self._paused_until.get(model, 0.0), until)
+
+    @staticmethod
+    def backoff_seconds(attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+    def run(self, model: str, estimated_tokens: int, call: Callable[[], T],
+            can_retry: Optional[Callable[[], bool]] = None) -> T:
+        """
+        Runs call() once the budget allows, retrying rate limits and transient errors.
+        can_retry() is checked before each retry (e.g. to stop once a stream has emitted output).
+        The last error is re-raised when retries are exhausted or the error is not transient.
+        """
+        import openai
+
+        retryable = retryable_errors()
+        attempt = 0
+        while True:
+            self.acquire(model, estimated_tokens)
+            in_flight = self._in_flight
+            if in_flight is not None:
+                in_flight.acquire()
+            try:
+                return call()
+            except retryable as e:
+                if isinstance(e, openai.RateLimitError) and getattr(e, "code", None) == "insufficient_quota":
+                    raise # Out of credit: waiting will not help
+                if attempt >= self.max_retries or (can_retry is not None and not can_retry()):
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = self.backoff_seconds(attempt)
+                rate_limited = isinstance(e, openai.RateLimitError)
+                with self._lock:
+                    self.stats["retries"] += 1
+                    if rate_limited:
+                        self.stats["rate_limited"] += 1
+                span = telemetry.current_span()
+                if span is not None:
+                    span.add("retries")
+                    if rate_limited:
+                        span.add("rate_limited")
+                if rate_limited:
+                    self.pause(model, delay) # The next acquire() waits out the pause
+                    delay = 0.0
+            finally:
+                if in_flight is not None:
+                    in_flight.release()
+            if delay:
+                time.sleep(delay)
+            attempt += 1
+
+
+def estimate_request_tokens(messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> int:
+    """Pre-estimates the TPM cost of a request: prompt tokens plus the completion allowance."""
+    return count_message_tokens(messages) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+_scheduler: Optional[RequestScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Returns the process-wide scheduler shared by every OpenAI call site."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RequestScheduler()
+    return _scheduler
+
+
+def configure_rate_limits(model_limits: Optional[Dict[str, Any]] = None, max_retries: Optional[int] = None,
+                          max_in_flight: Optional[int] = None) -> None:
+    """Applies per-model limits (e.g. from secrets.toml), the retry cap and the in-flight cap to the shared scheduler."""
+    scheduler = get_scheduler()
+    if model_limits:
+        scheduler.configure({model: dict(limits) for model, limits in model_limits.items()})
+    if max_retries is not None:
+        scheduler.max_retries = int(max_retries)
+    if max_in_flight is not None:
+        scheduler.set_max_in_flight(max_in_flight)
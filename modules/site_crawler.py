@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+from urllib.parse import urljoin, urldefrag, urlsplit
+from urllib.robotparser import RobotFileParser
+
+from .html_extraction import extract_hrefs
+
+if TYPE_CHECKING:
+    import httpx # Imported on first crawl so app startup does not pay for it
+
+# Crawl defaults: the homepage plus the pages it links to, a handful of pages in total
+DEFAULT_CRAWL_SETTINGS: Dict[str, Any] = {
+    "max_depth": 1,          # Link hops from the start page (0 = start page only)
+    "max_pages": 8,          # Page budget for the whole crawl
+    "max_concurrency": 4,    # Simultaneous requests overall
+    "max_per_host": 2,       # Simultaneous requests to one host
+    "host_delay": 0.1,       # Minimum seconds between request starts to the same host
+    "timeout": 10.0,         # Seconds per request
+    "respect_robots": True,
+}
+DEFAULT_HTTP_CACHE_DIR = os.path.join(".cache", "http")
+USER_AGENT = "MFunnelGenerator/1.0 (+context extraction)"
+
+# Links to these are never pages worth reading
+SKIPPED_EXTENSIONS = (
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".css", ".js", ".json", ".xml",
+    ".zip", ".gz", ".mp3", ".mp4", ".mov", ".avi", ".woff", ".woff2", ".ttf", ".doc", ".docx", ".xls",
+    ".xlsx", ".ppt", ".pptx",
+)
+
+
+@dataclass
+class CrawledPage:
+    url: str
+    depth: int
+    status: int
+    html: bytes
+    from_cache: bool = False  # True when the server answered 304 Not Modified
+
+
+@dataclass
+class CrawlResult:
+    pages: List[CrawledPage] = field(default_factory=list)  # Homepage first, then crawl order
+    errors: Dict[str, str] = field(default_factory=dict)  # url -> error message
+    stats: Dict[str, float] = field(default_factory=dict)
+
+
+class HttpCache:
+    """
+    On-disk store of response bodies with their ETag / Last-Modified validators, one pair of
+    files per URL. Lets re-crawls send conditional requests and reuse the body on 304.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_HTTP_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, digest[:2], digest)
+        return base + ".json", base + ".body"
+
+    def get(self, url: str) -> Optional[Tuple[Dict[str, str], bytes]]:
+        """Returns (meta, body) for url, or None if it was never stored."""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """Conditional request headers for url (empty if nothing is cached)."""
+        cached = self.get(url)
+        if cached is None:
+            return {}
+        meta, _ = cached
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def set(self, url: str, response: "httpx.Response") -> None:
+        """Stores the body if the response carries a validator; otherwise there is nothing to revalidate."""
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if not etag and not last_modified:
+            return
+        meta_path, body_path = self._paths(url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        meta = {"url": url, "etag": etag, "last_modified": last_modified,
+                "content_type": response.headers.get("content-type", ""), "fetched_at": time.time()}
+        # Body first, then meta: a reader never sees validators without their body
+        for path, data in ((body_path, response.content), (meta_path, json.dumps(meta).encode("utf-8"))):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+
+def normalize_url(url: str) -> str:
+    """Drops the fragment and gives bare hosts a trailing slash so one page has one key."""
+    url, _ = urldefrag(url)
+    parts = urlsplit(url)
+    if not parts.path:
+        url = parts._replace(path="/").geturl()
+    return url
+
+
+def _host_key(url: str) -> str:
+    """Host used for same-site checks; www.example.com and example.com are the same site."""
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def extract_links(html: bytes, base_url: str) -> List[str]:
+    """Same-site http(s) links from a page, normalized, in document order, without duplicates."""
+    site = _host_key(base_url)
+    links, seen = [], set()
+    for href in extract_hrefs(html):
+        href = href.strip()
+        if not href or href.startswith(("mailto:", "tel:", "javascript:", "#")):
+            continue
+        url = normalize_url(urljoin(base_url, href))
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or _host_key(url) != site:
+            continue
+        if parts.path.lower().endswith(SKIPPED_EXTENSIONS) or url in seen:
+            continue
+        seen.add(url)
+        links.append(url)
+    return links
+
+
+class _HostThrottle:
+    """Per-host politeness: at most max_per_host requests in flight and min_delay between their starts."""
+
+    def __init__(self, max_per_host: int, min_delay: float):
+        self.max_per_host = max_per_host
+        self.min_delay = min_delay
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    def semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self._semaphores[host]
+
+    async def wait_turn(self, host: str) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, 0.0))
+            self._next_start[host] = start + self.min_delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class SiteCrawler:
+    """
+    Breadth-first crawl of one site: the start page, then same-site links up to max_depth hops,
+    stopping at max_pages pages. Requests run concurrently (bounded overall and per host), honour
+    robots.txt, and revalidate against the on-disk HttpCache so re-runs are mostly 304s.
+    """
+
+    def __init__(self, max_depth: int = 1, max_pages: int = 8, max_concurrency: int = 4, max_per_host: int = 2,
+                 host_delay: float = 0.1, timeout: float = 10.0, cache: Optional[HttpCache] = None,
+                 respect_robots: bool = True):
+        self.max_depth = max(0, max_depth)
+        self.max_pages = max(1, max_pages)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_per_host = max(1, max_per_host)
+        self.host_delay = host_delay
+        self.timeout = timeout
+        self.cache = cache if cache is not None else HttpCache()
+        self.respect_robots = respect_robots
+
+    async def _fetch(self, client: "httpx.AsyncClient", url: str, throttle: _HostThrottle,
+                     stats: Dict[str, float]) -> Tuple[int, bytes, str, bool, str]:
+        """
+        Returns (status, body, content_type, from_cache, final_url), revalidating against the
+        disk cache. final_url differs from url after redirects.
+        """
+        host = urlsplit(url).netloc
+        async with throttle.semaphore(host):
+            await throttle.wait_turn(host)
+            response = await client.get(url, headers=self.cache.validators(url))
+        stats["requests"] += 1
+        if response.status_code == 304:
+            cached = self.cache.get(url)
+            if cached is not None:
+                stats["not_modified"] += 1
+                meta, body = cached
+                return 200, body, meta.get("content_type", "text/html"), True, url
+            # Validators without a body (cache cleared mid-run): fetch unconditionally
+            async with throttle.semaphore(host):
+                await throttle.wait_turn(host)
+                response = await client.get(url)
+            stats["requests"] += 1
+        response.raise_for_status()
+        # Keyed by the requested URL: that is what the next crawl will ask for
+        self.cache.set(url, response)
+        return (response.status_code, response.content, response.headers.get("content-type", ""), False,
+                str(response.url))
+
+    async def _load_robots(self, client: "httpx.AsyncClient", start_url: str, throttle: _HostThrottle,
+                           stats: Dict[str, float]) -> Optional[RobotFileParser]:
+        import httpx
+
+        if not self.respect_robots:
+            return None
+        robots_url = urljoin(start_url, "/robots.txt")
+        try:
+            _, body, _, _, _ = await self._fetch(client, robots_url, throttle, stats)
+        except httpx.HTTPError:
+            return None  # Missing or unreachable robots.txt: everything is allowed
+        parser = RobotFileParser(robots_url)
+        parser.parse(body.decode("utf-8", errors="replace").splitlines())
+        return parser
+
+    async def crawl_async(self, start_url: str) -> CrawlResult:
+        import httpx
+
+        result = CrawlResult(stats={"requests": 0, "not_modified": 0, "seconds": 0.0})
+        started_at = time.perf_counter()
+        start_url = normalize_url(start_url)
+        throttle = _HostThrottle(self.max_per_host, self.host_delay)
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, follow_redirects=True,
+                                     headers={"User-Agent": USER_AGENT}) as client:
+            robots = await self._load_robots(client, start_url, throttle, result.stats)
+            seen = {start_url}
+            frontier = [start_url]
+            depth = 0
+            pages: Dict[str, CrawledPage] = {}
+            order: List[str] = []
+            while frontier and len(order) < self.max_pages:
+                # One BFS level at a time, trimmed to the remaining page budget
+                batch = frontier[:self.max_pages - len(order)]
+                if robots is not None:
+                    batch = [url for url in batch if url == start_url or robots.can_fetch(USER_AGENT, url)]
+                order.extend(batch)
+                outcomes = await asyncio.gather(*(self._fetch(client, url, throttle, result.stats) for url in batch),
+                                                return_exceptions=True)
+                next_frontier: List[str] = []
+                for url, outcome in zip(batch, outcomes):
+                    if isinstance(outcome, Exception):
+                        result.errors[url] = str(outcome) or type(outcome).__name__
+                        continue
+                    status, body, content_type, from_cache, final_url = outcome
+                    if "html" not in content_type.lower():
+                        continue
+                    pages[url] = CrawledPage(url=url, depth=depth, status=status, html=body, from_cache=from_cache)
+                    if depth < self.max_depth:
+                        for link in extract_links(body, final_url):
+                            if link not in seen:
+                                seen.add(link)
+                                next_frontier.append(link)
+                frontier = next_frontier
+                depth += 1
+            result.pages = [pages[url] for url in order if url in pages]
+        result.stats["seconds"] = time.perf_counter() - started_at
+        return result
+
+    def crawl(self, start_url: str) -> CrawlResult:
+        """Synchronous entry point; runs the crawl on its own event loop."""
+        return asyncio.run(self.crawl_async(start_url))
+
+
+_crawl_settings: Dict[str, Any] = dict(DEFAULT_CRAWL_SETTINGS)
+_http_cache_dir = DEFAULT_HTTP_CACHE_DIR
+
+
+def configure_crawler(cache_dir: Optional[str] = None, **settings) -> None:
+    """
+    Overrides crawl settings (see DEFAULT_CRAWL_SETTINGS) and the HTTP cache directory for later crawls.
+    Unknown keys are ignored; None values keep the current setting.
+    """
+    global _http_cache_dir
+    if cache_dir:
+        _http_cache_dir = cache_dir
+    for name, value in settings.items():
+        if name in _crawl_settings and value is not None:
+            _crawl_settings[name] = value
+
+
+def crawl_site(start_url: str, **overrides) -> CrawlResult:
+    """Crawls start_url with the configured settings; keyword overrides apply to this crawl only."""
+    settings = dict(_crawl_settings, **{k: v for k, v in overrides.items() if v is not None})
+    return SiteCrawler(cache=HttpCache(_http_cache_dir), **settings).crawl(start_url)
@@ -0,0 +1,103 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import telemetry
+
+# Dependency-graph executor for the pipeline's stages: each stage names the stages whose results it
+# needs and starts as soon as they have finished, so independent work (one source's extraction and
+# another's summary, the DOCX and ad generation) overlaps instead of running in a fixed sequence.
+
+DEFAULT_MAX_WORKERS = 6  # Stages running at once; OpenAI calls are still capped by the rate limiter
+
+
+@dataclass
+class Stage:
+    name: str
+    # func(results) -> result, where results maps each name in deps to that stage's result
+    func: Callable[[Dict[str, Any]], Any]
+    deps: Tuple[str, ...] = ()
+
+
+@dataclass
+class StageTiming:
+    start: float  # Seconds from the start of the graph
+    end: float
+    deps: Tuple[str, ...] = ()
+    critical: bool = False  # On the chain of stages that determined the total time
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+def critical_path(timings: Dict[str, StageTiming]) -> List[str]:
+    """
+    The chain that determined the total time: from the stage that finished last, repeatedly the
+    dependency that finished last (the one the stage was waiting for). First stage first.
+    """
+    if not timings:
+        return []
+    path = [max(timings, key=lambda name: timings[name].end)]
+    while timings[path[-1]].deps:
+        path.append(max(timings[path[-1]].deps, key=lambda name: timings[name].end))
+    return path[::-1]
+
+
+def run_stages(stages: List[Stage], max_workers: int = DEFAULT_MAX_WORKERS
+               ) -> Tuple[Dict[str, Any], Dict[str, StageTiming]]:
+    """
+    Runs every stage once its deps are done, on a thread pool, and returns (results, timings) with
+    the critical path marked. Each stage is a "stage.<name>" telemetry span under the caller's span.
+    The first exception is re-raised once the running stages have finished; stages not started yet
+    are skipped.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown stage(s): {', '.join(missing)}")
+
+    results: Dict[str, Any] = {}
+    timings: Dict[str, StageTiming] = {}
+    spans: Dict[str, Any] = {}
+    started_at = time.perf_counter()
+
+    def run(stage: Stage) -> Any:
+        start = time.perf_counter() - started_at
+        try:
+            with telemetry.span(f"stage.{stage.name}") as span:
+                spans[stage.name] = span
+                return stage.func({dep: results[dep] for dep in stage.deps})
+        finally:
+            timings[stage.name] = StageTiming(start=start, end=time.perf_counter() - started_at, deps=stage.deps)
+
+    pending = list(stages)
+    running = {}
+    error: Optional[BaseException] = None
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="stage") as executor:
+        while pending or running:
+            if error is None:
+                for stage in [s for s in pending if all(dep in results for dep in s.deps)]:
+                    pending.remove(stage)
+                    running[executor.submit(telemetry.wrap(run), stage)] = stage.name
+            if not running:
+                if pending and error is None:
+                    raise ValueError(f"Stage dependency cycle: {', '.join(s.name for s in pending)}")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except BaseException as e:
+                    error = error or e
+    if error is not None:
+        raise error
+
+    for name in critical_path(timings):
+        timings[name].critical = True
+        if spans.get(name) is not None:
+            spans[name].set(critical=True)
+    return results, timings
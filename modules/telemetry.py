@@ -0,0 +1,242 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Lightweight per-run tracing: span timers around extraction, summaries, OpenAI requests and reports.
+# Spans are recorded only while a RunTrace is active (start_run); otherwise span() is a cheap no-op.
+
+DEFAULT_METRICS_PATH = os.path.join(".cache", "metrics.jsonl")
+SERVICE_NAME = "m-funnel-generator"
+_append_lock = threading.Lock()  # Concurrent batch jobs share one metrics file
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start_time: float  # Unix seconds
+    duration: float = 0.0  # Seconds
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        """Adds or overwrites attributes (token counts, cache hits, sizes, ...)."""
+        self.attributes.update(attributes)
+
+    def add(self, name: str, amount: float = 1) -> None:
+        """Increments a numeric attribute, e.g. add("retries")."""
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+
+class RunTrace:
+    """All spans of one run. Thread-safe: worker threads record into the same trace."""
+
+    def __init__(self, name: str, **attributes):
+        self.trace_id = secrets.token_hex(16)
+        self.name = name
+        self.attributes = dict(attributes)
+        self.root = Span(name=name, span_id=secrets.token_hex(8), parent_id=None, start_time=time.time(),
+                         attributes=self.attributes)
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self) -> None:
+        self.root.duration = time.perf_counter() - self._started
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [vars(span).copy() for span in sorted(self.spans, key=lambda s: s.start_time)]
+        return {"trace_id": self.trace_id, "name": self.name, "started_at": self.root.start_time,
+                "duration": self.root.duration, "attributes": self.attributes, "spans": spans}
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per span name: count, total and max seconds, plus summed numeric attributes."""
+        totals: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            entry = totals.setdefault(span.name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            entry["count"] += 1
+            entry["total_seconds"] += span.duration
+            entry["max_seconds"] = max(entry["max_seconds"], span.duration)
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + value
+                elif isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + int(value)
+        return totals
+
+
+_current_trace: contextvars.ContextVar[Optional[RunTrace]] = contextvars.ContextVar("telemetry_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("telemetry_span", default=None)
+
+
+@contextlib.contextmanager
+def start_run(name: str = "funnel_run", **attributes) -> Iterator[RunTrace]:
+    """Activates a new RunTrace for the calling thread (and threads started through wrap())."""
+    trace = RunTrace(name, **attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Times the block as a child of the current span. Yields None when no run is being traced."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(name=name, span_id=secrets.token_hex(8), parent_id=parent.span_id if parent else None,
+                   start_time=time.time(), attributes=dict(attributes))
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        _current_span.reset(token)
+        trace.record(current)
+
+
+def current_span() -> Optional[Span]:
+    """The innermost active span (None outside a traced run)."""
+    if _current_trace.get() is None:
+        return None
+    return _current_span.get()
+
+
+def traced(name: str) -> Callable:
+    """Decorator form of span()."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wrap(func: Callable) -> Callable:
+    """Binds func to the caller's trace and span, for work handed to thread pools."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+# --- Metrics store (one JSON line per run) ---
+
+def append_run(trace: RunTrace, path: str = DEFAULT_METRICS_PATH) -> None:
+    """Appends the run to the JSONL metrics store."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    line = json.dumps(trace.as_dict(), default=str)
+    with _append_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def load_runs(path: str = DEFAULT_METRICS_PATH, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Runs from the metrics store, oldest first (the last `limit` runs if given)."""
+    if not os.path.exists(path):
+        return []
+    runs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue # Partially written line from an interrupted run
+    return runs[-limit:] if limit else runs
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    index = (len(sorted_values) - 1) * q
+    lower = int(index)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (index - lower)
+
+
+def span_percentiles(runs: List[Dict[str, Any]], quantiles=(0.5, 0.95)) -> Dict[str, Dict[str, float]]:
+    """
+    Cross-run latency percentiles per span name, plus "run" for whole runs.
+    Returns {name: {"count": n, "p50": seconds, "p95": seconds}}.
+    """
+    durations: Dict[str, List[float]] = {}
+    for run in runs:
+        durations.setdefault("run", []).append(run.get("duration", 0.0))
+        for recorded in run.get("spans", []):
+            durations.setdefault(recorded["name"], []).append(recorded.get("duration", 0.0))
+    result = {}
+    for name, values in durations.items():
+        values.sort()
+        result[name] = dict(count=len(values), **{f"p{int(q * 100)}": _percentile(values, q) for q in quantiles})
+    return result
+
+
+# --- OpenTelemetry export (OTLP/JSON trace format) ---
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def to_otlp_json(trace: RunTrace) -> Dict[str, Any]:
+    """The run as an OTLP/JSON ExportTraceServiceRequest (POST it to <collector>/v1/traces)."""
+    def otlp_span(recorded: Span) -> Dict[str, Any]:
+        start_ns = int(recorded.start_time * 1e9)
+        otlp = {
+            "traceId": trace.trace_id,
+            "spanId": recorded.span_id,
+            "name": recorded.name,
+            "kind": 1, # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(recorded.duration * 1e9)),
+            "attributes": _otlp_attributes(recorded.attributes),
+            "status": {"code": 2, "message": recorded.error} if recorded.error else {"code": 1},
+        }
+        if recorded.parent_id:
+            otlp["parentSpanId"] = recorded.parent_id
+        return otlp
+
+    with trace._lock:
+        spans = [trace.root] + list(trace.spans)
+    return {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+        "scopeSpans": [{"scope": {"name": "modules.telemetry"}, "spans": [otlp_span(s) for s in spans]}],
+    }]}
+
+
+def export_otlp(trace: RunTrace, endpoint: str, timeout: float = 5.0) -> None:
+    """Sends the run to an OTLP/HTTP collector (e.g. http://localhost:4318/v1/traces)."""
+    import httpx
+    response = httpx.post(endpoint, json=to_otlp_json(trace), timeout=timeout)
+    response.raise_for_status()
@@ -0,0 +1,219 @@
+import re
+import textwrap
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .tokenizer import count_tokens, count_message_tokens
+
+# Prices in USD per 1M tokens; unlisted models fall back to "default" (override with OPENAI_PRICING)
+DEFAULT_PRICING: Dict[str, Dict[str, float]] = {
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "default": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+}
+_pricing: Dict[str, Dict[str, float]] = {model: dict(prices) for model, prices in DEFAULT_PRICING.items()}
+_budget_overrides: Dict[str, int] = {}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def configure_token_budgets(pricing: Optional[Dict[str, Any]] = None,
+                            channel_budgets: Optional[Dict[str, Any]] = None) -> None:
+    """Merges per-model prices and per-channel prompt-token budgets (e.g. from secrets.toml)."""
+    for model, prices in (pricing or {}).items():
+        _pricing[model] = dict(_pricing.get(model, _pricing["default"]), **dict(prices))
+    for channel_name, budget in (channel_budgets or {}).items():
+        _budget_overrides[channel_name] = int(budget)
+
+
+def channel_budget(spec) -> Optional[int]:
+    """Prompt-token budget per message set for a channels.ChannelSpec (None = unlimited)."""
+    return _budget_overrides.get(spec.name, spec.prompt_token_budget)
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int, cached_input_tokens: int = 0) -> float:
+    """USD cost of a request volume at the configured prices for model."""
+    prices = _pricing.get(model, _pricing["default"])
+    uncached = max(0, input_tokens - cached_input_tokens)
+    return (uncached * prices["input"] + cached_input_tokens * prices.get("cached_input", prices["input"])
+            + output_tokens * prices["output"]) / 1_000_000
+
+
+def compact_text(text: str, seen: Optional[set] = None) -> str:
+    """
+    Collapses runs of spaces, drops blank lines and sentences already seen (summaries often
+    restate themselves). Pass the same seen set for several texts to dedupe across them.
+    """
+    seen = set() if seen is None else seen
+    lines = []
+    for line in text.splitlines():
+        sentences = []
+        for sentence in _SENTENCE_END.split(" ".join(line.split())):
+            key = sentence.lower()
+            if sentence and key not in seen:
+                seen.add(key)
+                sentences.append(sentence)
+        if sentences:
+            lines.append(" ".join(sentences))
+    return "\n".join(lines)
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of whole sentences within max_tokens (cut between words only if the first one is too long)."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept: List[str] = []
+    used = 0
+    for sentence in _SENTENCE_END.split(text):
+        cost = count_tokens(sentence) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+    if kept:
+        return " ".join(kept)
+    words = text.split()
+    low, high = 0, len(words)  # Binary search for the longest word prefix that fits
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+
+def allocate(sizes: Dict[str, int], budget: int) -> Dict[str, int]:
+    """
+    Splits budget across sources by water-filling: small sources keep everything, the larger
+    ones share what is left equally. Returns the token cap for each key.
+    """
+    caps = {key: 0 for key in sizes}
+    remaining = max(0, budget)
+    pending = sorted((size, key) for key, size in sizes.items() if size > 0)
+    while pending:
+        share = remaining // len(pending)
+        size, key = pending[0]
+        if size <= share:
+            caps[key] = size
+            remaining -= size
+            pending.pop(0)
+        else:
+            for _, key in pending:
+                caps[key] = share
+            break
+    return caps
+
+
+def compact_messages(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Removes the source-code indentation of the prompt templates and trailing whitespace on every line."""
+    compacted = []
+    for message in messages:
+        content = message.get("content") or ""
+        content = "\n".join(line.rstrip() for line in textwrap.dedent(content).strip().splitlines())
+        compacted.append(dict(message, content=content))
+    return compacted
+
+
+@dataclass
+class ChannelEstimate:
+    calls: int
+    input_tokens: int  # Prompt tokens over all message sets of the channel
+    output_tokens: int  # Estimated completion tokens
+    max_prompt_tokens: int  # Largest single message set
+    budget: Optional[int]
+
+
+@dataclass
+class RunEstimate:
+    model: str
+    channels: Dict[str, ChannelEstimate] = field(default_factory=dict)
+    trimmed_tokens: int = 0  # Context tokens removed to fit the budgets
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(c.input_tokens for c in self.channels.values())
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(c.output_tokens for c in self.channels.values())
+
+    @property
+    def cost_usd(self) -> float:
+        return estimate_cost(self.model, self.input_tokens, self.output_tokens)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model, "input_tokens": self.input_tokens, "output_tokens": self.output_tokens,
+            "trimmed_tokens": self.trimmed_tokens, "cost_usd": round(self.cost_usd, 6),
+            "channels": {name: vars(c) for name, c in self.channels.items()},
+        }
+
+
+def build_channel(spec, inputs, context: Dict[str, str]) -> List[List[Dict[str, str]]]:
+    """A channel's message sets for the given (compacted or trimmed) context, template indentation removed."""
+    return [compact_messages(messages) for messages in spec.build_messages(inputs, context)]
+
+
+def fit_context(specs: Dict[str, Any], inputs, summaries: Dict[str, str]) -> Tuple[Dict[str, str], int]:
+    """
+    The context every channel in specs (name -> channels.ChannelSpec) is built from, within their
+    prompt-token budgets. Summaries are compacted, then, if any channel's largest message set is
+    still over budget, the context summaries are trimmed at sentence boundaries (water-filled,
+    largest first) to fit the tightest channel. Every channel gets the same context, so the shared
+    prompt prefix stays identical across channels. Returns (context, trimmed_tokens).
+    """
+    seen: set = set()
+    compacted = {key: compact_text(value, seen) if value else "" for key, value in summaries.items()}
+
+    keys = [key for key in dict.fromkeys(k for spec in specs.values() for k in spec.context_keys) if compacted.get(key)]
+    allowance = None
+    for name, spec in specs.items():
+        budget = channel_budget(spec)
+        message_sets = build_channel(spec, inputs, compacted) if budget is not None else []
+        if not message_sets:
+            continue
+        if max(count_message_tokens(m) for m in message_sets) <= budget:
+            continue
+        # Tokens the channel's prompts take without any of its context
+        without_context = dict(compacted, **{key: "" for key in spec.context_keys})
+        overhead = max(count_message_tokens(m) for m in build_channel(spec, inputs, without_context))
+        channel_allowance = budget - overhead
+        allowance = channel_allowance if allowance is None else min(allowance, channel_allowance)
+    if allowance is None or not keys:
+        return compacted, 0
+
+    sizes = {key: count_tokens(compacted[key]) for key in keys}
+    caps = allocate(sizes, allowance)
+    trimmed = dict(compacted, **{key: trim_to_tokens(compacted[key], caps[key]) for key in keys})
+    return trimmed, sum(sizes[key] - count_tokens(trimmed[key]) for key in keys)
+
+
+def fit_channels(specs: Dict[str, Any], inputs, summaries: Dict[str, str]
+                 ) -> Tuple[Dict[str, List[List[Dict[str, str]]]], int]:
+    """
+    Builds the message sets of several channels (name -> channels.ChannelSpec) within their
+    prompt-token budgets, from the shared context of fit_context. Returns (message_sets, trimmed_tokens).
+    """
+    context, trimmed_tokens = fit_context(specs, inputs, summaries)
+    return {name: build_channel(spec, inputs, context) for name, spec in specs.items()}, trimmed_tokens
+
+
+def estimate_channel(spec, message_sets: List[List[Dict[str, str]]], content_count: int,
+                     item_counts: Optional[List[int]] = None) -> ChannelEstimate:
+    """Estimate for sending message_sets; item_counts gives each set's ad count when they differ (shards)."""
+    prompt_tokens = [count_message_tokens(m) for m in message_sets]
+    if item_counts is None:
+        item_counts = [spec.expected_count(content_count)] * len(message_sets)
+    return ChannelEstimate(
+        calls=len(message_sets),
+        input_tokens=sum(prompt_tokens),
+        output_tokens=sum(item_counts) * spec.output_tokens_per_item,
+        max_prompt_tokens=max(prompt_tokens, default=0),
+        budget=channel_budget(spec),
+    )
@@ -0,0 +1,37 @@
+from typing import Dict, List
+
+# Rough characters-per-token ratio used when no tokenizer is installed (tokens ≈ chars / 3.5)
+CHARS_PER_TOKEN = 3.5
+# Per-message overhead of the chat format (role markers and separators)
+TOKENS_PER_MESSAGE = 4
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """Loads the tiktoken encoding on first use; None when tiktoken is not installed."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception: # Optional dependency (or encoding download unavailable)
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken when available, otherwise estimates from the character count."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Prompt tokens of a chat message list, including the per-message formatting overhead."""
+    return sum(count_tokens(message.get("content") or "") + TOKENS_PER_MESSAGE for message in messages) + 3
@@ -1,5 +1,3 @@
-from docx import Document
-from docx.shared import Pt
 from io import BytesIO
 
 def create_report_docx(company_name: str, 
@@ -9,6 +7,8 @@ def create_report_docx(company_name: str,
     """
     Creates a DOCX transparency report and returns it as a BytesIO stream.
     """
+    from docx import Document # Imported on first use so app startup does not pay for python-docx
+
     doc = Document()
 
     # Title
@@ -0,0 +1,93 @@
+import hashlib
+import importlib.util
+import os
+import threading
+import time
+import uuid
+from typing import Any, Optional, Tuple
+
+# Uploaded documents are spooled to disk once, named by a digest of their content, so jobs carry a
+# path instead of the bytes and the extraction cache (context_extraction.py) can key on the digest
+# without hashing the file again. The digest is xxh3-128 when the optional 'xxhash' package is
+# installed (several GB/s), else BLAKE2b-128; the algorithm is part of the digest string.
+
+DEFAULT_SPOOL_DIR = os.path.join(".cache", "uploads")
+SPOOL_TTL_SECONDS = 24 * 3600  # Spooled files unused for this long are removed
+CHUNK_BYTES = 1024 * 1024
+
+_spool_dir = DEFAULT_SPOOL_DIR
+_evict_lock = threading.Lock()
+
+
+def _hasher() -> Tuple[str, Any]:
+    if importlib.util.find_spec("xxhash") is not None:
+        import xxhash
+        return "xxh3", xxhash.xxh3_128()
+    return "b2", hashlib.blake2b(digest_size=16)
+
+
+def digest_buffer(buffer) -> str:
+    """Digest of an in-memory buffer (bytes or memoryview), hashed in chunks without copying it."""
+    name, hasher = _hasher()
+    view = memoryview(buffer)
+    for start in range(0, len(view), CHUNK_BYTES):
+        hasher.update(view[start:start + CHUNK_BYTES])
+    return f"{name}-{hasher.hexdigest()}"
+
+
+def digest_file(path: str) -> str:
+    """Digest of a file on disk, read in chunks."""
+    name, hasher = _hasher()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            hasher.update(chunk)
+    return f"{name}-{hasher.hexdigest()}"
+
+
+def upload_buffer(uploaded_file):
+    """The upload's bytes without a copy where possible (Streamlit's UploadedFile is a BytesIO)."""
+    return uploaded_file.getbuffer() if hasattr(uploaded_file, "getbuffer") else uploaded_file.getvalue()
+
+
+def spool_upload(uploaded_file) -> Tuple[str, str]:
+    """
+    Writes an upload to the spool directory (once per distinct content) and returns (path, digest).
+    Re-uploading the same file finds the existing copy.
+    """
+    buffer = upload_buffer(uploaded_file)
+    digest = digest_buffer(buffer)
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    path = os.path.join(_spool_dir, digest + extension)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        os.makedirs(_spool_dir, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer)
+        os.replace(tmp_path, path)
+    evict_spool()
+    return path, digest
+
+
+def evict_spool(now: Optional[float] = None) -> None:
+    """Removes spooled files not used for SPOOL_TTL_SECONDS (their extracted text stays cached)."""
+    now = now or time.time()
+    if not os.path.isdir(_spool_dir) or not _evict_lock.acquire(blocking=False):
+        return
+    try:
+        for name in os.listdir(_spool_dir):
+            path = os.path.join(_spool_dir, name)
+            try:
+                if now - os.stat(path).st_mtime > SPOOL_TTL_SECONDS:
+                    os.remove(path)
+            except OSError:
+                continue
+    finally:
+        _evict_lock.release()
+
+
+def configure_spool(spool_dir: Optional[str] = None) -> None:
+    global _spool_dir
+    if spool_dir:
+        _spool_dir = spool_dir
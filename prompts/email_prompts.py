@@ -1,21 +1,21 @@
 from typing import List, Dict, Any
 
+from prompts.shared_context import get_shared_prefix_messages
+
 def get_email_prompts_messages(url_context_sum: str, additional_context_sum: str, 
-                               lead_objective: str, book_link: str, content_count: int) -> List[List[Dict[str, str]]]:
+                               lead_objective: str, book_link: str, content_count: int,
+                               lead_magnet_sum: str = "") -> List[List[Dict[str, str]]]:
     """
     Generates a list containing a single prompt message set for generating multiple email ad variations.
+    The shared system prompt and company context come first (see shared_context.py); the email
+    instructions are the last message.
     USER WILL MANUALLY EDIT THE PROMPT CONTENT.
     """
-    # This is a placeholder system prompt. User will edit.
-    base_system_prompt = "You are an expert marketing copywriter. Generate ad copy in JSON format. Ensure the JSON is valid and contains all requested fields. The output should be a single JSON object with a key 'ads' containing a list of ad variations."
-
     # This is a placeholder user prompt. User will edit.
     user_prompt_content = f"""
+    Channel: Email. Write as an expert email marketing copywriter.
     Task: Generate {content_count} unique email ad variations.
-
-    Company Context:
-    - URL Summary: {url_context_sum if url_context_sum else "Not provided."}
-    - Additional Info Summary: {additional_context_sum if additional_context_sum else "Not provided."}
+    Use the URL Summary and Additional Info Summary from the company context above.
 
     Campaign Details:
     - Funnel Stage: Demand Capture (This is fixed for emails as per spec)
@@ -49,8 +49,7 @@ def get_email_prompts_messages(url_context_sum: str, additional_context_sum: str
       ]
     }}
     """
-    messages = [
-        {"role": "system", "content": base_system_prompt},
+    messages = get_shared_prefix_messages(url_context_sum, additional_context_sum, lead_magnet_sum) + [
         {"role": "user", "content": user_prompt_content}
     ]
     return [messages] # Return a list containing this single 'messages' list
\ No newline at end of file
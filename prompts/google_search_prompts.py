@@ -1,21 +1,20 @@
 from typing import List, Dict, Any
 
-def get_google_search_prompts_messages(url_context_sum: str, additional_context_sum: str) -> List[List[Dict[str, str]]]:
+from prompts.shared_context import get_shared_prefix_messages
+
+def get_google_search_prompts_messages(url_context_sum: str, additional_context_sum: str,
+                                       lead_magnet_sum: str = "") -> List[List[Dict[str, str]]]:
     """
     Generates prompt messages for Google Search ads.
-    This returns a list containing ONE 'messages' list for a single API call.
+    This returns a list containing ONE 'messages' list for a single API call: the shared system
+    prompt and company context (see shared_context.py), then the Google Search instructions.
     USER WILL MANUALLY EDIT THE PROMPT CONTENT.
     """
-    # This is a placeholder system prompt. User will edit.
-    base_system_prompt = "You are an expert marketing copywriter specializing in Google Search ads. Generate ad components in JSON format. Ensure the JSON is valid and contains all requested fields as specified."
-
     # This is a placeholder user prompt. User will edit.
     user_prompt_content = f"""
-    Task: Generate Google Search ad components.
-
-    Company Context:
-    - URL Summary: {url_context_sum if url_context_sum else "Not provided."}
-    - Additional Info Summary: {additional_context_sum if additional_context_sum else "Not provided."}
+    Channel: Google Search. Write as an expert copywriter specializing in Google Search ads.
+    Task: Generate Google Search ad components in JSON format, with all requested fields as specified.
+    Use the URL Summary and Additional Info Summary from the company context above.
 
     Requirements:
     - Generate 15 unique Headlines. Each headline MUST be approximately 30 characters or less.
@@ -45,8 +44,7 @@ def get_google_search_prompts_messages(url_context_sum: str, additional_context_
       ]
     }}
     """
-    messages = [
-        {"role": "system", "content": base_system_prompt},
+    messages = get_shared_prefix_messages(url_context_sum, additional_context_sum, lead_magnet_sum) + [
         {"role": "user", "content": user_prompt_content}
     ]
     return [messages] # Return a list containing this single 'messages' list
\ No newline at end of file
@@ -1,17 +1,18 @@
 from typing import List, Dict, Any
 
+from prompts.shared_context import get_shared_prefix_messages
+
 def get_linkedin_prompts_messages(url_context_sum: str, additional_context_sum: str, lead_magnet_sum: str,
                                   learn_more_link: str, magnet_link: str, book_link: str, 
                                   lead_objective: str, content_count: int) -> List[List[Dict[str, str]]]:
     """
     Generates a list of prompt messages for LinkedIn ad copy, one message set per funnel stage.
-    Each message set requests 'content_count' variations for that stage.
+    Each message set requests 'content_count' variations for that stage. Every set starts with the
+    shared system prompt and company context (see shared_context.py); the stage instructions,
+    including which summary to focus on, are the last message.
     USER WILL MANUALLY EDIT THE PROMPT CONTENT.
     """
     all_prompts_messages: List[List[Dict[str, str]]] = []
-    
-    # This is a placeholder system prompt. User will edit.
-    base_system_prompt = "You are an expert marketing copywriter specializing in LinkedIn ads. Generate ad copy in JSON format. Ensure the JSON is valid and contains all requested fields. The output should be a single JSON object with a key 'ads' containing a list of ad variations for the specified funnel stage."
 
    # Determine CTA for Demand Capture based on lead_objective
     demand_capture_cta = "Register" if "Demo" in lead_objective else "Request"
@@ -20,31 +21,29 @@ def get_linkedin_prompts_messages(url_context_sum: str, additional_context_sum:
         "Brand Awareness": {
             "cta_button": "Learn More",
             "destination": learn_more_link,
-            "primary_context": f"URL Summary: {url_context_sum if url_context_sum else 'N/A'}\nAdditional Context: {additional_context_sum if additional_context_sum else 'N/A'}",
-            "secondary_context": ""
+            "context_focus": "Focus on the URL Summary and Additional Info Summary."
         },
         "Demand Gen": {
             "cta_button": "Download",
             "destination": magnet_link,
-            "primary_context": f"Lead Magnet Summary: {lead_magnet_sum if lead_magnet_sum else 'N/A'}",
-            "secondary_context": f"URL Summary: {url_context_sum if url_context_sum else 'N/A'}\nAdditional Context: {additional_context_sum if additional_context_sum else 'N/A'}"
+            "context_focus": "Focus on the Lead Magnet Summary; use the URL Summary and Additional Info Summary as supporting context."
         },
         "Demand Capture": {
             "cta_button": demand_capture_cta,
             "destination": book_link,
-            "primary_context": f"Lead Objective: {lead_objective}",
-            "secondary_context": f"URL Summary: {url_context_sum if url_context_sum else 'N/A'}\nAdditional Context: {additional_context_sum if additional_context_sum else 'N/A'}"
+            "context_focus": f"Focus on the lead objective ({lead_objective}); use the URL Summary and Additional Info Summary as supporting context."
         }
     }
 
+    # Identical for every stage (and every channel), so it stays a cacheable prompt prefix
+    shared_prefix = get_shared_prefix_messages(url_context_sum, additional_context_sum, lead_magnet_sum)
+
     for stage_name, config in funnel_stages_config.items():
         # This is a placeholder user prompt. User will edit.
         user_prompt_content = f"""
+        Channel: LinkedIn. Write as an expert marketing copywriter specializing in LinkedIn ads.
         Task: Generate {content_count} unique LinkedIn ad variations for the '{stage_name}' funnel stage.
-
-        Company Context:
-        - Primary Context for this ad stage: {config['primary_context']}
-        - Supporting Context: {config['secondary_context']}
+        Context: {config['context_focus']}
 
         Campaign Details:
         - Funnel Stage: {stage_name}
@@ -80,8 +79,7 @@ def get_linkedin_prompts_messages(url_context_sum: str, additional_context_sum:
           ]
         }}
         """
-        messages = [
-            {"role": "system", "content": base_system_prompt},
+        messages = shared_prefix + [
             {"role": "user", "content": user_prompt_content}
         ]
         all_prompts_messages.append(messages)
@@ -0,0 +1,25 @@
+from typing import List, Dict
+
+# Every ad generation call of a run starts with these two messages, byte for byte, so the
+# provider's automatic prompt-prefix cache (prefixes of 1024+ tokens) can reuse them across
+# funnel stages and channels. Channel- and stage-specific instructions go in the LAST message only.
+
+# This is a placeholder system prompt. User will edit.
+SHARED_SYSTEM_PROMPT = "You are an expert marketing copywriter creating B2B ad campaigns for email, LinkedIn, Facebook and Google. Generate ad copy in JSON format. Ensure the JSON is valid and contains all requested fields. The output should be a single JSON object with a key 'ads' containing the list of ad variations or ad components requested in the final message."
+
+
+def get_shared_prefix_messages(url_context_sum: str, additional_context_sum: str, lead_magnet_sum: str) -> List[Dict[str, str]]:
+    """
+    System prompt plus the company context block shared by every channel and funnel stage.
+    USER WILL MANUALLY EDIT THE PROMPT CONTENT (keep anything channel- or stage-specific out of it).
+    """
+    context_content = f"""
+    Company Context (shared by every ad request for this company):
+    - URL Summary: {url_context_sum if url_context_sum else "Not provided."}
+    - Additional Info Summary: {additional_context_sum if additional_context_sum else "Not provided."}
+    - Lead Magnet Summary: {lead_magnet_sum if lead_magnet_sum else "Not provided."}
+    """
+    return [
+        {"role": "system", "content": SHARED_SYSTEM_PROMPT},
+        {"role": "user", "content": context_content}
+    ]
@@ -0,0 +1,70 @@
+from openpyxl import load_workbook
+
+from modules import ad_validation, channels, excel_processing
+
+EMAIL = channels.get_channel("Email")
+
+
+def email_ad(**fields):
+    ad = {column: f"{column} text" for column in EMAIL.columns}
+    ad.update(fields)
+    return ad
+
+
+def test_list_valued_field_reaches_excel_as_text():
+    check = ad_validation.validate_ads(EMAIL, [email_ad(Headline=["a", "b"])], 1)
+    assert check.problems == {0: ["Headline must be text"]}
+
+    final_ads = check.final_ads()
+    assert final_ads[0]["Headline"] == "a\nb"
+
+    workbook = load_workbook(excel_processing.create_excel_report({"Email": final_ads}))
+    rows = list(workbook["Email"].iter_rows(values_only=True))
+    assert rows[1][rows[0].index("Headline")] == "a\nb"
+
+
+def test_excel_report_flattens_unvalidated_values():
+    ads = [email_ad(Headline={"text": "Hi"}, Body=["one", "two"])]
+    workbook = load_workbook(excel_processing.create_excel_report({"Email": ads}))
+    rows = list(workbook["Email"].iter_rows(values_only=True))
+    assert rows[1][rows[0].index("Headline")] == '{"text": "Hi"}'
+
+
+GOOGLE_SEARCH = channels.get_channel("Google Search")
+
+
+def test_missing_extra_and_non_object_items():
+    check = ad_validation.validate_ads(EMAIL, [email_ad(), "text", email_ad(), email_ad()], 5)
+    assert check.problems == {1: ["not a JSON object"], 4: ["missing from the response"]}
+    assert check.ads[1] is None and check.ads[4] is None
+    assert len(check.final_ads()) == 3
+    assert check.error_messages("Email", 2) == ["Email (API Call 2) item 2: not a JSON object.",
+                                                "Email (API Call 2) item 5: missing from the response."]
+
+
+def test_field_rows_and_limits():
+    ads = [{"Headline": f"Headline {i}", "Description": "A description" if i < 4 else ""} for i in range(15)]
+    ads[2]["Description"] = ""
+    ads[7]["Headline"] = "x" * 31
+    check = ad_validation.validate_ads(GOOGLE_SEARCH, ads, 15)
+    assert check.problems == {2: ["Description is missing"], 7: ["Headline has 31 characters (limit 30)"]}
+    assert ad_validation.required_fields(GOOGLE_SEARCH, 2) == ["Headline", "Description"]
+    assert ad_validation.required_fields(GOOGLE_SEARCH, 7) == ["Headline"]
+
+
+def test_apply_replacements_fills_failing_slots_in_order():
+    check = ad_validation.validate_ads(EMAIL, [email_ad(Body=""), email_ad(), email_ad(CTA="")], 4)
+    assert sorted(check.problems) == [0, 2, 3]
+    fixed = ad_validation.apply_replacements(EMAIL, check, [email_ad(Body="Fixed"), "junk", email_ad(Headline="")])
+    assert fixed == 1
+    assert check.ads[0]["Body"] == "Fixed"
+    assert check.problems == {2: ["CTA is missing"], 3: ["Headline is missing"]}
+    assert check.ads[3]["Headline"] == "" # An empty slot takes a partial replacement
+
+
+def test_apply_replacements_keeps_a_better_previous_answer():
+    check = ad_validation.validate_ads(EMAIL, [email_ad(CTA="")], 1)
+    worse = email_ad(CTA="", Body="", Headline="")
+    assert ad_validation.apply_replacements(EMAIL, check, [worse]) == 0
+    assert check.ads[0]["Headline"] == "Headline text"
+    assert check.problems == {0: ["CTA is missing"]}
@@ -0,0 +1,27 @@
+import pytest
+
+from modules import html_extraction
+
+BACKENDS = html_extraction.available_backends()
+
+ARTICLE = "<h1>Acme Analytics</h1><p>Forecast demand across every warehouse in real time.</p>"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("html", [
+    f'<html><body class="page has-cookie-banner">{ARTICLE}</body></html>',
+    f'<html><body><div class="wrapper gdpr-compliant">{ARTICLE}</div></body></html>',
+    f'<html><body><div class="cookie-banner">{ARTICLE}<p>and more text</p></div></body></html>',
+])
+def test_wrapper_with_consent_class_keeps_page_text(backend, html):
+    text = html_extraction.html_to_text(html.encode(), backend=backend, remove_boilerplate=True)
+    assert "Forecast demand across every warehouse" in text
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_consent_banner_is_removed(backend):
+    html = (f'<html><body>{ARTICLE}<div id="onetrust-banner-sdk">We use cookies. Accept all</div>'
+            '<div class="cc-window cookie-notice">Manage consent</div></body></html>')
+    text = html_extraction.html_to_text(html.encode(), backend=backend, remove_boilerplate=True)
+    assert "Forecast demand across every warehouse" in text
+    assert "We use cookies" not in text and "Manage consent" not in text
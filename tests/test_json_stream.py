@@ -0,0 +1,44 @@
+import json
+import random
+
+import pytest
+
+from modules.json_stream import AdsStreamParser
+
+ADS = [
+    {"Ad Name": "Acme_Ver_1", "Headline": 'Say "hi" \\ {braces} [brackets]', "Nested": {"list": [1, {"x": "}"}]}},
+    None,
+    "not an ad",
+    {"Ad Name": "Acme_Ver_2", "Headline": "Ünïcode ✓", "Empty": {}},
+    [],
+    {"Ad Name": "Acme_Ver_3", "Headline": "Escaped \n newline and \t tab"},
+]
+DOCUMENT = json.dumps({"note": "ads", "ads": ADS, "tail": ["ads", {"ads": [{"not": "these"}]}]}, ensure_ascii=False)
+EXPECTED = [(index, ad) for index, ad in enumerate(json.loads(DOCUMENT)["ads"]) if isinstance(ad, dict)]
+
+
+def feed_all(parser, parts):
+    return [item for part in parts for item in parser.feed(part)]
+
+
+def test_whole_document_matches_json_loads():
+    assert feed_all(AdsStreamParser(), [DOCUMENT]) == EXPECTED
+
+
+def test_one_character_at_a_time():
+    assert feed_all(AdsStreamParser(), list(DOCUMENT)) == EXPECTED
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_random_chunks_match_json_loads(seed):
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(DOCUMENT)), rng.randint(1, 40)))
+    parts = [DOCUMENT[start:end] for start, end in zip([0] + cuts, cuts + [len(DOCUMENT)])]
+    parser = AdsStreamParser()
+    assert feed_all(parser, parts) == EXPECTED
+    assert parser.text == DOCUMENT
+
+
+def test_index_counts_elements_that_are_not_objects():
+    indexes = [index for index, _ in feed_all(AdsStreamParser(), ['{"ads": [null, "x", 3, {"a": 1}, ', '{"a": 2}]}'])]
+    assert indexes == [3, 4]
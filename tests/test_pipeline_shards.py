@@ -0,0 +1,51 @@
+from modules import channels, pipeline
+
+LINKEDIN = channels.get_channel("LinkedIn")
+
+
+def ad(name, text):
+    return {"Ad Name": name, "Funnel Stage": "Brand Awareness", "Introductory Text": text, "Image Copy": "Image",
+            "Headline": "Headline", "Destination": "", "CTA Button": "Learn More"}
+
+
+def shards(*counts):
+    result, first = [], 1
+    for count in counts:
+        result.append(pipeline.Shard(call_index=0, first=first, count=count, messages=[]))
+        first += count
+    return result
+
+
+def test_shard_counts_split_evenly():
+    assert pipeline.shard_counts(4, 5) == [4]
+    assert pipeline.shard_counts(12, 5) == [4, 4, 4]
+    assert pipeline.shard_counts(11, 5) == [4, 4, 3]
+    assert pipeline.shard_counts(20, 0) == [20]
+
+
+def test_single_shard_is_returned_unchanged():
+    ads = [ad("Acme_LI_Ver_7", "One")]
+    assert pipeline.merge_shards(LINKEDIN, shards(1), [ads], [["an error"]], 1) == (ads, ["an error"])
+
+
+def test_shards_are_renumbered_across_the_stage():
+    merged, errors = pipeline.merge_shards(
+        LINKEDIN, shards(2, 2), [[ad("Acme_LI_Ver_1", "A"), ad("Acme_LI_Ver_2", "B")],
+                                 [ad("Acme_LI_Ver_1", "C"), ad("Acme_LI_Ver_2", "D")]], [[], []], 4)
+    assert [a["Ad Name"] for a in merged] == ["Acme_LI_Ver_1", "Acme_LI_Ver_2", "Acme_LI_Ver_3", "Acme_LI_Ver_4"]
+    assert [a["Introductory Text"] for a in merged] == ["A", "B", "C", "D"]
+    assert errors == []
+
+
+def test_duplicates_across_shards_are_dropped_and_reported():
+    merged, errors = pipeline.merge_shards(
+        LINKEDIN, shards(2, 2), [[ad("Acme_LI_Ver_1", "Same copy"), ad("Acme_LI_Ver_2", "B")],
+                                 [ad("Acme_LI_Ver_3", "  same   COPY "), ad("Acme_LI_Ver_4", "D")]], [[], ["shard error"]], 4)
+    assert [a["Introductory Text"] for a in merged] == ["Same copy", "B", "D"]
+    assert [a["Ad Name"] for a in merged] == ["Acme_LI_Ver_1", "Acme_LI_Ver_2", "Acme_LI_Ver_3"]
+    assert errors == ["shard error", "LinkedIn Brand Awareness: 1 duplicate ads across shards removed, 3 of 4 remain."]
+
+
+def test_names_without_a_version_suffix_are_made_unique():
+    merged, _ = pipeline.merge_shards(LINKEDIN, shards(1, 1), [[ad("Custom", "A")], [ad("Custom", "B")]], [[], []], 2)
+    assert [a["Ad Name"] for a in merged] == ["Custom", "Custom_2"]